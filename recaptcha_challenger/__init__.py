@@ -1,12 +1,45 @@
-from .core import AudioChallenger, VisualChallenger, ChallengeStyle
-from .settings import config
+import importlib
+import typing
 
-__all__ = ["AudioChallenger", "VisualChallenger", "ChallengeStyle", "new_audio_solver"]
+if typing.TYPE_CHECKING:
+    from .core import AudioChallenger, VisualChallenger, ChallengeStyle
+    from .settings import config
+    from .solver import VisualSolver
+
+__all__ = [
+    "AudioChallenger",
+    "VisualChallenger",
+    "VisualSolver",
+    "ChallengeStyle",
+    "new_audio_solver",
+]
 
 __version__ = "0.0.1"
 
+# Public attributes resolved on first access, so that importing the package
+# does not pay for playwright and the audio/visual stacks
+_lazy_attrs = {
+    "AudioChallenger": ".core",
+    "VisualChallenger": ".core",
+    "ChallengeStyle": ".core",
+    "config": ".settings",
+    "VisualSolver": ".solver",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attrs:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_attrs[name], __name__), name)
+    globals()[name] = value
+    return value
+
 
-def new_audio_solver() -> AudioChallenger:
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attrs))
+
+
+def new_audio_solver() -> "AudioChallenger":
     """
     ```python
     import typing
@@ -39,4 +72,8 @@ def new_audio_solver() -> AudioChallenger:
     ```
     :return:
     """
+    from .core import AudioChallenger
+    from .settings import config
+
+    config.make_dirs()
     return AudioChallenger(dir_challenge_cache=config.DIR_CHALLENGE_CACHE, debug=False)
@@ -11,6 +11,7 @@ from playwright.sync_api import BrowserContext, sync_playwright
 
 from recaptcha_challenger import AudioChallenger, VisualChallenger
 from recaptcha_challenger.core import new_challenger
+from recaptcha_challenger.metrics import MetricsAggregator
 from recaptcha_challenger.settings import config
 
 
@@ -26,7 +27,7 @@ def _motion(
     # Start man-machine challenge
     start = time.time()
     is_success = challenger.anti_recaptcha(page)
-    challenger.log(f"total: {round(time.time() - start, 2)}s - " f"{style=} {is_success=}")
+    challenger.log("Solve finished", total_s=round(time.time() - start, 2), is_success=is_success)
     logger.success(f"{challenger.response=}")
 
 
@@ -38,8 +39,13 @@ def solution(style: str, silence: typing.Optional[bool] = False):
     :param silence:
     :return:
     """
+    metrics = MetricsAggregator()
+    janitor = config.start_janitor(max_mb=256, max_age=24 * 3600, hooks=[metrics])
     challenger = new_challenger(
-        style=style, dir_challenge_cache=config.DIR_CHALLENGE_CACHE, dir_model=config.DIR_MODEL
+        style=style,
+        dir_challenge_cache=config.DIR_CHALLENGE_CACHE,
+        dir_model=config.DIR_MODEL,
+        hooks=[metrics],
     )
 
     with sync_playwright() as p:
@@ -48,8 +54,12 @@ def solution(style: str, silence: typing.Optional[bool] = False):
         _motion(ctx=ctx, challenger=challenger, style=style)
         browser.close()
 
+    janitor.stop()
+    logger.debug(f"{metrics.summary()=}")
+
 
 if __name__ == "__main__":
     from recaptcha_challenger import ChallengeStyle
 
+    config.init()
     solution(style=ChallengeStyle.AUDIO, silence=False)
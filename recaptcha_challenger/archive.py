@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Description: Background, sampled and capped screenshot archive
+import os
+import queue
+import random
+import threading
+import time
+import typing
+from contextlib import suppress
+
+from loguru import logger
+
+from .utils import on_exit
+
+# Directories next to the `<style>` caches of the challengers
+DIR_SCREENSHOT = "captcha_screenshot"
+DIR_PROFILE = "captcha_profile"
+
+
+def evict(
+    directory: str,
+    max_bytes: typing.Optional[int] = None,
+    max_age: typing.Optional[float] = None,
+    suffixes: typing.Optional[typing.Tuple[str, ...]] = None,
+    exclude: typing.Optional[typing.Iterable[str]] = None,
+    prune: bool = False,
+) -> typing.Dict[str, int]:
+    """
+    Remove the files older than `max_age`, then the oldest files until the rest fits `max_bytes`
+
+    :param directory: scanned recursively
+    :param max_bytes: size cap of the directory, None means no cap
+    :param max_age: seconds since the last modification, None means no limit
+    :param suffixes: only consider these file types, e.g. (".png",)
+    :param exclude: names of the subdirectories that are skipped, at any depth
+    :param prune: also remove the subdirectories that the eviction emptied, e.g. `<ts>_/`
+    :return: files and bytes that were removed and that are left
+    """
+    exclude = set(exclude or [])
+    files = []
+    for prefix, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [name for name in dirnames if name not in exclude]
+        for filename in filenames:
+            if suffixes and not filename.endswith(suffixes):
+                continue
+            path = os.path.join(prefix, filename)
+            with suppress(OSError):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+    removed = removed_bytes = 0
+    emptied = set()
+    for mtime, size, path in files:
+        expired = max_age is not None and now - mtime > max_age
+        oversize = max_bytes is not None and total > max_bytes
+        # Sorted oldest first, none of the newer files has to go either
+        if not expired and not oversize:
+            break
+        with suppress(OSError):
+            os.remove(path)
+            removed += 1
+            removed_bytes += size
+            total -= size
+            emptied.add(os.path.dirname(path))
+    if prune:
+        _prune(directory, emptied)
+    return {
+        "removed": removed,
+        "removed_bytes": removed_bytes,
+        "files": len(files) - removed,
+        "bytes": total,
+    }
+
+
+def _prune(directory: str, candidates: typing.Iterable[str]):
+    """Remove the empty ones of `candidates` and of their parents, `directory` itself is kept"""
+    root = os.path.abspath(directory)
+    # Deepest first, a parent is only empty once its children are gone
+    for path in sorted({os.path.abspath(c) for c in candidates}, key=len, reverse=True):
+        while path.startswith(root + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
+
+
+class ScreenshotArchive:
+    """
+    Challenge screenshots are captured on the solving thread (Playwright is not thread-safe),
+    then written by a background thread. Rounds are sampled before anything is captured,
+    and the directory is kept under a size/age cap by evicting the oldest files first.
+    """
+
+    # Keep every sampled round, or only the rounds that failed
+    POLICY_ALL = "all"
+    POLICY_FAILURES = "failures"
+
+    def __init__(
+        self,
+        dir_archive: str,
+        sample_rate: typing.Optional[float] = 1.0,
+        policy: typing.Optional[str] = POLICY_ALL,
+        max_bytes: typing.Optional[int] = None,
+        max_age: typing.Optional[float] = None,
+        max_pending: int = 256,
+    ):
+        """
+        :param dir_archive:
+        :param sample_rate: fraction of the rounds to archive, in [0, 1]
+        :param policy: "all" or "failures", failures are decided when the round ends
+        :param max_bytes: size cap of the archive
+        :param max_age: seconds a screenshot is kept
+        :param max_pending: queued writes, further captures are dropped rather than waited for
+        """
+        if policy not in (self.POLICY_ALL, self.POLICY_FAILURES):
+            raise ValueError(f"policy should be {self.POLICY_ALL} or {self.POLICY_FAILURES}")
+        self.dir_archive = dir_archive
+        self.sample_rate = sample_rate
+        self.policy = policy
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.sampled = False
+        self._staged: typing.List[typing.Tuple[str, bytes]] = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread: typing.Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Bytes in the archive, known after the first scan of the writer
+        self._bytes: typing.Optional[int] = None
+        self._last_eviction = 0.0
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def begin(self) -> bool:
+        """Draw whether the next round is archived, call it before capturing anything"""
+        self._staged.clear()
+        self.sampled = self.enabled and (
+            self.sample_rate >= 1 or random.random() < self.sample_rate
+        )
+        return self.sampled
+
+    def stage(self, filename: str, data: bytes) -> typing.Optional[str]:
+        """
+        Archive a capture of the current round
+
+        :return: the path the screenshot will be written to, None if the round is not archived
+        """
+        if not self.sampled:
+            return None
+        if self.policy == self.POLICY_FAILURES:
+            self._staged.append((filename, data))
+            return os.path.join(self.dir_archive, filename)
+        return self.submit(filename, data)
+
+    def end(self, failed: bool):
+        """Write the captures staged by the `failures` policy if the round failed"""
+        staged, self._staged = self._staged, []
+        if failed:
+            for filename, data in staged:
+                self.submit(filename, data)
+        self.sampled = False
+
+    def submit(self, filename: str, data: bytes) -> typing.Optional[str]:
+        """Queue a write regardless of sampling, never blocks the caller"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((filename, data))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return os.path.join(self.dir_archive, filename)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None:
+                # Write out what is still queued when the interpreter exits
+                on_exit(self.close)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._drain, name="screenshot-archive", daemon=True
+                )
+                self._thread.start()
+
+    def _drain(self):
+        while (item := self._queue.get()) is not None:
+            filename, data = item
+            path = os.path.join(self.dir_archive, filename)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as file:
+                    file.write(data)
+            except OSError as err:
+                logger.warning(f"Failed to archive screenshot - {path=} {err=}")
+            else:
+                self.written += 1
+                if self._bytes is not None:
+                    self._bytes += len(data)
+                self._enforce_cap()
+            finally:
+                self._queue.task_done()
+        self._queue.task_done()
+
+    def _enforce_cap(self):
+        if self.max_bytes is None and self.max_age is None:
+            return
+        # Age is checked at most once a minute, size whenever the running total exceeds the cap
+        over_size = self._bytes is None or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        )
+        over_age = self.max_age is not None and time.time() - self._last_eviction > 60
+        if over_size or over_age:
+            self._last_eviction = time.time()
+            report = evict(self.dir_archive, self.max_bytes, self.max_age, prune=True)
+            self._bytes = report["bytes"]
+
+    def flush(self):
+        """Block until the queued screenshots are on disk"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Offline benchmark of the ModelHub solutions over a labeled tile corpus.
+
+Layout of the corpus, the same `yes`/`bad` convention as the rainbow table:
+
+    <corpus>/<label>/yes/*.png    tiles that contain the label
+    <corpus>/<label>/bad/*.png    tiles that do not
+
+Underscores in the label directory are read as spaces, e.g. `fire_hydrant`.
+A tile store (see `dataset.TileStore`) can be given as the corpus as well,
+its verified tiles are used.
+
+    python -m recaptcha_challenger.benchmark --corpus datas/corpus --output bench.json
+    python -m recaptcha_challenger.benchmark --corpus datas/corpus --solver
+    python -m recaptcha_challenger.benchmark --corpus datas/corpus --preprocess
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import typing
+from dataclasses import dataclass
+from os.path import join
+
+from loguru import logger
+
+DEFAULT_MODELS = ["yolov5n6", "yolov5s6", "yolov5m6", "yolov6n", "yolov6s", "yolov6t"]
+DEFAULT_BATCH_SIZES = [1, 9, 16]
+
+POSITIVE = "yes"
+NEGATIVE = "bad"
+
+
+@dataclass
+class Sample:
+    path: str
+    label: str
+    positive: bool
+    # Encoded tile, or the decoded tile of a tile store
+    img_stream: typing.Any = b""
+
+
+def stratify(
+    strata: typing.Dict[typing.Any, typing.List[typing.Any]], limit: typing.Optional[int] = None
+) -> typing.Dict[typing.Any, typing.List[typing.Any]]:
+    """
+    Take the first items of every stratum in turn until `limit` items are taken,
+    so a small sample still covers every (label, verdict)
+    """
+    if not limit or sum(len(items) for items in strata.values()) <= limit:
+        return strata
+    taken = {key: 0 for key in strata}
+    total = 0
+    while total < limit:
+        for key, items in strata.items():
+            if taken[key] < len(items) and total < limit:
+                taken[key] += 1
+                total += 1
+    return {key: items[: taken[key]] for key, items in strata.items()}
+
+
+def load_corpus(src_dir: str, limit: typing.Optional[int] = None) -> typing.List[Sample]:
+    """
+    Read the labeled tiles into memory so that file IO stays out of the measurements
+
+    :param limit: read this many tiles at most, sampled evenly across the labels and verdicts
+    """
+    samples = []
+    if not os.path.isdir(src_dir):
+        return samples
+    from .dataset import TileStore
+
+    # (label, positive) --> keys of the tiles, only the sampled ones are read
+    strata: typing.Dict[typing.Tuple[str, bool], typing.List[str]] = {}
+    if TileStore.is_store(src_dir):
+        store = TileStore(src_dir, readonly=True)
+        for shard in store.shards():
+            for index, record in enumerate(store.records(shard)):
+                if record["verified"] and record["label"] and record["positive"] is not None:
+                    key = (record["label"], record["positive"])
+                    strata.setdefault(key, []).append(f"{shard}#{index}")
+        for (label, positive), keys in stratify(strata, limit).items():
+            samples.extend(Sample(key, label, positive, store.read(key)) for key in keys)
+        return samples
+
+    for label_dir in sorted(os.listdir(src_dir)):
+        label = label_dir.replace("_", " ")
+        for verdict in [POSITIVE, NEGATIVE]:
+            dir_verdict = join(src_dir, label_dir, verdict)
+            if not os.path.isdir(dir_verdict):
+                continue
+            strata[(label, verdict == POSITIVE)] = [
+                join(dir_verdict, filename)
+                for filename in sorted(os.listdir(dir_verdict))
+                if filename.endswith(".png")
+            ]
+    for (label, positive), paths in stratify(strata, limit).items():
+        for path_img in paths:
+            with open(path_img, "rb") as file:
+                samples.append(Sample(path_img, label, positive, file.read()))
+    return samples
+
+
+def percentile(values: typing.List[float], q: float) -> typing.Optional[float]:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_mb() -> typing.Optional[float]:
+    """Peak resident set size of the current process, None on Windows (no `resource` module)"""
+    if sys.platform == "win32":
+        return None
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def score(samples: typing.List[Sample], results: typing.List[bool]) -> typing.Dict[str, dict]:
+    """Precision and recall per label"""
+    table = {}
+    for sample, result in zip(samples, results):
+        stat = table.setdefault(sample.label, {"tp": 0, "fp": 0, "fn": 0, "tn": 0})
+        key = ("t" if result == sample.positive else "f") + ("p" if result else "n")
+        stat[key] += 1
+    for stat in table.values():
+        predicted, actual = stat["tp"] + stat["fp"], stat["tp"] + stat["fn"]
+        stat["precision"] = round(stat["tp"] / predicted, 4) if predicted else None
+        stat["recall"] = round(stat["tp"] / actual, 4) if actual else None
+    return table
+
+
+def benchmark_model(
+    dir_model: str,
+    onnx_prefix: str,
+    samples: typing.List[Sample],
+    batch_sizes: typing.Optional[typing.List[int]] = None,
+    **kwargs,
+) -> dict:
+    """
+    :param dir_model:
+    :param onnx_prefix:
+    :param samples: the corpus, see `load_corpus`
+    :param batch_sizes: batch sizes of the throughput runs
+    :param kwargs: options of the YOLO model
+    :return: report of the model
+    """
+    from .solutions import yolo
+
+    batch_sizes = batch_sizes or DEFAULT_BATCH_SIZES
+    report = {"model": onnx_prefix, "tiles": len(samples)}
+
+    # Cold start: read the network and run the first forward pass
+    start = time.perf_counter()
+    model = yolo.YOLO(dir_model, onnx_prefix, **kwargs)
+    if samples:
+        model.solution(samples[0].img_stream, samples[0].label)
+    report["cold_load_s"] = round(time.perf_counter() - start, 4)
+    report["flag"] = model.flag
+    report["input_size"] = list(model.profile.input_size)
+    report["letterbox"] = model.profile.letterbox
+
+    # Warm latency of a single tile
+    latencies, results = [], []
+    for sample in samples:
+        start = time.perf_counter()
+        results.append(model.solution(sample.img_stream, sample.label))
+        latencies.append((time.perf_counter() - start) * 1000)
+    for q in [50, 95, 99]:
+        value = percentile(latencies, q)
+        report[f"p{q}_ms"] = None if value is None else round(value, 3)
+
+    # Throughput by batch size, a batch never spans two labels as a challenge grid shares one
+    by_label: typing.Dict[str, typing.List[Sample]] = {}
+    for sample in samples:
+        by_label.setdefault(sample.label, []).append(sample)
+    report["tiles_per_s"] = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for label, group in by_label.items():
+            for i in range(0, len(group), batch_size):
+                model.solutions([s.img_stream for s in group[i : i + batch_size]], label)
+        elapsed = time.perf_counter() - start
+        report["tiles_per_s"][str(batch_size)] = round(len(samples) / elapsed, 2) if elapsed else 0
+
+    report["labels"] = score(samples, results)
+    peak_rss = peak_rss_mb()
+    report["peak_rss_mb"] = None if peak_rss is None else round(peak_rss, 1)
+    return report
+
+
+def benchmark_solver(
+    dir_model: str,
+    samples: typing.List[Sample],
+    challenge_size: int = 9,
+    **kwargs,
+) -> dict:
+    """
+    Browser-independent solver over challenges cut from the corpus, one label per challenge.
+
+    :param dir_model:
+    :param samples: the corpus, see `load_corpus`
+    :param challenge_size: tiles per challenge
+    :param kwargs: options of `VisualSolver`
+    :return: challenges per second solved one by one and as one batch, and the tile scores
+    """
+    from .solver import Challenge, VisualSolver
+
+    solver = VisualSolver(dir_model, **kwargs)
+    by_label: typing.Dict[str, typing.List[Sample]] = {}
+    for sample in samples:
+        by_label.setdefault(sample.label, []).append(sample)
+    grids = [
+        group[i : i + challenge_size]
+        for group in by_label.values()
+        for i in range(0, len(group), challenge_size)
+    ]
+    challenges = [Challenge(grid[0].label, [s.img_stream for s in grid]) for grid in grids]
+    report = {"challenges": len(challenges), "tiles": len(samples)}
+    if not challenges:
+        return report
+
+    # Load and pull every routed model before anything is timed
+    solver.solve_batch(list({c.prompt: c for c in challenges}.values()))
+
+    start = time.perf_counter()
+    for challenge in challenges:
+        solver.solve_batch([challenge])
+    report["serial_per_s"] = round(len(challenges) / (time.perf_counter() - start), 2)
+
+    start = time.perf_counter()
+    verdicts = solver.solve_batch(challenges)
+    report["batch_per_s"] = round(len(challenges) / (time.perf_counter() - start), 2)
+
+    ordered, results = [], []
+    for grid, verdict in zip(grids, verdicts):
+        ordered.extend(grid)
+        results.extend(i in verdict.selected for i in range(len(grid)))
+    report["unresolved"] = sum(not verdict.resolved for verdict in verdicts)
+    if solver.prefilter is not None:
+        report["prefilter"] = solver.prefilter.report()
+    report["labels"] = score(ordered, results)
+    return report
+
+
+def benchmark_preprocess(
+    samples: typing.List[Sample],
+    input_size: int = 128,
+    letterbox: bool = False,
+    repeats: int = 3,
+) -> dict:
+    """
+    Per-tile decode + blob cost of `blobFromImage` against the buffered `BlobEngine`.
+
+    Allocations are traced with tracemalloc after one warm-up pass, `alloc_kb` is the
+    peak of the memory allocated while one tile is prepared, the decoded image included.
+
+    :param samples: the corpus, see `load_corpus`
+    :param input_size: side of the model input
+    :param letterbox:
+    :param repeats: timed passes over the tiles
+    :return: report of both paths
+    """
+    import tracemalloc
+
+    import cv2
+    import numpy as np
+
+    from .solutions.preprocess import BlobEngine, PreprocessProfile
+
+    profile = PreprocessProfile(input_size=(input_size, input_size), letterbox=letterbox)
+    engine = BlobEngine(profile)
+
+    def legacy(img_stream):
+        img = img_stream
+        if not isinstance(img_stream, np.ndarray):
+            img = cv2.imdecode(np.frombuffer(img_stream, np.uint8), flags=1)
+        return profile.blob(img)
+
+    def buffered(img_stream):
+        return engine.blob(engine.decode(img_stream))
+
+    streams = [sample.img_stream for sample in samples]
+    report = {"tiles": len(streams), "input_size": input_size, "letterbox": letterbox}
+    for name, prepare in (("blobFromImage", legacy), ("BlobEngine", buffered)):
+        for img_stream in streams:
+            prepare(img_stream)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for img_stream in streams:
+                prepare(img_stream)
+        elapsed = time.perf_counter() - start
+
+        peaks = []
+        tracemalloc.start()
+        for img_stream in streams:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            prepare(img_stream)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+        report[name] = {
+            "us_per_tile": round(elapsed / max(len(streams) * repeats, 1) * 1e6, 2),
+            "alloc_kb": round(sum(peaks) / max(len(peaks), 1) / 1024, 2),
+        }
+    return report
+
+
+def _isolated(args) -> dict:
+    return benchmark_model(*args[:-1], **args[-1])
+
+
+def run(
+    dir_model: str,
+    src_dir: str,
+    models: typing.Optional[typing.List[str]] = None,
+    batch_sizes: typing.Optional[typing.List[int]] = None,
+    limit: typing.Optional[int] = None,
+    isolate: bool = True,
+    resolutions: typing.Optional[typing.List[int]] = None,
+    **kwargs,
+) -> typing.List[dict]:
+    """
+    Benchmark each model over the corpus.
+
+    :param isolate: run each model in a fresh process, so that the cold start and the
+        peak RSS of a model are not shared with the models measured before it
+    :param resolutions: benchmark each model at each of these input sizes,
+        to compare accuracy against latency; by default the size of the model's profile
+    """
+    samples = load_corpus(src_dir, limit=limit)
+    if not samples:
+        logger.warning(f"No labeled tiles found in {src_dir}")
+        return []
+    logger.debug(f"Loaded corpus - tiles={len(samples)} src_dir={src_dir}")
+
+    reports = []
+    for onnx_prefix in models or DEFAULT_MODELS:
+        for resolution in resolutions or [None]:
+            logger.debug(f"Benchmarking {onnx_prefix} - input_size={resolution}")
+            options = dict(kwargs) if resolution is None else {**kwargs, "input_size": resolution}
+            args = (dir_model, onnx_prefix, samples, batch_sizes, options)
+            if isolate:
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    reports.append(pool.apply(_isolated, (args,)))
+            else:
+                reports.append(_isolated(args))
+    return reports
+
+
+def render_table(reports: typing.List[dict]) -> str:
+    if not reports:
+        return ""
+    batch_sizes = list(reports[0]["tiles_per_s"])
+    header = ["model", "input", "cold(s)", "p50(ms)", "p95(ms)", "p99(ms)"]
+    header += [f"bs{b}(t/s)" for b in batch_sizes] + ["rss(MB)", "precision", "recall"]
+    rows = [header]
+    for report in reports:
+        labels = report["labels"].values()
+        precision = [i["precision"] for i in labels if i["precision"] is not None]
+        recall = [i["recall"] for i in labels if i["recall"] is not None]
+        rows.append(
+            [
+                report["model"],
+                "x".join(str(i) for i in report["input_size"]),
+                report["cold_load_s"],
+                report["p50_ms"],
+                report["p95_ms"],
+                report["p99_ms"],
+                *[report["tiles_per_s"][b] for b in batch_sizes],
+                report["peak_rss_mb"],
+                round(sum(precision) / len(precision), 4) if precision else "-",
+                round(sum(recall) / len(recall), 4) if recall else "-",
+            ]
+        )
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+    return "\n".join(
+        " | ".join(str(cell).ljust(width) for cell, width in zip(row, widths)) for row in rows
+    )
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--corpus", required=True, help="directory of the labeled tile corpus")
+    parser.add_argument("--dir-model", default=join("datas", "models"))
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--limit", type=int, default=None, help="use the first N tiles only")
+    parser.add_argument("--resolutions", nargs="+", type=int, default=None)
+    parser.add_argument("--letterbox", action="store_true", default=None)
+    parser.add_argument("--no-isolate", action="store_true", help="run every model in-process")
+    parser.add_argument("--output", default=None, help="write the reports as JSON")
+    parser.add_argument(
+        "--solver", action="store_true", help="benchmark the VisualSolver core instead"
+    )
+    parser.add_argument(
+        "--preprocess", action="store_true", help="benchmark the decode and blob path instead"
+    )
+    parser.add_argument(
+        "--prefilter", action="store_true", help="--solver: with the default `TilePrefilter`"
+    )
+    args = parser.parse_args(argv)
+
+    if args.preprocess:
+        samples = load_corpus(args.corpus, limit=args.limit)
+        reports = [
+            benchmark_preprocess(samples, input_size=size, letterbox=bool(args.letterbox))
+            for size in args.resolutions or [128]
+        ]
+        print(json.dumps(reports, indent=2))
+        return reports
+
+    if args.solver:
+        samples = load_corpus(args.corpus, limit=args.limit)
+        report = benchmark_solver(
+            args.dir_model, samples, onnx_prefix=args.models[0], prefilter=args.prefilter
+        )
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if args.output:
+            with open(args.output, "w", encoding="utf8") as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+        return report
+
+    reports = run(
+        dir_model=args.dir_model,
+        src_dir=args.corpus,
+        models=args.models,
+        batch_sizes=args.batch_sizes,
+        limit=args.limit,
+        isolate=not args.no_isolate,
+        resolutions=args.resolutions,
+        letterbox=args.letterbox,
+    )
+    print(render_table(reports))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(reports, file, indent=2, ensure_ascii=False)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Description:
+import math
+import time
+import typing
+
+from .exceptions import ChallengeTimeoutException
+
+
+class Budget:
+    """
+    End-to-end deadline of a solve.
+
+    Every step of the challenge asks the budget for its timeout instead of using
+    a fixed one, so a solve never outlives the deadline no matter how many
+    rounds, reloads or retries it goes through.
+
+    ```python
+    budget = Budget(timeout=30)
+    locator.click(timeout=budget.timeout_ms("activate", cap=2000))
+    requests.get(url, timeout=budget.seconds("audio_download", cap=10))
+    ```
+    """
+
+    def __init__(self, timeout: typing.Optional[float] = None):
+        """
+        :param timeout: seconds of the solve, None means no deadline
+        """
+        self.timeout = timeout
+        self.start = time.monotonic()
+        self.deadline = math.inf if timeout is None else self.start + timeout
+        # The phase that consumed the budget most recently
+        self.phase: typing.Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    @property
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def check(self, phase: str):
+        """
+        :raise ChallengeTimeoutException: the budget ran out during `phase`
+        """
+        self.phase = phase
+        if self.expired:
+            raise ChallengeTimeoutException(
+                f"Solve budget of {self.timeout}s exceeded in phase <{phase}>", phase=phase
+            )
+
+    def seconds(self, phase: str, cap: typing.Optional[float] = None) -> typing.Optional[float]:
+        """
+        Timeout in seconds for the next step of `phase`, never beyond the deadline
+
+        :return: None if neither the budget nor `cap` sets a limit
+        """
+        self.check(phase)
+        timeout = self.remaining if cap is None else min(cap, self.remaining)
+        return None if math.isinf(timeout) else timeout
+
+    def timeout_ms(self, phase: str, cap: typing.Optional[float] = None) -> float:
+        """
+        Timeout in milliseconds for Playwright calls, never beyond the deadline
+
+        :return: 0 (no timeout in Playwright) if neither the budget nor `cap` sets a limit
+        """
+        timeout = self.seconds(phase, None if cap is None else cap / 1000)
+        # Playwright treats 0 as "wait forever", keep tiny leftovers positive
+        return 0 if timeout is None else max(timeout * 1000, 1)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Description: Size and age limits of the challenge cache
+import threading
+import typing
+
+from loguru import logger
+
+from .archive import DIR_PROFILE, DIR_SCREENSHOT, evict
+from .metrics import MetricsHook
+
+
+class CacheJanitor:
+    """
+    Background sweeper of `Config.DIR_CHALLENGE_CACHE`.
+
+    Every `interval` seconds the files older than `max_age` are removed, then the oldest
+    files until the cache fits `max_mb`. Disk usage and eviction totals are published
+    to the hooks as gauges after each sweep.
+
+    The screenshot archive has its own caps (`archive_max_mb`, `archive_max_age`)
+    and the profiles are kept for analysis, both directories are left out of the sweep.
+
+    ```python
+    janitor = CacheJanitor(config.DIR_CHALLENGE_CACHE, max_mb=512, max_age=3600).start()
+    ```
+    """
+
+    def __init__(
+        self,
+        dir_cache: str,
+        max_mb: typing.Optional[float] = None,
+        max_age: typing.Optional[float] = None,
+        interval: typing.Optional[float] = 300,
+        hooks: typing.Optional[typing.List[MetricsHook]] = None,
+        exclude: typing.Optional[typing.Iterable[str]] = (DIR_SCREENSHOT, DIR_PROFILE),
+    ):
+        """
+        :param dir_cache: swept recursively, i.e. the `<style>` directories as well
+        :param max_mb: size cap of the cache
+        :param max_age: seconds a file is kept
+        :param interval: seconds between two sweeps
+        :param hooks: receivers of the `cache_*` gauges
+        :param exclude: names of the subdirectories that are never swept
+        """
+        self.dir_cache = dir_cache
+        self.max_bytes = None if max_mb is None else int(max_mb * 1024 * 1024)
+        self.max_age = max_age
+        self.interval = interval
+        self.hooks: typing.List[MetricsHook] = list(hooks or [])
+        self.exclude = tuple(exclude or ())
+
+        self.stats = {
+            "bytes": 0,
+            "files": 0,
+            "evicted_files_total": 0,
+            "evicted_bytes_total": 0,
+            "sweeps_total": 0,
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def sweep(self) -> dict:
+        """Enforce the limits once, safe to call from any thread"""
+        with self._lock:
+            report = evict(self.dir_cache, self.max_bytes, self.max_age, exclude=self.exclude)
+            self.stats["bytes"] = report["bytes"]
+            self.stats["files"] = report["files"]
+            self.stats["evicted_files_total"] += report["removed"]
+            self.stats["evicted_bytes_total"] += report["removed_bytes"]
+            self.stats["sweeps_total"] += 1
+            stats = dict(self.stats)
+        if report["removed"]:
+            logger.debug(
+                f"Challenge cache swept - removed={report['removed']} "
+                f"removed_bytes={report['removed_bytes']} bytes={report['bytes']}"
+            )
+        for name, value in stats.items():
+            for hook in self.hooks:
+                hook.on_gauge(f"cache_{name}", value, dir_cache=self.dir_cache)
+        return report
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except OSError as err:
+                logger.warning(f"Challenge cache sweep failed - {err=}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> "CacheJanitor":
+        """Sweep now, then every `interval` seconds on a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="cache-janitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
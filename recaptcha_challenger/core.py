@@ -4,26 +4,38 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import os
+import random
+import sys
 import time
 import typing
-from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import suppress, contextmanager
+from dataclasses import dataclass, field
 from urllib.parse import quote
 from urllib.request import getproxies
 
-import pydub
-import requests
 from loguru import logger
 from playwright.sync_api import Page, Locator, expect, FrameLocator
 from playwright.sync_api import TimeoutError
-from speech_recognition import Recognizer, AudioFile
 
+from .archive import DIR_PROFILE, DIR_SCREENSHOT, ScreenshotArchive
+from .budget import Budget
 from .exceptions import (
     AntiBreakOffWarning,
     RiskControlSystemArmor,
     ChallengeTimeoutException,
     LabelNotFoundException,
 )
-from .solutions import yolo
+from .metrics import MetricsHook, Span
+from .policy import ATTEMPT, ReloadPolicy, StatsStore
+from .profiler import SamplingProfiler, new_profiler, profile_filename
+from .solver import VisualSolver
+
+# The audio stack (pydub, speech_recognition, requests) and the visual stack (cv2, numpy)
+# are imported by the challenger that needs them, not by importing this module
+if typing.TYPE_CHECKING:
+    from .dataset import TileStore
+    from .solutions.prefilter import TilePrefilter
 
 
 class ChallengeStyle:
@@ -31,6 +43,43 @@ class ChallengeStyle:
     VISUAL = "visual"
 
 
+@dataclass
+class SolveContext:
+    """State of one solve, a new context is started by `ArmorKernel.reset` for every solve"""
+
+    budget: Budget
+    # result of `anti_recaptcha` once the solve has ended
+    outcome: typing.Optional[str] = None
+    response: str = ""
+    # per-solve files, see `ArmorKernel.scratch_path`
+    scratch: typing.List[str] = field(default_factory=list)
+    # VisualChallenger: prompt text, resolved model label, src of the first tile, task type
+    prompt: str = ""
+    label: str = ""
+    target: str = ""
+    payload: str = ""
+    task: typing.Optional[str] = None
+    # src of every tile image when the round was submitted
+    grid: typing.List[str] = field(default_factory=list)
+    # (tile, hit, confidence, model flag) of the current round, kept for the tile store
+    tiles: typing.List[tuple] = field(default_factory=list)
+
+
+class _ContextField:
+    """Instance attribute stored on the current `SolveContext`"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance.ctx, self.name)
+
+    def __set__(self, instance, value):
+        setattr(instance.ctx, self.name, value)
+
+
 class ArmorUtils:
     """判断遇见 reCAPTCHA 的各种断言方法"""
 
@@ -67,14 +116,68 @@ class ArmorKernel:
     # <backcall> (New Challenge) Types of challenges not yet scheduled
     CHALLENGE_BACKCALL = "backcall"
 
-    def __init__(self, dir_challenge_cache: str, style: str, debug=True, **kwargs):
+    # Playwright's default timeout, the cap of steps that have no timeout of their own
+    DEFAULT_TIMEOUT = 30000
+
+    # Name prefix of the threads that run inference, sampled by the profiler as well
+    INFERENCE_THREAD = "inference"
+
+    budget: Budget = _ContextField("budget")
+    _response: str = _ContextField("response")
+    _scratch: typing.List[str] = _ContextField("scratch")
+
+    def __init__(
+        self,
+        dir_challenge_cache: str,
+        style: str,
+        debug=True,
+        solve_timeout: typing.Optional[float] = None,
+        hooks: typing.Optional[typing.List[MetricsHook]] = None,
+        profile_rate: typing.Optional[float] = 0.0,
+        profile_engine: typing.Optional[str] = SamplingProfiler.ENGINE,
+        profile_interval: typing.Optional[float] = 0.005,
+        archive_rate: typing.Optional[float] = 1.0,
+        archive_policy: typing.Optional[str] = ScreenshotArchive.POLICY_ALL,
+        archive_max_mb: typing.Optional[float] = None,
+        archive_max_age: typing.Optional[float] = None,
+        keep_scratch: typing.Optional[bool] = False,
+        **kwargs,
+    ):
+        """
+        :param solve_timeout: seconds of the end-to-end budget of each solve, None means no deadline
+        :param hooks: receivers of the per-phase spans and events, see `metrics.MetricsAggregator`
+        :param profile_rate: fraction of the solves to profile, in [0, 1]
+        :param profile_engine: "sample" writes collapsed stacks (.folded) for flame graphs,
+            "cprofile" writes pstats files (.prof)
+        :param profile_interval: seconds between two samples of the "sample" engine
+        :param archive_rate: fraction of the rounds whose screenshots are archived, in [0, 1]
+        :param archive_policy: "all" or "failures", archive a sampled round only if it failed
+        :param archive_max_mb: size cap of `captcha_screenshot/`, the oldest files are evicted
+        :param archive_max_age: seconds a screenshot is kept in `captcha_screenshot/`
+        :param keep_scratch: keep the per-solve files, e.g. the challenge audio, after the solve
+        """
         self.dir_challenge_cache = dir_challenge_cache
         self.style = style
         self.debug = debug
+        self.solve_timeout = solve_timeout
+        self.hooks: typing.List[MetricsHook] = list(hooks or [])
+        self.profile_rate = profile_rate
+        self.profile_engine = profile_engine
+        self.profile_interval = profile_interval
+        self.keep_scratch = keep_scratch
         self.action_name = f"{self.style.title()}Challenge"
 
         self.bframe = "//iframe[contains(@src,'bframe')]"
-        self._response = ""
+        # Per-solve state, the instance itself can be reused across solves
+        self.ctx = SolveContext(budget=Budget(self.solve_timeout))
+        # Screenshots are written by a background thread, see `captcha_screenshot`
+        self.archive = ScreenshotArchive(
+            os.path.join(os.path.dirname(self.dir_challenge_cache), DIR_SCREENSHOT),
+            sample_rate=archive_rate,
+            policy=archive_policy,
+            max_bytes=None if archive_max_mb is None else int(archive_max_mb * 1024 * 1024),
+            max_age=archive_max_age,
+        )
 
     @property
     def utils(self):
@@ -84,38 +187,115 @@ class ArmorKernel:
     def response(self):
         return self._response
 
-    def captcha_screenshot(self, page: typing.Union[Page, Locator], name_screenshot: str = None):
+    def captcha_screenshot(
+        self,
+        page: typing.Union[Page, Locator],
+        name_screenshot: str = None,
+        staged: typing.Optional[bool] = False,
+    ) -> typing.Optional[str]:
         """
         保存挑战截图，需要在 get_label 之后执行
 
+        Only the capture runs on the caller's thread, the file is written by `self.archive`.
+
         :param page:
         :param name_screenshot: filename of the Challenge image
-        :return:
+        :param staged: the capture belongs to the current round and follows the sampling
+            and the policy of the archive, nothing is captured if the round is not sampled
+        :return: the path the screenshot is written to, None if it is not archived
         """
-        if hasattr(self, "label_alias") and hasattr(self, "label"):
-            _suffix = self.label_alias.get(self.label, self.label)
-        else:
-            _suffix = self.action_name
+        if staged and not self.archive.sampled:
+            return None
+        _suffix = self.metric_label or self.action_name
         _filename = (
             f"{int(time.time())}.{_suffix}.png" if name_screenshot is None else name_screenshot
         )
-        _out_dir = os.path.join(os.path.dirname(self.dir_challenge_cache), "captcha_screenshot")
-        _out_path = os.path.join(_out_dir, _filename)
-        os.makedirs(_out_dir, exist_ok=True)
 
         # FullWindow screenshot or FocusElement screenshot
-        page.screenshot(path=_out_path)
-        return _out_path
+        data = page.screenshot(timeout=self.budget.timeout_ms("screenshot", self.DEFAULT_TIMEOUT))
+        if staged:
+            return self.archive.stage(_filename, data)
+        return self.archive.submit(_filename, data)
+
+    def wait_for_any(
+        self,
+        page: Page,
+        conditions: typing.Dict[str, typing.Callable[[], typing.Optional[bool]]],
+        timeout: int,
+        interval: int = 50,
+    ) -> typing.Optional[str]:
+        """
+        Race several DOM conditions and return the name of the first one that holds.
+
+        Each condition must be a non-blocking probe such as ``Locator.is_visible``,
+        so a round of the race costs one round trip per condition instead of
+        a full timeout per outcome.
+
+        :param page:
+        :param conditions: outcome name -> probe
+        :param timeout: deadline of the race in milliseconds
+        :param interval: pause between two rounds in milliseconds
+        :return: name of the matched outcome, or None if the deadline is exceeded
+        """
+        deadline = time.monotonic() + timeout / 1000
+        while True:
+            for name, condition in conditions.items():
+                with suppress(TimeoutError):
+                    if condition():
+                        return name
+            if time.monotonic() >= deadline:
+                return None
+            page.wait_for_timeout(interval)
+
+    @property
+    def metric_label(self) -> str:
+        """Label that the spans and events of the current solve are tagged with"""
+        return ""
+
+    @contextmanager
+    def span(self, phase: str, **tags):
+        """Time a phase of the solve and report it to the hooks"""
+        if not self.hooks:
+            yield
+            return
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            span = Span(
+                phase=phase,
+                duration=time.perf_counter() - start,
+                style=self.style,
+                label=self.metric_label,
+                ok=ok,
+                tags=tags,
+            )
+            for hook in self.hooks:
+                hook.on_span(span)
+
+    def emit(self, name: str, **tags):
+        """Report a countable event of the solve to the hooks"""
+        for hook in self.hooks:
+            hook.on_event(name, style=self.style, label=self.metric_label, **tags)
 
     def log(self, message: str, **params) -> None:
-        """格式化日志信息"""
+        """
+        Debug record with structured fields
+
+        The fields are written into the text as `k=v`, so any sink shows them,
+        and bound to the record for the JSON sink, see `utils.init_log`
+        """
         if not self.debug:
             return
-        flag_ = message
+        text = message
         if params:
-            flag_ += " - "
-            flag_ += " ".join([f"{i[0]}={i[1]}" for i in params.items()])
-        logger.debug(flag_)
+            text += " - " + " ".join(f"{k}={v}" for k, v in params.items())
+        fields = {"style": self.style, **params}
+        logger.opt(depth=1).bind(**fields, _message=message, _inline=True).debug(text)
 
     def _activate_recaptcha(self, page: Page):
         """处理 checkbox 激活 reCAPTCHA"""
@@ -123,12 +303,15 @@ class ArmorKernel:
         activator = page.frame_locator("//iframe[@title='reCAPTCHA']").locator(
             ".recaptcha-checkbox-border"
         )
-        activator.click()
+        with self.span("activate"):
+            activator.click(timeout=self.budget.timeout_ms("activate", self.DEFAULT_TIMEOUT))
         self.log("Active reCAPTCHA")
 
         # Check reCAPTCHA accessible status for the checkbox-result
         with suppress(TimeoutError):
-            if status := page.locator("#recaptcha-accessible-status").text_content(timeout=2000):
+            if status := page.locator("#recaptcha-accessible-status").text_content(
+                timeout=self.budget.timeout_ms("activate", 2000)
+            ):
                 raise AntiBreakOffWarning(status)
 
     def _switch_to_style(self, page: Page) -> typing.Optional[bool]:
@@ -141,14 +324,99 @@ class ArmorKernel:
         frame_locator = page.frame_locator(self.bframe)
         # 切换至<声纹验证模式>或停留在<视觉验证模式>
         if self.style == ChallengeStyle.AUDIO:
-            switcher = frame_locator.locator("#recaptcha-audio-button")
-            expect(switcher).to_be_visible()
-            switcher.click()
+            with self.span("switch_style"):
+                switcher = frame_locator.locator("#recaptcha-audio-button")
+                expect(switcher).to_be_visible(timeout=self.budget.timeout_ms("switch_style", 5000))
+                switcher.click(timeout=self.budget.timeout_ms("switch_style", self.DEFAULT_TIMEOUT))
         self.log("Accept the challenge", style=self.style)
         return True
 
-    def anti_recaptcha(self, page: Page):
-        """人机挑战的执行流"""
+    def anti_recaptcha(self, page: Page, budget: typing.Optional[Budget] = None):
+        """
+        人机挑战的执行流
+
+        :param page:
+        :param budget: end-to-end deadline of this solve, defaults to a new budget of `solve_timeout`
+        :raise ChallengeTimeoutException: the budget ran out, `phase` records the step that overran
+        :return:
+        """
+        self.reset(budget)
+        # Keep the disabled path down to a single comparison
+        if not self.profile_rate or random.random() >= self.profile_rate:
+            return self._run(page)
+
+        profiler = new_profiler(
+            self.profile_engine,
+            interval=self.profile_interval,
+            thread_prefixes=[self.INFERENCE_THREAD],
+        )
+        outcome = None
+        profiler.start()
+        try:
+            outcome = self._run(page)
+            return outcome
+        except BaseException as err:
+            outcome = type(err).__name__
+            raise
+        finally:
+            profiler.stop()
+            self.dump_profile(profiler, outcome)
+
+    def dump_profile(self, profiler, outcome) -> str:
+        """Write the profile next to `captcha_screenshot`, tagged with style, label and outcome"""
+        _out_dir = os.path.join(os.path.dirname(self.dir_challenge_cache), DIR_PROFILE)
+        os.makedirs(_out_dir, exist_ok=True)
+        _filename = profile_filename(
+            profiler.SUFFIX, style=self.style, label=self.metric_label, outcome=outcome
+        )
+        path_profile = profiler.dump(os.path.join(_out_dir, _filename))
+        self.log("Profile saved", path_profile=path_profile)
+        return path_profile
+
+    def reset(self, budget: typing.Optional[Budget] = None) -> SolveContext:
+        """Start a clean context, called by `anti_recaptcha` before every solve"""
+        self.ctx = SolveContext(budget=Budget(self.solve_timeout) if budget is None else budget)
+        return self.ctx
+
+    def close(self):
+        """Release the background workers, write out the queued screenshots"""
+        self.archive.close()
+
+    def scratch_path(self, filename: str) -> str:
+        """Path of a per-solve file in `dir_challenge_cache`, removed when the solve ends"""
+        path = os.path.join(self.dir_challenge_cache, filename)
+        self._scratch.append(path)
+        return path
+
+    def _clean_scratch(self):
+        scratch, self._scratch = self._scratch, []
+        if self.keep_scratch:
+            return
+        for path in scratch:
+            with suppress(OSError):
+                os.remove(path)
+
+    def _run(self, page: Page):
+        try:
+            with self.span("solve"):
+                result = self._anti_recaptcha(page)
+            self.ctx.outcome = result
+            if isinstance(result, str):
+                self.emit(result)
+            return result
+        except _timeout_errors() as err:
+            # A step was cut short by the budget rather than by its own timeout
+            if self.budget.expired:
+                self.emit("timeout", phase=self.budget.phase)
+                raise ChallengeTimeoutException(
+                    f"Solve budget of {self.budget.timeout}s exceeded in phase <{self.budget.phase}>",
+                    phase=self.budget.phase,
+                ) from err
+            raise
+        finally:
+            self._clean_scratch()
+
+    def _anti_recaptcha(self, page: Page):
         # [⚔] 激活 reCAPTCHA 并切换至<声纹验证模式>或<视觉验证模式>
         try:
             self._activate_recaptcha(page)
@@ -159,23 +427,46 @@ class ArmorKernel:
 
 
 class AudioChallenger(ArmorKernel):
-    def __init__(self, dir_challenge_cache: str, debug: typing.Optional[bool] = True, **kwargs):
+    def __init__(
+        self,
+        dir_challenge_cache: str,
+        debug: typing.Optional[bool] = True,
+        solve_timeout: typing.Optional[float] = None,
+        **kwargs,
+    ):
         super().__init__(
             dir_challenge_cache=dir_challenge_cache,
             style=ChallengeStyle.AUDIO,
             debug=debug,
-            kwargs=kwargs,
+            solve_timeout=solve_timeout,
+            **kwargs,
         )
+        # Downloader of the challenge audio, swapped by `replay.SessionRecorder/SessionReplayer`
+        self.request_asset = _request_asset
+        self._http = None
+
+    @property
+    def http(self):
+        """requests.Session kept across solves, the audio host connection is reused"""
+        if self._http is None:
+            import requests
+
+            self._http = requests.Session()
+        return self._http
 
     def get_audio_download_link(self, fl: FrameLocator) -> typing.Optional[str]:
         """Returns the download address of the sound source file."""
         for _ in range(5):
             with suppress(TimeoutError):
                 self.log("Play challenge audio")
-                fl.locator("//button[@aria-labelledby]").click(timeout=1000)
+                fl.locator("//button[@aria-labelledby]").click(
+                    timeout=self.budget.timeout_ms("audio_link", 1000)
+                )
                 break
             with suppress(TimeoutError):
-                header_text = fl.locator(".rc-doscaptcha-header-text").text_content(timeout=1000)
+                header_text = fl.locator(".rc-doscaptcha-header-text").text_content(
+                    timeout=self.budget.timeout_ms("audio_link", 1000)
+                )
                 if "Try again later" in header_text:
                     raise ConnectionError(
                         "Your computer or network may be sending automated queries."
@@ -183,7 +474,9 @@ class AudioChallenger(ArmorKernel):
 
         # Locate the sound source file url
         try:
-            audio_url = fl.locator("#audio-source").get_attribute("src")
+            audio_url = fl.locator("#audio-source").get_attribute(
+                "src", timeout=self.budget.timeout_ms("audio_link", self.DEFAULT_TIMEOUT)
+            )
         except TimeoutError:
             raise RiskControlSystemArmor("Trapped in an inescapable risk control context")
         return audio_url
@@ -197,16 +490,21 @@ class AudioChallenger(ArmorKernel):
         """
         # Splice audio cache file path
         timestamp_ = int(time.time())
-        path_audio_mp3 = os.path.join(self.dir_challenge_cache, f"audio_{timestamp_}.mp3")
-        path_audio_wav = os.path.join(self.dir_challenge_cache, f"audio_{timestamp_}.wav")
+        path_audio_mp3 = self.scratch_path(f"audio_{timestamp_}.mp3")
+        path_audio_wav = self.scratch_path(f"audio_{timestamp_}.wav")
 
         # Download the sound source file to the local
         self.log("Downloading challenge audio")
-        _request_asset(audio_url, path_audio_mp3)
+        with self.span("audio_download"):
+            self.request_asset(audio_url, path_audio_mp3, budget=self.budget, session=self.http)
 
         # Convert audio format mp3 --> wav
+        self.budget.check("transcode")
         self.log("Audio transcoding MP3 --> WAV")
-        pydub.AudioSegment.from_mp3(path_audio_mp3).export(path_audio_wav, format="wav")
+        import pydub
+
+        with self.span("transcode"):
+            pydub.AudioSegment.from_mp3(path_audio_mp3).export(path_audio_wav, format="wav")
         self.log("Transcoding complete", path_audio_wav=path_audio_wav)
 
         # Returns audio files in wav format to increase recognition accuracy
@@ -224,8 +522,11 @@ class AudioChallenger(ArmorKernel):
         # Internationalized language format of audio files, default en-US American pronunciation.
         language = "en-US"
 
+        from speech_recognition import Recognizer, AudioFile
+
         # Read audio into and cut into a frame matrix
         recognizer = Recognizer()
+        recognizer.operation_timeout = self.budget.seconds("asr", 30)
         audio_file = AudioFile(path_audio_wav)
         with audio_file as stream:
             audio = recognizer.record(stream)
@@ -233,7 +534,8 @@ class AudioChallenger(ArmorKernel):
         # Returns the text corresponding to the short audio(str)，
         # en-US Several words that are not sentence patterns
         self.log("Parsing audio file ... ")
-        audio_answer = recognizer.recognize_google(audio, language=language)
+        with self.span("asr"):
+            audio_answer = recognizer.recognize_google(audio, language=language)
         self.log("Analysis completed", audio_answer=audio_answer)
 
         return audio_answer
@@ -251,10 +553,14 @@ class AudioChallenger(ArmorKernel):
         """
         with suppress(NameError, TimeoutError):
             input_field = fl.locator("#audio-response")
-            input_field.fill("")
-            input_field.fill(text.lower())
+            input_field.fill("", timeout=self.budget.timeout_ms("submit", self.DEFAULT_TIMEOUT))
+            input_field.fill(
+                text.lower(), timeout=self.budget.timeout_ms("submit", self.DEFAULT_TIMEOUT)
+            )
             self.log("Submit the challenge")
-            input_field.press("Enter")
+            input_field.press(
+                "Enter", timeout=self.budget.timeout_ms("submit", self.DEFAULT_TIMEOUT)
+            )
             return True
         return False
 
@@ -262,21 +568,22 @@ class AudioChallenger(ArmorKernel):
         """Check if the challenge passes"""
         with suppress(TimeoutError):
             err_resp = page.locator(".rc-audiochallenge-error-message")
-            if msg := err_resp.text_content(timeout=2000):
+            if msg := err_resp.text_content(timeout=self.budget.timeout_ms("verify", 2000)):
                 self.log("Challenge failed", err_message=msg)
             return self.CHALLENGE_RETRY
         self.log("Challenge success")
         self._response = page.evaluate("grecaptcha.getResponse()")
         return self.CHALLENGE_SUCCESS
 
-    def anti_recaptcha(self, page: Page):
-        if super().anti_recaptcha(page) is not True:
+    def _anti_recaptcha(self, page: Page):
+        if super()._anti_recaptcha(page) is not True:
             return
 
         # [⚔] Register Challenge Framework
         frame_locator = page.frame_locator(self.bframe)
         # [⚔] Get the audio file download link
-        audio_url: str = self.get_audio_download_link(frame_locator)
+        with self.span("audio_link"):
+            audio_url: str = self.get_audio_download_link(frame_locator)
         # [⚔] Audio transcoding（MP3 --> WAV）increase recognition accuracy
         path_audio_wav: str = self.handle_audio(audio_url=audio_url)
         # [⚔] Speech to text
@@ -284,51 +591,47 @@ class AudioChallenger(ArmorKernel):
         # [⚔] Locate the input box and fill in the text
         if self.submit_text(frame_locator, text=audio_answer) is not True:
             self.log("reCAPTCHA Challenge submission failed")
-            raise ChallengeTimeoutException
+            raise ChallengeTimeoutException("reCAPTCHA Challenge submission failed", phase="submit")
         # Judging whether the challenge is successful or not
         # Get response of the reCAPTCHA
-        return self.is_correct(page)
+        with self.span("verify"):
+            return self.is_correct(page)
 
 
 class VisualChallenger(ArmorKernel):
-    TASK_OBJECT_DETECTION = "ObjectDetection"
-    TASK_BINARY_CLASSIFICATION = "BinaryClassification"
+    """Playwright adapter of `VisualSolver`: captures the tiles and clicks what it selects"""
+
+    TASK_OBJECT_DETECTION = VisualSolver.TASK_OBJECT_DETECTION
+    TASK_BINARY_CLASSIFICATION = VisualSolver.TASK_BINARY_CLASSIFICATION
 
     FEATURE_DYNAMIC = "rc-imageselect-dynamic-selected"
     FEATURE_SELECTED = "rc-imageselect-tileselected"
 
-    # TODO
-    # crosswalks
-    # stairs
-    # vehicles
-    # tractors
-    # taxis
-    # chimneys
-    # mountains or hills
-    # bridge
-    # cars
-    label_alias = {
-        "zh": {
-            "消防栓": "fire hydrant",
-            "交通灯": "traffic light",
-            "汽车": "car",
-            "自行车": "bicycle",
-            "摩托车": "motorcycle",
-            "公交车": "bus",
-            "船": "boat",
-        },
-        "en": {
-            "a fire hydrant": "fire hydrant",
-            "traffic lights": "traffic light",
-            "car": "car",
-            "bicycles": "bicycle",
-            "motorcycles": "motorcycle",
-            "bus": "bus",
-            "buses": "bus",
-            "cars": "car",
-            "boats": "boat",
-        },
-    }
+    # Outcomes of a submitted round, raced by `check_accessible_status`
+    PROMPT_SELECT_MORE = ".rc-imageselect-error-select-more"
+    PROMPT_DYNAMIC_MORE = ".rc-imageselect-error-dynamic-more"
+    PROMPT_INCORRECT = ".rc-imageselect-incorrect-response"
+
+    # Upper bound of the rounds of refreshed tiles in a dynamic challenge
+    MAX_DYNAMIC_ROUNDS = 10
+    # Wait(ms) before a tile caught mid-fade is captured again
+    FADING_RECHECK_MS = 200
+    # Cap(s) of one inference call, model loading included, a stuck worker fails the solve
+    INFERENCE_TIMEOUT = 60
+
+    # Per-solve state, see `SolveContext`
+    prompt: str = _ContextField("prompt")
+    label: str = _ContextField("label")
+    # Model label of the prompt, empty if the prompt could not be resolved
+    target: str = _ContextField("target")
+    # src of the challenge image, used to observe that the challenge was replaced
+    payload: str = _ContextField("payload")
+    # src of every tile image of the submitted round, a new round replaces all of them
+    grid: typing.List[str] = _ContextField("grid")
+    # _oncall_task "ObjectDetection" | "BinaryClassification"
+    _oncall_task: typing.Optional[str] = _ContextField("task")
+
+    label_alias = VisualSolver.label_alias
 
     def __init__(
         self,
@@ -337,32 +640,137 @@ class VisualChallenger(ArmorKernel):
         onnx_prefix: typing.Optional[str] = None,
         screenshot: typing.Optional[bool] = False,
         debug: typing.Optional[bool] = True,
+        reload_timeout: typing.Optional[int] = 5000,
+        verify_timeout: typing.Optional[int] = 2000,
+        solve_timeout: typing.Optional[float] = None,
+        cascade: typing.Optional[bool] = False,
+        cascade_light: typing.Optional[str] = "yolov5n6",
+        cascade_band: typing.Optional[typing.Tuple[float, float]] = (0.2, 0.6),
+        autotune: typing.Optional[bool] = False,
+        policy: typing.Optional[ReloadPolicy] = None,
+        tile_store: typing.Optional["TileStore"] = None,
+        prefilter: typing.Union[bool, "TilePrefilter", None] = False,
+        warm_models: typing.Optional[bool] = True,
         **kwargs,
     ):
+        """
+        :param reload_timeout: deadline(ms) for a new challenge to show up after reload
+        :param verify_timeout: deadline(ms) for the outcome of a submitted round
+        :param solve_timeout: seconds of the end-to-end budget of each solve
+        :param cascade: answer with the light model first and escalate ambiguous tiles
+            to the `onnx_prefix` model, see `yolo.YOLOCascade`
+        :param cascade_light: onnx_prefix of the light model of the cascade
+        :param cascade_band: confidence band of the tiles that are escalated
+        :param autotune: measure the fastest cv2.dnn configuration of each model on first use,
+            the result is persisted per host in `<dir_model>/_autotune.json`
+        :param policy: decides between attempting and reloading each challenge,
+            defaults to statistics persisted in `<dir_model>/_policy.json`,
+            shared by the challengers of the process
+        :param tile_store: dataset the tiles of every attempt are appended to,
+            with the verdicts of the model and the outcome of the round, see `dataset.TileStore`
+        :param prefilter: skip the forward pass of blank, noisy and fading tiles,
+            a `TilePrefilter` sets custom thresholds, off by default, see `VisualSolver`
+        :param warm_models: pull the routed classifiers while the challenger is built,
+            they are never downloaded during a solve, a label whose classifier is
+            not available yet is answered by YOLO until `solver.warm()` pulls it
+        """
         super().__init__(
             dir_challenge_cache=dir_challenge_cache,
             style=ChallengeStyle.VISUAL,
             debug=debug,
-            kwargs=kwargs,
+            solve_timeout=solve_timeout,
+            **kwargs,
         )
         self.dir_model = dir_model
         self.onnx_prefix = onnx_prefix
         self.screenshot = screenshot
-        self.prompt: str = ""
-        self.label: str = ""
+        self.reload_timeout = reload_timeout
+        self.verify_timeout = verify_timeout
         self.lang: str = "en"
         self.label_alias = VisualChallenger.label_alias[self.lang]
+        self.policy = policy or ReloadPolicy(
+            StatsStore.shared(os.path.join(dir_model, "_policy.json"))
+        )
+        self.tile_store = tile_store
+
+        # Every decision is made by the browser-independent core
+        self.solver = VisualSolver(
+            dir_model,
+            onnx_prefix,
+            cascade=cascade,
+            cascade_light=cascade_light,
+            cascade_band=cascade_band,
+            autotune=autotune,
+            label_alias=VisualChallenger.label_alias,
+            lang=self.lang,
+            prefilter=prefilter,
+            pull_on_demand=False,
+        )
+        if warm_models:
+            self.solver.warm()
+        self.yolo_model = self.solver.yolo_model
+        self.cascade_model = self.solver.cascade_model
 
-        # _oncall_task "object-detection" | "binary-classification"
-        self._oncall_task = None
+        # Inference runs on a worker thread while the page is driven on the caller's thread
+        self._executor: typing.Optional[ThreadPoolExecutor] = None
 
-        self.yolo_model = yolo.YOLO(self.dir_model, self.onnx_prefix)
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Single inference worker, started on first use and again after `close`"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=self.INFERENCE_THREAD
+            )
+        return self._executor
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        super().close()
 
     def reload(self, page: Page):
         """Overload Visual Challenge :: In the BFrame"""
         self.log("reload challenge")
-        page.frame_locator(self.bframe).locator("#recaptcha-reload-button").click()
-        page.wait_for_timeout(1000)
+        self.emit("reload", task=self._oncall_task)
+        frame_locator = page.frame_locator(self.bframe)
+        start = time.perf_counter()
+        with self.span("reload"):
+            frame_locator.locator("#recaptcha-reload-button").click(
+                timeout=self.budget.timeout_ms("reload", self.DEFAULT_TIMEOUT)
+            )
+            # The label and the images change together, wait for the new payload
+            # instead of sleeping for a fixed period.
+            if self.payload:
+                with suppress(TimeoutError, AssertionError):
+                    expect(
+                        frame_locator.locator("//td[@aria-label]//img").first
+                    ).not_to_have_attribute(
+                        "src",
+                        self.payload,
+                        timeout=self.budget.timeout_ms("reload", self.reload_timeout),
+                    )
+        self.policy.store.record_reload(time.perf_counter() - start)
+
+    def get_payload(self, page: Page) -> str:
+        """Get the src of the challenge image, which identifies the current challenge"""
+        with suppress(TimeoutError):
+            self.payload = (
+                page.frame_locator(self.bframe)
+                .locator("//td[@aria-label]//img")
+                .first.get_attribute(
+                    "src", timeout=self.budget.timeout_ms("label", self.reload_timeout)
+                )
+            ) or ""
+        return self.payload
+
+    def get_grid(self, page: Page) -> typing.List[str]:
+        """src of every tile image, in tile order"""
+        return (
+            page.frame_locator(self.bframe)
+            .locator("//td[@aria-label]//img")
+            .evaluate_all("imgs => imgs.map(img => img.getAttribute('src') || '')")
+        )
 
     def check_oncall_task(self, page: Page) -> typing.Optional[str]:
         """Identify the type of task：Detection task or classification task"""
@@ -383,7 +791,10 @@ class VisualChallenger(ArmorKernel):
 
         # Captcha prompts
         label_obj = page.frame_locator(self.bframe).locator("//strong")
-        self.prompt = label_obj.text_content()
+        with self.span("label"):
+            self.prompt = label_obj.text_content(
+                timeout=self.budget.timeout_ms("label", self.DEFAULT_TIMEOUT)
+            )
         # Parse prompts to model label
         try:
             _label = split_prompt_message(prompt_message=self.prompt)
@@ -391,19 +802,30 @@ class VisualChallenger(ArmorKernel):
             raise LabelNotFoundException("Get the exception label object")
         else:
             self.label = _label
+            self.target = self.solver.resolve(self.label, self.lang)
+            self.get_payload(page)
             self.log(
-                message="Get label", label=f"「{self.label}」", task=f"{self.check_oncall_task(page)}"
+                "Get label",
+                label=self.label,
+                target=self.target,
+                task=self.check_oncall_task(page),
             )
 
-    def select_model(self):
-        """Optimizing solutions based on different challenge labels"""
-        # label_alias = self.label_alias.get(self.label)
-        return self.yolo_model
+    @property
+    def metric_label(self) -> str:
+        return self.target or self.label
+
+    def select_model(self, label: typing.Optional[str] = None):
+        """Model of the current challenge, see `VisualSolver.select_model`"""
+        return self.solver.select_model(self.metric_label if label is None else label)
 
     def mark_samples(self, page: Page):
         """Get the download link and locator of each challenge image"""
         samples = page.frame_locator(self.bframe).locator("//td[@aria-label]")
         for index in range(samples.count()):
+            if self.tile_store is not None:
+                self.tile_store.append(samples.nth(index).screenshot(), label=self.target or None)
+                continue
             fn = f"{int(time.time())}_/Challenge Image {index + 1}.png"
             self.captcha_screenshot(samples.nth(index), name_screenshot=fn)
             self.log("save image", fn=fn)
@@ -412,13 +834,15 @@ class VisualChallenger(ArmorKernel):
             .locator("//td[@aria-label]//img")
             .first.get_attribute("src")
         )
-        self.log(image_link)
+        self.log("Image link", src=image_link)
 
     def check_positive_element(
         self, sample: Locator, model, screenshot: typing.Optional[bool] = False
     ) -> typing.Optional[bool]:
         """Review positive samples"""
-        result = model.solution(img_stream=sample.screenshot(), label=self.label_alias[self.label])
+        img_stream = sample.screenshot()
+        result, confidence = self.solver.predict([img_stream], self.target, model=model)[0]
+        self._keep_tiles(model, [img_stream], [(result, confidence)])
 
         # Pass: Hit at least one object
         if result:
@@ -426,74 +850,210 @@ class VisualChallenger(ArmorKernel):
 
         # Check result of the challenge.
         if screenshot or self.screenshot:
-            _filename = f"{int(time.time())}.{model.flag}.{self.label_alias[self.label]}.png"
-            self.captcha_screenshot(sample, name_screenshot=_filename)
+            self._screenshot_sample(sample, model)
 
         return result
 
-    def challenge(self, page: Page, model):
-        """Image classification, element clicks, answer submissions"""
+    def _keep_tiles(self, model, streams: typing.List[bytes], results: typing.List[tuple]):
+        if self.tile_store is not None:
+            self.ctx.tiles.extend(
+                (stream, hit, confidence, model.flag)
+                for stream, (hit, confidence) in zip(streams, results)
+            )
+
+    def _store_tiles(self, verified: bool):
+        """Append the tiles of the round, their verdicts are ground truth if the round passed"""
+        tiles, self.ctx.tiles = self.ctx.tiles, []
+        for stream, hit, confidence, flag in tiles:
+            self.tile_store.append(
+                stream,
+                label=self.target,
+                positive=hit,
+                verified=verified,
+                confidence=round(confidence, 4),
+                model=flag,
+            )
+
+    def _screenshot_sample(self, sample: Locator, model):
+        _filename = f"{int(time.time())}.{model.flag}.{self.target}.png"
+        self.captcha_screenshot(sample, name_screenshot=_filename, staged=True)
 
-        def hit_dynamic_samples(target: list):
-            if not target:
+    def hit_dynamic_samples(self, page: Page, model, target: typing.List[int]):
+        """
+        Review the tiles that are refreshed after being clicked
+
+        The state of every tile is fetched in one round trip per round, tiles that
+        have finished fading are batched into one inference call, and positive
+        tiles are clicked again and re-enter the queue. Tiles the prefilter still
+        sees fading re-enter the queue without a click, once: the next capture of
+        a tile that was seen fading goes through the model whatever it looks like.
+
+        :param page:
+        :param model:
+        :param target: indexes of the clicked tiles
+        :return:
+        """
+        samples = page.frame_locator(self.bframe).locator("//td[@aria-label]")
+        label = self.target
+        pending = list(target)
+        # Tiles already put back once because they looked faded
+        faded: typing.Set[int] = set()
+        deadline = time.monotonic() + self.verify_timeout / 1000
+        for _ in range(self.MAX_DYNAMIC_ROUNDS):
+            while pending and time.monotonic() < deadline:
+                self.budget.check("dynamic")
+                classes = samples.evaluate_all("tiles => tiles.map(tile => tile.className)")
+                ready = [i for i in pending if self.FEATURE_DYNAMIC not in classes[i]]
+                if ready:
+                    break
+                page.wait_for_timeout(100)
+            else:
                 return
-            for i in target:
-                locator_ = f'//td[@tabindex="{i + 4}"]'
-                # Gradient control
-                # Ensure that the pictures fed into the model are correctly exposed.
-                with suppress(TimeoutError, AssertionError):
-                    expect(page.frame_locator(self.bframe).locator(locator_)).to_have_attribute(
-                        "class", self.FEATURE_DYNAMIC
+            pending = [i for i in pending if i not in ready]
+            with self.span("capture", tiles=len(ready)):
+                streams = [
+                    samples.nth(i).screenshot(timeout=self.budget.timeout_ms("capture", 5000))
+                    for i in ready
+                ]
+            results = self.executor.submit(
+                self.solver.predict,
+                streams,
+                label,
+                model=model,
+                refreshed=not faded.intersection(ready),
+                tracer=self.span,
+            ).result(timeout=self.budget.seconds("inference", self.INFERENCE_TIMEOUT))
+            self._keep_tiles(model, streams, results)
+            for index, (result, _) in zip(ready, results):
+                faded.discard(index)
+                if result:
+                    with self.span("click"):
+                        samples.nth(index).click(timeout=self.budget.timeout_ms("click", 5000))
+                    pending.append(index)
+                elif result is None:
+                    faded.add(index)
+                    pending.append(index)
+                if self.screenshot:
+                    self._screenshot_sample(samples.nth(index), model)
+            if any(result is None for result, _ in results):
+                page.wait_for_timeout(self.FADING_RECHECK_MS)
+            # Give the refreshed tiles a fresh deadline to finish fading
+            deadline = time.monotonic() + self.verify_timeout / 1000
+
+    def challenge(self, page: Page, model):
+        """
+        Image classification, element clicks, answer submissions
+
+        Tiles are processed as a pipeline: every tile is captured and handed
+        over to the inference worker up front, then positive tiles are clicked
+        in order while later tiles are still being inferred.
+        """
+        samples = page.frame_locator(self.bframe).locator("//td[@aria-label]")
+        label = self.target
+
+        # Producer: capture tiles and queue them for inference,
+        # models that run batched get the whole grid in one call instead
+        batched = getattr(model, "BATCHED", False)
+        streams, futures = [], []
+        with self.span("capture"):
+            for index in range(samples.count()):
+                img_stream = samples.nth(index).screenshot(
+                    timeout=self.budget.timeout_ms("capture", 5000)
+                )
+                streams.append(img_stream)
+                if not batched:
+                    futures.append(
+                        self.executor.submit(
+                            self.solver.predict, [img_stream], label, model=model, tracer=self.span
+                        )
                     )
-                dynamic_element = page.frame_locator(self.bframe).locator(locator_)
-                result_ = self.check_positive_element(sample=dynamic_element, model=model)
-                if not result_:
-                    target.remove(i)
-            return hit_dynamic_samples(target)
+        if batched:
+            futures.append(
+                self.executor.submit(
+                    self.solver.predict, streams, label, model=model, tracer=self.span
+                )
+            )
+
+        def results():
+            offset = 0
+            for future in futures:
+                chunk = future.result(
+                    timeout=self.budget.seconds("inference", self.INFERENCE_TIMEOUT)
+                )
+                self._keep_tiles(model, streams[offset : offset + len(chunk)], chunk)
+                offset += len(chunk)
+                yield from chunk
 
+        # Consumer: click positive tiles as soon as their results are ready
         is_dynamic = None
         dynamic_index = []
-        samples = page.frame_locator(self.bframe).locator("//td[@aria-label]")
-        for index in range(samples.count()):
-            result = self.check_positive_element(sample=samples.nth(index), model=model)
-            if is_dynamic is None:
-                motion_status = (
-                    page.frame_locator(self.bframe)
-                    .locator(f'//td[@tabindex="{index + 4}"]')
-                    .get_attribute("class")
-                )
-                if self.FEATURE_SELECTED in motion_status:
-                    is_dynamic = False
-                elif self.FEATURE_DYNAMIC in motion_status:
-                    is_dynamic = True
+        for index, (result, _) in enumerate(results()):
+            sample = samples.nth(index)
             if result:
+                with self.span("click"):
+                    sample.click(timeout=self.budget.timeout_ms("click", 5000))
                 dynamic_index.append(index)
+                # Only a clicked tile tells if the challenge refreshes its tiles
+                if is_dynamic is None:
+                    motion_status = sample.get_attribute("class") or ""
+                    is_dynamic = self.FEATURE_DYNAMIC in motion_status
+            if self.screenshot:
+                self._screenshot_sample(sample, model)
 
         # Winter is coming
         if is_dynamic:
-            hit_dynamic_samples(target=dynamic_index)
+            self.hit_dynamic_samples(page, model, target=dynamic_index)
         # Submit challenge
-        page.frame_locator(self.bframe).locator("//button[@id='recaptcha-verify-button']").click()
+        self.grid = self.get_grid(page)
+        page.frame_locator(self.bframe).locator("//button[@id='recaptcha-verify-button']").click(
+            timeout=self.budget.timeout_ms("verify", self.DEFAULT_TIMEOUT)
+        )
 
     def check_accessible_status(self, page: Page) -> typing.Optional[str]:
-        """Judging whether the challenge was successful"""
-        try:
-            prompt_obj = page.frame_locator(self.bframe).locator(
-                "//div[@class='rc-imageselect-error-select-more']"
+        """
+        Judging whether the challenge was successful
+
+        All outcomes of the submitted round are raced together:
+            - the checkbox is checked: success
+            - an error prompt shows up: return the prompt
+            - every tile image is replaced: a new round of the challenge, continue
+        """
+        frame_locator = page.frame_locator(self.bframe)
+        anchor = page.frame_locator("//iframe[@title='reCAPTCHA']").locator(
+            "#recaptcha-anchor[aria-checked='true']"
+        )
+        prompts = {
+            selector: frame_locator.locator(selector)
+            for selector in [
+                self.PROMPT_SELECT_MORE,
+                self.PROMPT_DYNAMIC_MORE,
+                self.PROMPT_INCORRECT,
+            ]
+        }
+        conditions = {self.CHALLENGE_SUCCESS: anchor.is_visible}
+        conditions.update({selector: locator.is_visible for selector, locator in prompts.items()})
+        # A tile refreshed in a dynamic round only replaces its own image, a new round
+        # leaves no image of the submitted grid behind
+        submitted = set(self.grid or self.get_grid(page))
+        if submitted:
+            conditions[self.CHALLENGE_CONTINUE] = lambda: not submitted.intersection(
+                self.get_grid(page) or submitted
             )
-            prompt_obj.wait_for(timeout=1000)
-        except TimeoutError:
-            try:
-                prompt_obj = page.frame_locator(self.bframe).locator(
-                    "rc-imageselect-incorrect-response"
-                )
-                prompt_obj.wait_for(timeout=1000)
-            except TimeoutError:
-                self.log("挑战成功")
-                return self.CHALLENGE_SUCCESS
 
-        prompts = prompt_obj.text_content()
-        return prompts
+        outcome = self.wait_for_any(
+            page, conditions, timeout=self.budget.timeout_ms("verify", self.verify_timeout)
+        )
+        if outcome in prompts:
+            return prompts[outcome].text_content()
+        if outcome == self.CHALLENGE_CONTINUE:
+            self.log("Challenge continue", reason="new challenge images")
+            return self.CHALLENGE_CONTINUE
+        # Cut short by the solve budget, not a round that went quiet
+        if outcome is None:
+            self.budget.check("verify")
+        # The checkbox has been checked, or no error prompt within the deadline
+        self.log("挑战成功")
+        return self.CHALLENGE_SUCCESS
 
     def tactical_retreat(self, page: Page) -> typing.Optional[str]:
         """
@@ -501,8 +1061,10 @@ class VisualChallenger(ArmorKernel):
         :param page:
         :return: the screenshot storage path
         """
-        if self.label_alias.get(self.label):
+        if self.target:
             return self.CHALLENGE_CONTINUE
+        # Counted so that the reloads caused by unknown prompts can be measured
+        self.emit("label_unresolved", prompt=self.prompt)
 
         # Save a screenshot of the challenge
         with suppress(TimeoutError):
@@ -520,7 +1082,7 @@ class VisualChallenger(ArmorKernel):
 
         return self.CHALLENGE_BACKCALL
 
-    def anti_recaptcha(self, page: Page):
+    def _anti_recaptcha(self, page: Page):
         """
         >> NOTE:
         ——————————————————————————————————————————————————————————————————————————
@@ -550,33 +1112,83 @@ class VisualChallenger(ArmorKernel):
                 弹出此提示时，挑战上下文不变，即，prompts 与 images 都不会变
             - Please try again. 评分过低，重试
         """
-        if super().anti_recaptcha(page) is not True:
+        if super()._anti_recaptcha(page) is not True:
             return
         # [⚔] Register Challenge Framework
-        # TODO: TASK_OBJECT_DETECTION, more label
         for _ in range(3):
-            # [⚔] Skip objects detection tasks and unprepared classification tasks
+            # [⚔] Skip unprepared challenges, and the ones that are faster to reload than to solve
             for _ in range(10):
+                self.budget.check("label")
                 # [⚔] Get challenge labels
                 self.get_label(page)
-                if self._oncall_task == self.TASK_OBJECT_DETECTION:
-                    self.reload(page)
-                elif self.tactical_retreat(page) == self.CHALLENGE_BACKCALL:
+                if self.tactical_retreat(page) == self.CHALLENGE_BACKCALL:
                     self.reload(page)
-                else:
+                    continue
+                self.policy.store.observe(self._oncall_task, self.target)
+                decision = self.policy.decide(self._oncall_task, self.target)
+                if decision == ATTEMPT:
                     break
+                self.log("Skip challenge", reason="policy", task=self._oncall_task)
+                self.reload(page)
+            else:
+                # Out of skips, attempt the challenge the last reload brought up
+                self.budget.check("label")
+                self.get_label(page)
+                self.policy.store.observe(self._oncall_task, self.target)
 
+            start = time.perf_counter()
             model = self.select_model()
+            self.archive.begin()
             self.challenge(page, model=model)
-            self.captcha_screenshot(page)
-            if drop := self.check_accessible_status(page) == self.CHALLENGE_SUCCESS:
+            if model is self.cascade_model:
+                self.log("Cascade", **model.report())
+            if self.solver.prefilter is not None:
+                self.log("Prefilter", **self.solver.prefilter.report())
+            self.captcha_screenshot(page, staged=True)
+            with self.span("verify"):
+                drop = self.check_accessible_status(page)
+            self.archive.end(failed=drop != self.CHALLENGE_SUCCESS)
+            if self.tile_store is not None:
+                self._store_tiles(verified=drop == self.CHALLENGE_SUCCESS)
+            self.policy.store.record_attempt(
+                self._oncall_task,
+                self.target,
+                success=drop == self.CHALLENGE_SUCCESS,
+                seconds=time.perf_counter() - start,
+            )
+            if drop == self.CHALLENGE_SUCCESS:
                 self._response = page.evaluate("grecaptcha.getResponse()")
                 return drop
+            self.emit("attempt_failed", reason=drop)
         else:
-            input("This method has not been implemented yet, press any key to exit the program.")
+            self.log("Challenge failed", reason="out of attempts")
+            return self.CHALLENGE_RETRY
 
 
-def _request_asset(asset_download_url: str, asset_path: str):
+def _timeout_errors() -> typing.Tuple[typing.Type[BaseException], ...]:
+    """Timeouts a solve step can raise, requests is only checked if a step has imported it"""
+    errors = (TimeoutError, FutureTimeoutError)
+    if "requests" in sys.modules:
+        errors += (sys.modules["requests"].exceptions.Timeout,)
+    return errors
+
+
+def _request_asset(
+    asset_download_url: str,
+    asset_path: str,
+    budget: typing.Optional[Budget] = None,
+    phase: str = "audio_download",
+    session=None,
+):
+    """
+    :param budget: deadline of the download, checked on connect, on each read and per chunk
+    :param phase: phase name recorded by the budget
+    :param session: requests.Session to download with, defaults to a one-off connection
+    :return:
+    """
+    import requests
+
+    budget = Budget(60) if budget is None else budget
     headers = {
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
         "Chrome/105.0.0.0 Safari/537.36 Edg/105.0.1343.27"
@@ -584,12 +1196,19 @@ def _request_asset(asset_download_url: str, asset_path: str):
 
     # FIXME: PTC-W6004
     #  Audit required: External control of file name or path
-    with open(asset_path, "wb") as file, requests.get(
-        asset_download_url, headers=headers, stream=True, proxies=getproxies()
+    with (session or requests).get(
+        asset_download_url,
+        headers=headers,
+        stream=True,
+        proxies=getproxies(),
+        timeout=budget.seconds(phase, 10),
     ) as response:
-        for chunk in response.iter_content(chunk_size=1024):
-            if chunk:
-                file.write(chunk)
+        response.raise_for_status()
+        with open(asset_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=1024):
+                budget.check(phase)
+                if chunk:
+                    file.write(chunk)
 
 
 def new_challenger(
@@ -598,22 +1217,38 @@ def new_challenger(
     dir_model: typing.Optional[str] = None,
     onnx_prefix: typing.Optional[str] = None,
     debug: typing.Optional[bool] = True,
+    solve_timeout: typing.Optional[float] = None,
+    hooks: typing.Optional[typing.List[MetricsHook]] = None,
+    **kwargs,
 ) -> typing.Union[AudioChallenger, VisualChallenger]:
-    # Check cache dir of challenge
-    if not os.path.isdir(dir_challenge_cache):
-        raise FileNotFoundError("dir_challenge_cache should be an existing file directory.")
+    """
+    :param solve_timeout: seconds of the end-to-end budget of each solve,
+        it can also be given per solve with `anti_recaptcha(page, budget=Budget(...))`
+    :param hooks: receivers of the per-phase spans and events, see `metrics.MetricsAggregator`
+    :param kwargs: options of the challenger, e.g. `cascade=True` for VisualChallenger
+    """
+    # The cache dir of challenge is created on first use, `config.init()` is optional
     dir_payload = os.path.join(dir_challenge_cache, style)
     os.makedirs(dir_payload, exist_ok=True)
 
     # Check challenge style
     if style in [ChallengeStyle.AUDIO]:
-        return AudioChallenger(dir_challenge_cache=dir_payload, debug=debug)
+        return AudioChallenger(
+            dir_challenge_cache=dir_payload,
+            debug=debug,
+            solve_timeout=solve_timeout,
+            hooks=hooks,
+            **kwargs,
+        )
     elif style in [ChallengeStyle.VISUAL]:
         return VisualChallenger(
             dir_challenge_cache=dir_payload,
             debug=debug,
             dir_model=dir_model,
             onnx_prefix=onnx_prefix,
+            solve_timeout=solve_timeout,
+            hooks=hooks,
+            **kwargs,
         )
     else:
         raise TypeError(
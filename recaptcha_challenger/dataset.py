@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Deduplicated tile dataset packed into shards of decoded pixels.
+
+Every shard is a pair of files:
+
+    <store>/shard-<ts>-<pid>-<seq>.npy    the decoded BGR tiles, flat uint8, memory-mapped on read
+    <store>/shard-<ts>-<pid>-<seq>.json   digest, offset, shape, label and verdict of each tile
+    <store>/verdicts.jsonl                  later verdicts of stored tiles, keyed by digest
+
+With `compress=True` the pixels are written as `.npz` instead, a third of the size but
+loaded in full rather than mapped. Tiles are keyed by the md5 of their pixels, a tile
+that is already in the store is not appended again, but a better verdict of it,
+e.g. verified by a passing round, replaces the stored one.
+A tile is addressed as `<shard>#<index>`.
+
+    python -m recaptcha_challenger.dataset pack --corpus datas/corpus --store datas/tiles
+    python -m recaptcha_challenger.dataset stats --store datas/tiles
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+from contextlib import suppress
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from .utils import on_exit
+
+SHARD_PREFIX = "shard-"
+FN_VERDICTS = "verdicts.jsonl"
+# Fields of a record that a later verdict does not replace
+_LAYOUT = ("digest", "offset", "shape")
+
+
+def _rank(record: dict) -> int:
+    """How much a verdict is worth: verified > model verdict > none"""
+    if record.get("verified"):
+        return 2
+    return int(record.get("positive") is not None)
+
+
+class TileStore:
+    """
+    Append-only store of challenge tiles, safe to share between the challengers of a process.
+
+    Processes that append to the same directory write separate shards,
+    duplicates across them are only recognized when the store is opened again.
+    """
+
+    def __init__(
+        self,
+        dir_store: str,
+        shard_tiles: int = 1024,
+        compress: bool = False,
+        readonly: bool = False,
+    ):
+        """
+        :param dir_store:
+        :param shard_tiles: tiles buffered in memory before they are written as one shard
+        :param compress: write `.npz` shards, smaller on disk but not memory-mappable
+        :param readonly: for readers, e.g. evaluation workers: the metadata of a shard is
+            only loaded when the shard is read and nothing is flushed at exit
+        """
+        self.dir_store = dir_store
+        self.shard_tiles = shard_tiles
+        self.compress = compress
+        self.readonly = readonly
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending: typing.List[np.ndarray] = []
+        self._pending_meta: typing.List[dict] = []
+        self._pending_bytes = 0
+        # digest --> index in `_pending_meta`
+        self._pending_index: typing.Dict[str, int] = {}
+        # Verdict log entries not written yet
+        self._pending_verdicts: typing.List[dict] = []
+        # shard --> pixels, mapped on first read
+        self._pixels: typing.Dict[str, np.ndarray] = {}
+        self._meta: typing.Dict[str, typing.List[dict]] = {}
+        # digest --> latest logged verdict, loaded on first use
+        self._verdicts: typing.Optional[typing.Dict[str, dict]] = None
+
+        self.appended = 0
+        self.duplicates = 0
+        self.upgraded = 0
+        # digest --> record of the written tiles
+        self._digests: typing.Dict[str, dict] = {}
+        if readonly:
+            return
+        for shard in self.shards():
+            self._digests.update((record["digest"], record) for record in self.records(shard))
+        on_exit(self.flush)
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isdir(path) and any(
+            fn.startswith(SHARD_PREFIX) and fn.endswith(".json") for fn in os.listdir(path)
+        )
+
+    def shards(self) -> typing.List[str]:
+        """Names of the complete shards, oldest first"""
+        if not os.path.isdir(self.dir_store):
+            return []
+        return sorted(
+            fn[: -len(".json")]
+            for fn in os.listdir(self.dir_store)
+            if fn.startswith(SHARD_PREFIX) and fn.endswith(".json")
+        )
+
+    def records(self, shard: str) -> typing.List[dict]:
+        """Records of a shard, with the verdicts logged after it was written"""
+        if shard not in self._meta:
+            with open(os.path.join(self.dir_store, f"{shard}.json"), "r", encoding="utf8") as file:
+                records = json.load(file)["tiles"]
+            verdicts = self.verdicts()
+            for record in records:
+                if record["digest"] in verdicts:
+                    record.update(verdicts[record["digest"]])
+            self._meta[shard] = records
+        return self._meta[shard]
+
+    def verdicts(self) -> typing.Dict[str, dict]:
+        """digest --> the latest verdict that replaced the one of its shard"""
+        if self._verdicts is None:
+            self._verdicts = {}
+            path = os.path.join(self.dir_store, FN_VERDICTS)
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf8") as file:
+                    for line in file:
+                        with suppress(json.decoder.JSONDecodeError):
+                            entry = json.loads(line)
+                            self._verdicts[entry.pop("digest")] = entry
+        return self._verdicts
+
+    def __len__(self) -> int:
+        if self.readonly:
+            return sum(len(self.records(shard)) for shard in self.shards())
+        return len(self._digests) + len(self._pending_meta)
+
+    def __contains__(self, digest: str) -> bool:
+        if self.readonly:
+            return any(
+                record["digest"] == digest
+                for shard in self.shards()
+                for record in self.records(shard)
+            )
+        return digest in self._digests or digest in self._pending_index
+
+    @staticmethod
+    def decode(image: typing.Union[bytes, np.ndarray]) -> np.ndarray:
+        if isinstance(image, np.ndarray):
+            return image
+        return cv2.imdecode(np.frombuffer(image, np.uint8), flags=1)
+
+    def append(
+        self,
+        image: typing.Union[bytes, np.ndarray],
+        label: typing.Optional[str] = None,
+        positive: typing.Optional[bool] = None,
+        verified: typing.Optional[bool] = None,
+        **meta,
+    ) -> bool:
+        """
+        :param image: encoded tile, e.g. `Locator.screenshot()`, or a decoded BGR array
+        :param label: model label of the challenge
+        :param positive: verdict of the tile, None if unknown
+        :param verified: the verdict is ground truth, e.g. the round it belongs to succeeded
+        :param meta: further JSON fields of the record, e.g. confidence or model
+        :return: False if the tile is already in the store,
+            its verdict is replaced if the new one is worth more, see `upgraded`
+        """
+        if self.readonly:
+            raise PermissionError(f"TileStore is read-only - {self.dir_store}")
+        img = self.decode(image)
+        if img is None:
+            return False
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        digest = hashlib.md5(img.tobytes()).hexdigest()
+        verdict = {
+            "label": label,
+            "positive": positive,
+            "verified": verified,
+            "ts": int(time.time()),
+            **meta,
+        }
+        with self._lock:
+            if digest in self._pending_index:
+                self._upgrade(self._pending_meta[self._pending_index[digest]], verdict)
+                return False
+            if digest in self._digests:
+                if self._upgrade(self._digests[digest], verdict):
+                    self._pending_verdicts.append({"digest": digest, **verdict})
+                return False
+            self._pending_index[digest] = len(self._pending_meta)
+            self._pending_meta.append(
+                {
+                    "digest": digest,
+                    "offset": self._pending_bytes,
+                    "shape": list(img.shape),
+                    **verdict,
+                }
+            )
+            self._pending.append(img.reshape(-1))
+            self._pending_bytes += img.size
+            self.appended += 1
+            if len(self._pending) >= self.shard_tiles:
+                self._write_shard()
+        return True
+
+    def _upgrade(self, record: dict, verdict: dict) -> bool:
+        """Replace the verdict of a stored tile if the new one is worth more"""
+        self.duplicates += 1
+        if _rank(verdict) <= _rank(record):
+            return False
+        verdict = {**verdict, "label": verdict["label"] or record.get("label")}
+        for field in [field for field in record if field not in _LAYOUT]:
+            del record[field]
+        record.update(verdict)
+        self.upgraded += 1
+        return True
+
+    def flush(self):
+        """Write the buffered tiles as a shard and the replaced verdicts to the log"""
+        with self._lock:
+            if self._pending:
+                self._write_shard()
+            if self._pending_verdicts:
+                self._write_verdicts()
+
+    def _write_verdicts(self):
+        entries, self._pending_verdicts = self._pending_verdicts, []
+        os.makedirs(self.dir_store, exist_ok=True)
+        # One write per flush, appends of concurrent processes do not interleave within a line
+        lines = "".join(f"{json.dumps(entry, ensure_ascii=False)}\n" for entry in entries)
+        with open(os.path.join(self.dir_store, FN_VERDICTS), "a", encoding="utf8") as file:
+            file.write(lines)
+        verdicts = self.verdicts()
+        for entry in entries:
+            verdicts[entry["digest"]] = {k: v for k, v in entry.items() if k != "digest"}
+
+    def close(self):
+        if not self.readonly:
+            self.flush()
+        self._pixels.clear()
+
+    def _write_shard(self):
+        pixels = np.concatenate(self._pending)
+        meta, self._pending, self._pending_meta, self._pending_bytes = self._pending_meta, [], [], 0
+        self._pending_index = {}
+        self._seq += 1
+        shard = f"{SHARD_PREFIX}{int(time.time())}-{os.getpid()}-{self._seq:04d}"
+        os.makedirs(self.dir_store, exist_ok=True)
+        path = os.path.join(self.dir_store, shard)
+        # The metadata is written last, a shard without it is incomplete and ignored
+        if self.compress:
+            with open(f"{path}.tmp", "wb") as file:
+                np.savez_compressed(file, pixels=pixels)
+            os.replace(f"{path}.tmp", f"{path}.npz")
+        else:
+            with open(f"{path}.tmp", "wb") as file:
+                np.save(file, pixels)
+            os.replace(f"{path}.tmp", f"{path}.npy")
+        with open(f"{path}.json.tmp", "w", encoding="utf8") as file:
+            json.dump({"tiles": meta}, file, ensure_ascii=False)
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        self._meta[shard] = meta
+        self._digests.update((record["digest"], record) for record in meta)
+        logger.debug(f"Tile shard written - {shard=} tiles={len(meta)} bytes={pixels.size}")
+
+    def _shard_pixels(self, shard: str) -> np.ndarray:
+        if shard not in self._pixels:
+            path = os.path.join(self.dir_store, shard)
+            if os.path.isfile(f"{path}.npy"):
+                self._pixels[shard] = np.load(f"{path}.npy", mmap_mode="r")
+            else:
+                with np.load(f"{path}.npz") as data:
+                    self._pixels[shard] = data["pixels"]
+        return self._pixels[shard]
+
+    def read(self, key: str) -> np.ndarray:
+        """Tile of a `<shard>#<index>` key, a read-only view of the shard"""
+        shard, _, index = key.rpartition("#")
+        record = self.records(shard)[int(index)]
+        return self._view(shard, record)
+
+    def _view(self, shard: str, record: dict) -> np.ndarray:
+        size = int(np.prod(record["shape"]))
+        pixels = self._shard_pixels(shard)
+        return pixels[record["offset"] : record["offset"] + size].reshape(record["shape"])
+
+    def iter_tiles(
+        self,
+        label: typing.Optional[str] = None,
+        positive: typing.Optional[bool] = None,
+        verified: typing.Optional[bool] = None,
+    ) -> typing.Iterator[typing.Tuple[str, np.ndarray, dict]]:
+        """
+        Stream the written tiles shard by shard, the filters skip a tile before it is read
+
+        :return: (key, tile, record)
+        """
+        for shard in self.shards():
+            for index, record in enumerate(self.records(shard)):
+                if label is not None and record["label"] != label:
+                    continue
+                if positive is not None and record["positive"] != positive:
+                    continue
+                if verified is not None and record["verified"] != verified:
+                    continue
+                yield f"{shard}#{index}", self._view(shard, record), record
+
+    def pack(self, src_dir: str) -> int:
+        """
+        Import a corpus of `<label>/yes|bad/*.png` tiles, see `benchmark.load_corpus`
+
+        :return: tiles appended
+        """
+        from .benchmark import NEGATIVE, POSITIVE
+        from .solutions.evaluation import iter_images
+
+        appended = 0
+        for path_img in iter_images(src_dir):
+            verdict_dir = os.path.dirname(path_img)
+            verdict = os.path.basename(verdict_dir)
+            if verdict not in (POSITIVE, NEGATIVE):
+                continue
+            label = os.path.basename(os.path.dirname(verdict_dir)).replace("_", " ")
+            with open(path_img, "rb") as file:
+                appended += self.append(
+                    file.read(), label=label, positive=verdict == POSITIVE, verified=True
+                )
+        self.flush()
+        return appended
+
+    def stats(self) -> dict:
+        labels: typing.Dict[str, typing.Dict[str, int]] = {}
+        total = 0
+        for shard in self.shards():
+            for record in self.records(shard):
+                stat = labels.setdefault(record["label"] or "", {"tiles": 0, "positive": 0})
+                stat["tiles"] += 1
+                stat["positive"] += bool(record["positive"])
+                total += 1
+        return {"shards": len(self.shards()), "tiles": total, "labels": labels}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("command", choices=["pack", "stats"])
+    parser.add_argument("--store", required=True, help="directory of the shards")
+    parser.add_argument("--corpus", help="pack: directory of the labeled tile corpus")
+    parser.add_argument("--shard-tiles", type=int, default=1024)
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        if not args.corpus:
+            parser.error("pack requires --corpus")
+        store = TileStore(args.store, shard_tiles=args.shard_tiles, compress=args.compress)
+        appended = store.pack(args.corpus)
+        report = {"appended": appended, "duplicates": store.duplicates, "upgraded": store.upgraded}
+        print(json.dumps(report))
+    else:
+        store = TileStore(args.store, readonly=True)
+        print(json.dumps(store.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
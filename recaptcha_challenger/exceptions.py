@@ -25,6 +25,16 @@ class ChallengeException(Exception):
 class ChallengeTimeoutException(ChallengeException):
     """挑战执行中的某一个步骤超时"""
 
+    def __init__(
+        self,
+        msg: Optional[str] = None,
+        stacktrace: Optional[Sequence[str]] = None,
+        phase: Optional[str] = None,
+    ) -> None:
+        # The step of the challenge that overran
+        self.phase = phase
+        super().__init__(msg, stacktrace)
+
 
 class RiskControlSystemArmor(ChallengeException):
     """出现不可抗力的风控拦截"""
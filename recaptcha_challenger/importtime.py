@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Import time of the package entry points, each measured in a fresh interpreter.
+
+    python -m recaptcha_challenger.importtime --repeats 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import typing
+
+ENTRY_POINTS = {
+    "package": "import recaptcha_challenger",
+    "audio": "from recaptcha_challenger import AudioChallenger",
+    "visual": "from recaptcha_challenger import VisualChallenger",
+    "new_challenger": "from recaptcha_challenger.core import new_challenger",
+    "yolo": "from recaptcha_challenger.solutions.yolo import YOLO",
+    "benchmark": "import recaptcha_challenger.benchmark",
+}
+
+# Dependencies that an entry point should only load if it needs them
+HEAVY_MODULES = ["playwright", "pydub", "speech_recognition", "requests", "cv2", "numpy", "yaml"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+cost = time.perf_counter() - start
+print(json.dumps({{"ms": cost * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(statement: str, repeats: int = 5) -> dict:
+    """Median wall time of `statement` in `repeats` fresh interpreters"""
+    costs, loaded = [], []
+    for _ in range(repeats):
+        probe = _PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+        output = subprocess.run(
+            [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        costs.append(report["ms"])
+        loaded = report["loaded"]
+    return {
+        "statement": statement,
+        "p50_ms": round(statistics.median(costs), 1),
+        "min_ms": round(min(costs), 1),
+        "loaded": loaded,
+    }
+
+
+def run(entry_points: typing.Optional[typing.List[str]] = None, repeats: int = 5) -> dict:
+    entry_points = entry_points or list(ENTRY_POINTS)
+    return {name: measure(ENTRY_POINTS[name], repeats) for name in entry_points}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--entry-points", nargs="+", choices=list(ENTRY_POINTS), default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for name, report in run(args.entry_points, args.repeats).items():
+        loaded = ", ".join(report["loaded"]) or "-"
+        print(f"{name:<16}{report['p50_ms']:>10.1f} ms   {loaded}")
+
+
+if __name__ == "__main__":
+    main()
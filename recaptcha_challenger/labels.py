@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# Description: Challenge prompt --> model label
+import re
+import typing
+import unicodedata
+
+_ARTICLES = ("a ", "an ", "the ")
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+# "es" is a suffix of its own only after a sibilant, e.g. glasses, boxes, benches, buses
+_SIBILANT_ES = ("sses", "xes", "zes", "ches", "shes", "uses")
+
+
+def singular(word: str) -> str:
+    """Rule-based singular of an English noun, enough for the challenge prompts"""
+    if not word.isascii() or len(word) <= 3 or word.endswith(("ss", "us")):
+        return word
+    if word.endswith("ies"):
+        return f"{word[:-3]}y"
+    if word.endswith(_SIBILANT_ES):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def singulars(word: str) -> typing.List[str]:
+    """
+    Candidate singulars of a word, the rule-based one first.
+    The rules cannot tell houses --> house from buses --> bus,
+    nor movies --> movie from bodies --> body, the other spelling is kept as well.
+    """
+    candidates = [singular(word)]
+    if word.endswith("es") and candidates[0] != word[:-1] and len(word) > 3:
+        candidates.append(word[:-1])
+    return candidates
+
+
+def _split(prompt: str) -> typing.Tuple[str, str]:
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+    for article in _ARTICLES:
+        if text.startswith(article):
+            text = text[len(article) :]
+            break
+    head, _, last = text.rpartition(" ")
+    return head, last
+
+
+def normalize(prompt: str) -> str:
+    """
+    Canonical key of a prompt: NFKC, casefold, no punctuation, no leading article,
+    the last word in the singular, e.g. "Traffic Lights." --> "traffic light"
+    """
+    return keys(prompt)[0]
+
+
+def keys(prompt: str) -> typing.List[str]:
+    """Every key a prompt may be indexed under, `normalize(prompt)` first"""
+    head, last = _split(prompt)
+    return [f"{head} {word}" if head else word for word in singulars(last)]
+
+
+class LabelResolver:
+    """
+    Index of every known spelling of the challenge labels, compiled once.
+
+    Resolution is a normalization plus one dict lookup per language,
+    so plural, article, casing and punctuation variants of a prompt
+    no longer cost a reload.
+    """
+
+    def __init__(
+        self,
+        label_alias: typing.Dict[str, typing.Dict[str, str]],
+        classes: typing.Optional[typing.Iterable[str]] = None,
+        objects: typing.Optional[typing.Dict[str, typing.Dict[str, typing.List[str]]]] = None,
+    ):
+        """
+        :param label_alias: lang --> {prompt: model label}, the hand-written aliases
+        :param classes: labels a model can answer as they are, e.g. `YOLO.classes`
+        :param objects: model label --> {lang: [prompt, ...]}, see `PluggableObjects.parse_objects`
+        """
+        # lang --> {normalized prompt: model label}, the hand-written aliases take precedence
+        self.index: typing.Dict[str, typing.Dict[str, str]] = {}
+        for model_label, i18n in (objects or {}).items():
+            for lang, prompts in i18n.items():
+                self._add(lang, model_label, model_label)
+                for prompt in prompts:
+                    self._add(lang, str(prompt), model_label)
+        for label in classes or []:
+            self._add("en", label, label)
+        for lang, aliases in label_alias.items():
+            for prompt, model_label in aliases.items():
+                self._add(lang, prompt, model_label, override=True)
+                self._add(lang, model_label, model_label, override=True)
+
+    def _add(self, lang: str, prompt: str, model_label: str, override: bool = False):
+        table = self.index.setdefault(lang, {})
+        key = normalize(prompt)
+        if override or key not in table:
+            table[key] = model_label
+
+    def resolve(self, prompt: str, lang: typing.Optional[str] = None) -> typing.Optional[str]:
+        """
+        :param prompt: text of the challenge prompt
+        :param lang: language tried first, the other languages are tried afterwards
+        :return: model label, None if the prompt is unknown
+        """
+        if not prompt:
+            return None
+        candidates = keys(prompt)
+        tables = [self.index[lang]] if lang in self.index else []
+        tables.extend(table for name, table in self.index.items() if name != lang)
+        for table in tables:
+            for key in candidates:
+                if key in table:
+                    return table[key]
+        return None
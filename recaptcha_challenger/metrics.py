@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Description:
+import bisect
+import math
+import threading
+import typing
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Span:
+    """Timing of one phase of a solve"""
+
+    phase: str
+    # seconds
+    duration: float
+    style: str
+    label: str = ""
+    # False if the phase raised
+    ok: bool = True
+    tags: typing.Dict[str, typing.Any] = field(default_factory=dict)
+
+
+class MetricsHook:
+    """
+    Receiver of the spans and events emitted by the challengers.
+
+    Hooks are called on the solving thread and on the inference worker,
+    implementations must be thread-safe and return quickly.
+
+    ```python
+    class PrintHook(MetricsHook):
+        def on_span(self, span: Span):
+            print(span.phase, span.duration)
+
+    challenger = new_challenger(style, dir_challenge_cache, hooks=[PrintHook()])
+    ```
+    """
+
+    def on_span(self, span: Span):
+        """A phase finished"""
+
+    def on_event(self, name: str, style: str, label: str = "", **tags):
+        """A countable event happened, e.g. success, retry or reload"""
+
+    def on_gauge(self, name: str, value: float, **tags):
+        """A level was sampled, e.g. the disk usage of the challenge cache"""
+
+
+def _bound(value: typing.Optional[float]) -> typing.Union[float, str, None]:
+    """Bucket bound as valid JSON, the overflow bucket is "+Inf" as in Prometheus"""
+    return "+Inf" if value == math.inf else value
+
+
+class Histogram:
+    """Latency histogram with fixed buckets (seconds)"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> typing.Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile, q in [0, 100]"""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "p50": _bound(self.percentile(50)),
+            "p95": _bound(self.percentile(95)),
+            "p99": _bound(self.percentile(99)),
+            "buckets": dict(zip([str(_bound(b)) for b in self.BUCKETS], self.counts)),
+        }
+
+
+class MetricsAggregator(MetricsHook):
+    """Built-in hook that keeps latency histograms and counters per style and label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (style, label, phase) -> Histogram
+        self.histograms: typing.Dict[typing.Tuple[str, str, str], Histogram] = defaultdict(
+            Histogram
+        )
+        # (style, label, event) -> count
+        self.counters: typing.Dict[typing.Tuple[str, str, str], int] = defaultdict(int)
+        # name -> last value
+        self.gauges: typing.Dict[str, float] = {}
+
+    def on_span(self, span: Span):
+        with self._lock:
+            self.histograms[(span.style, span.label, span.phase)].observe(span.duration)
+            if not span.ok:
+                self.counters[(span.style, span.label, f"{span.phase}.error")] += 1
+
+    def on_event(self, name: str, style: str, label: str = "", **tags):
+        with self._lock:
+            self.counters[(style, label, name)] += 1
+
+    def on_gauge(self, name: str, value: float, **tags):
+        with self._lock:
+            self.gauges[name] = value
+
+    def histogram(
+        self, phase: str, style: typing.Optional[str] = None, label: typing.Optional[str] = None
+    ) -> Histogram:
+        """Merge the histograms of `phase`, optionally filtered by style and label"""
+        merged = Histogram()
+        with self._lock:
+            for (style_, label_, phase_), hist in self.histograms.items():
+                if phase_ != phase or style not in (None, style_) or label not in (None, label_):
+                    continue
+                merged.counts = [a + b for a, b in zip(merged.counts, hist.counts)]
+                merged.count += hist.count
+                merged.sum += hist.sum
+        return merged
+
+    def summary(self) -> dict:
+        """
+        JSON-serializable snapshot: {style: {label: {"spans": ..., "counters": ...}}},
+        the gauges are reported under the "gauges" key
+        """
+        report = defaultdict(lambda: defaultdict(lambda: {"spans": {}, "counters": {}}))
+        with self._lock:
+            for (style, label, phase), hist in self.histograms.items():
+                report[style][label]["spans"][phase] = hist.to_dict()
+            for (style, label, name), count in self.counters.items():
+                report[style][label]["counters"][name] = count
+            gauges = dict(self.gauges)
+        summary = {style: dict(labels) for style, labels in report.items()}
+        if gauges:
+            summary["gauges"] = gauges
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Reload-or-attempt decisions from the success rate and the solve time of each label.
+
+Attempting a challenge of label L costs t(L) and fails with 1 - p(L), after which a new
+challenge is drawn; reloading costs t(reload) and draws a new challenge as well. With V the
+expected time to success from a fresh challenge, attempting is worth it when
+
+    t(L) + (1 - p(L)) * V  <  t(reload) + V
+
+V itself is the fixed point of the same decision averaged over the observed label frequencies.
+
+    python -m recaptcha_challenger.policy --store datas/models/_policy.json --solves 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import typing
+from contextlib import suppress
+
+from .utils import on_exit
+
+ATTEMPT = "attempt"
+RELOAD = "reload"
+# VisualChallenger.TASK_OBJECT_DETECTION
+OBJECT_DETECTION = "ObjectDetection"
+
+
+class StatsStore:
+    """
+    Per-label counters persisted as a small JSON file.
+
+    Challengers of one process should share one instance, see `StatsStore.shared`,
+    separate processes should use separate files.
+    The counters are written at most every `save_interval` seconds and at exit.
+    """
+
+    # abspath --> the instance of this process
+    _shared: typing.Dict[str, "StatsStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: typing.Optional[str] = None, save_interval: float = 30):
+        """
+        :param path: JSON file of the counters, None keeps them in memory
+        :param save_interval: seconds between two writes of the recorded counters
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self.reload = {"count": 0, "seconds": 0.0}
+        # "task|label" --> {"seen", "attempts", "successes", "seconds"}
+        self.labels: typing.Dict[str, typing.Dict[str, float]] = {}
+        # Bumped by every recorded change, lets the policy cache its estimates
+        self.version = 0
+        self._saved_version = 0
+        self._saved_at = time.monotonic()
+        if path and os.path.isfile(path):
+            with open(path, "r", encoding="utf8") as file, suppress(json.decoder.JSONDecodeError):
+                data = json.load(file)
+                self.reload.update(data.get("reload", {}))
+                self.labels.update(data.get("labels", {}))
+        if path:
+            on_exit(self.flush)
+
+    @classmethod
+    def shared(cls, path: str, **kwargs) -> "StatsStore":
+        """The process-wide store of `path`, created on first use"""
+        key = os.path.abspath(path)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(path, **kwargs)
+            return cls._shared[key]
+
+    @staticmethod
+    def key(task: str, label: str) -> str:
+        return f"{task}|{label}"
+
+    def _entry(self, task: str, label: str) -> dict:
+        return self.labels.setdefault(
+            self.key(task, label), {"seen": 0, "attempts": 0, "successes": 0, "seconds": 0.0}
+        )
+
+    def observe(self, task: str, label: str):
+        """A challenge of this label was shown"""
+        with self._lock:
+            self._entry(task, label)["seen"] += 1
+            self.version += 1
+        self._maybe_save()
+
+    def record_attempt(self, task: str, label: str, success: bool, seconds: float):
+        with self._lock:
+            entry = self._entry(task, label)
+            entry["attempts"] += 1
+            entry["successes"] += int(success)
+            entry["seconds"] += seconds
+            self.version += 1
+        self._maybe_save()
+
+    def record_reload(self, seconds: float):
+        with self._lock:
+            self.reload["count"] += 1
+            self.reload["seconds"] += seconds
+            self.version += 1
+        self._maybe_save()
+
+    def _maybe_save(self):
+        """Write the counters if the last save is older than `save_interval`"""
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        """Write the counters recorded since the last save"""
+        if self.version != self._saved_version:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"reload": self.reload, "labels": self.labels}, indent=2)
+            version = self.version
+            self._saved_at = time.monotonic()
+        dir_store = os.path.dirname(self.path) or "."
+        os.makedirs(dir_store, exist_ok=True)
+        # A temp file of its own, concurrent writers never truncate each other's
+        fd, path_tmp = tempfile.mkstemp(
+            prefix=f"{os.path.basename(self.path)}.", suffix=".tmp", dir=dir_store
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf8") as file:
+                file.write(data)
+            os.replace(path_tmp, self.path)
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(path_tmp)
+        self._saved_version = max(self._saved_version, version)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "reload": dict(self.reload),
+                "labels": {k: dict(v) for k, v in self.labels.items()},
+            }
+
+
+class ReloadPolicy:
+    """
+    Decide before each attempt whether attempting or reloading reaches a success sooner.
+
+    Labels with fewer than `min_attempts` recorded attempts follow the fixed rule the
+    challenger used before (reload object-detection tasks, attempt the others),
+    and `explore` keeps a small share of attempts on labels that would be reloaded.
+    """
+
+    def __init__(
+        self,
+        store: StatsStore,
+        min_attempts: int = 5,
+        explore: float = 0.05,
+        reload_seconds: float = 1.5,
+        prior_success: float = 0.5,
+        prior_weight: float = 2,
+        fallback: typing.Optional[typing.Callable[[str, str], str]] = None,
+    ):
+        """
+        :param store:
+        :param min_attempts: attempts of a label before its statistics are trusted
+        :param explore: probability of attempting a label that the policy would reload
+        :param reload_seconds: reload cost until reloads have been recorded
+        :param prior_success: Beta prior of the success rate ...
+        :param prior_weight: ... and its weight in pseudo-attempts
+        :param fallback: (task, label) --> ATTEMPT | RELOAD for untrusted labels
+        """
+        self.store = store
+        self.min_attempts = min_attempts
+        self.explore = explore
+        self.reload_seconds = reload_seconds
+        self.prior_success = prior_success
+        self.prior_weight = prior_weight
+        self.fallback = fallback or fixed_rule
+        self._cache: typing.Tuple[int, dict, float, float] = (-1, {}, 0.0, 0.0)
+
+    @staticmethod
+    def estimates(snapshot: dict, prior_success: float = 0.5, prior_weight: float = 2) -> dict:
+        """key --> (frequency, success rate, seconds per attempt) of the attempted labels"""
+        labels = snapshot["labels"]
+        seen_total = sum(entry["seen"] for entry in labels.values()) or 1
+        estimates = {}
+        for key, entry in labels.items():
+            if not entry["attempts"]:
+                continue
+            p = (entry["successes"] + prior_success * prior_weight) / (
+                entry["attempts"] + prior_weight
+            )
+            t = entry["seconds"] / entry["attempts"]
+            estimates[key] = (entry["seen"] / seen_total, p, t)
+        return estimates
+
+    def reload_cost(self, snapshot: dict) -> float:
+        reload = snapshot["reload"]
+        return reload["seconds"] / reload["count"] if reload["count"] else self.reload_seconds
+
+    @staticmethod
+    def value(estimates: dict, reload_cost: float, iterations: int = 100) -> float:
+        """
+        Expected seconds to success from a fresh challenge under the optimal policy,
+        found by policy iteration starting from "attempt everything".
+        Labels that were never attempted are reloaded in the estimate.
+        """
+        if not estimates:
+            return float("inf")
+        skipped = max(0.0, 1 - sum(f for f, _, _ in estimates.values()))
+        attempt = {key: True for key in estimates}
+        v = float("inf")
+        for _ in range(iterations):
+            # v = sum_L f(L) * cost(L) + sum_L f(L) * P(new challenge | L) * v, solved for v
+            cost, stay = skipped * reload_cost, skipped
+            for key, (f, p, t) in estimates.items():
+                if attempt[key]:
+                    cost += f * t
+                    stay += f * (1 - p)
+                else:
+                    cost += f * reload_cost
+                    stay += f
+            if stay >= 1:
+                return float("inf")
+            v = cost / (1 - stay)
+            improved = {
+                key: t + (1 - p) * v < reload_cost + v for key, (_, p, t) in estimates.items()
+            }
+            if improved == attempt:
+                break
+            attempt = improved
+        return v
+
+    def decide(self, task: str, label: str) -> str:
+        """ATTEMPT or RELOAD for the challenge on the screen"""
+        snapshot = self.store.snapshot()
+        entry = snapshot["labels"].get(StatsStore.key(task, label))
+        if not entry or entry["attempts"] < self.min_attempts:
+            decision = self.fallback(task, label)
+        else:
+            decision = self._decide(snapshot, task, label)
+        # Without exploration, a label that is always reloaded never gets statistics
+        if decision == RELOAD and random.random() < self.explore:
+            return ATTEMPT
+        return decision
+
+    def _decide(self, snapshot: dict, task: str, label: str) -> str:
+        """Compare the expected time to success of attempting and of reloading"""
+        version, estimates, reload_cost, v = self._cache
+        if version != self.store.version:
+            estimates = self.estimates(snapshot, self.prior_success, self.prior_weight)
+            reload_cost = self.reload_cost(snapshot)
+            v = self.value(estimates, reload_cost)
+            self._cache = (self.store.version, estimates, reload_cost, v)
+        # Observed but never attempted, e.g. with min_attempts=0
+        if StatsStore.key(task, label) not in estimates:
+            return self.fallback(task, label)
+        _, p, t = estimates[StatsStore.key(task, label)]
+        return ATTEMPT if t + (1 - p) * v < reload_cost + v else RELOAD
+
+
+def simulate(
+    snapshot: dict,
+    decide: typing.Callable[[str, str], str],
+    solves: int = 1000,
+    max_steps: int = 100,
+    seed: int = 0,
+) -> dict:
+    """
+    Replay recorded statistics: labels are drawn from the observed frequencies and
+    attempts succeed with the recorded success rates, taking the recorded mean times.
+
+    :param snapshot: `StatsStore.snapshot()`
+    :param decide: (task, label) --> ATTEMPT | RELOAD
+    :return: mean seconds, attempts and reloads per solve
+    """
+    rng = random.Random(seed)
+    labels = snapshot["labels"]
+    keys = list(labels)
+    weights = [labels[k]["seen"] for k in keys]
+    if not keys or not sum(weights):
+        return {}
+    reload = snapshot["reload"]
+    reload_cost = reload["seconds"] / reload["count"] if reload["count"] else 1.5
+
+    seconds = attempts = reloads = failures = 0
+    for _ in range(solves):
+        for _ in range(max_steps):
+            key = rng.choices(keys, weights)[0]
+            entry = labels[key]
+            task, label = key.split("|", 1)
+            # Labels without recorded attempts can only be reloaded
+            if not entry["attempts"] or decide(task, label) == RELOAD:
+                seconds += reload_cost
+                reloads += 1
+                continue
+            seconds += entry["seconds"] / entry["attempts"]
+            attempts += 1
+            if rng.random() < entry["successes"] / entry["attempts"]:
+                break
+        else:
+            failures += 1
+    return {
+        "seconds": round(seconds / solves, 3),
+        "attempts": round(attempts / solves, 3),
+        "reloads": round(reloads / solves, 3),
+        "failures": failures,
+    }
+
+
+def fixed_rule(task: str, label: str) -> str:
+    """The challenger's rule without statistics: reload object-detection tasks"""
+    return RELOAD if task == OBJECT_DETECTION else ATTEMPT
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--store", required=True, help="statistics recorded by the challenger")
+    parser.add_argument("--solves", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    snapshot = StatsStore(args.store).snapshot()
+    policy = ReloadPolicy(StatsStore(args.store), min_attempts=0, explore=0)
+    for name, decide in (("fixed", fixed_rule), ("adaptive", policy.decide)):
+        report = simulate(snapshot, decide, solves=args.solves, seed=args.seed)
+        print(json.dumps({"policy": name, **report}))
+
+
+if __name__ == "__main__":
+    main()
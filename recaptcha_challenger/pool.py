@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Description: Pool of warm challengers
+import queue
+import threading
+import typing
+from contextlib import contextmanager, suppress
+
+from playwright.sync_api import Page
+
+from .budget import Budget
+from .core import AudioChallenger, SolveContext, VisualChallenger, new_challenger
+
+Challenger = typing.Union[AudioChallenger, VisualChallenger]
+
+
+class ChallengerPool:
+    """
+    Warm challengers handed out one solve at a time.
+
+    Models, routing tables, routed classifiers and HTTP sessions are set up once per instance,
+    every solve starts from a clean `SolveContext`, so the construction cost
+    stays out of the per-solve latency.
+
+    ```python
+    pool = ChallengerPool("visual", config.DIR_CHALLENGE_CACHE, dir_model=config.DIR_MODEL, size=2)
+    pool.warm()
+    ctx = pool.solve(page)
+    print(ctx.outcome, ctx.response)
+    ```
+    """
+
+    def __init__(self, style: str, dir_challenge_cache: str, size: int = 1, **kwargs):
+        """
+        :param style: see `ChallengeStyle`
+        :param dir_challenge_cache:
+        :param size: maximum number of instances, i.e. of concurrent solves
+        :param kwargs: options of `new_challenger`
+        """
+        self.style = style
+        self.dir_challenge_cache = dir_challenge_cache
+        self.size = size
+        self.kwargs = kwargs
+
+        self._idle: "queue.LifoQueue[Challenger]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _create(self) -> typing.Optional[Challenger]:
+        """A new instance if the pool is not full yet"""
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return new_challenger(self.style, self.dir_challenge_cache, **self.kwargs)
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm(self, count: typing.Optional[int] = None) -> "ChallengerPool":
+        """Build instances ahead of the first solves, all of them by default"""
+        count = self.size if count is None else min(count, self.size)
+        while self._created < count and (challenger := self._create()) is not None:
+            self._idle.put(challenger)
+        return self
+
+    @contextmanager
+    def acquire(self, timeout: typing.Optional[float] = None) -> typing.Iterator[Challenger]:
+        """
+        Borrow an instance, it goes back to the pool when the block exits
+
+        :param timeout: seconds to wait for an idle instance once the pool is full
+        :raise queue.Empty: no instance became idle in time
+        :raise RuntimeError: the pool is closed
+        """
+        if self._closed:
+            raise RuntimeError("The pool of challengers is closed")
+        challenger = None
+        with suppress(queue.Empty):
+            challenger = self._idle.get_nowait()
+        if challenger is None:
+            challenger = self._create() or self._idle.get(timeout=timeout)
+        try:
+            yield challenger
+        finally:
+            challenger.reset()
+            if self._closed:
+                challenger.close()
+            else:
+                self._idle.put(challenger)
+
+    def solve(
+        self,
+        page: Page,
+        budget: typing.Optional[Budget] = None,
+        timeout: typing.Optional[float] = None,
+    ) -> SolveContext:
+        """
+        Solve the challenge on `page` with an idle instance
+
+        :param page:
+        :param budget: see `ArmorKernel.anti_recaptcha`
+        :param timeout: see `acquire`
+        :return: the context of the solve, `outcome` and `response` included
+        """
+        with self.acquire(timeout=timeout) as challenger:
+            challenger.anti_recaptcha(page, budget=budget)
+            return challenger.ctx
+
+    def close(self):
+        """Release the workers of the idle instances, borrowed ones are closed when returned"""
+        self._closed = True
+        with suppress(queue.Empty):
+            while True:
+                self._idle.get_nowait().close()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Description:
+import cProfile
+import os
+import sys
+import threading
+import time
+import typing
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler.
+
+    A daemon thread wakes up every `interval` seconds and records the Python stack
+    of the profiled threads. Nothing is hooked into the interpreter, so the profiled
+    code runs at full speed between two samples. The result is written in the
+    collapsed-stack format consumed by flamegraph.pl, speedscope or inferno.
+    """
+
+    ENGINE = "sample"
+    SUFFIX = ".folded"
+
+    def __init__(
+        self, interval: float = 0.005, thread_prefixes: typing.Optional[typing.List[str]] = None
+    ):
+        """
+        :param interval: seconds between two samples
+        :param thread_prefixes: names of extra threads to sample besides the one calling `start`,
+            e.g. the inference worker of VisualChallenger
+        """
+        self.interval = interval
+        self.thread_prefixes = tuple(thread_prefixes or [])
+        self.stacks: typing.Counter[str] = Counter()
+        self.samples = 0
+
+        self._target_id: typing.Optional[int] = None
+        self._stop = threading.Event()
+        self._sampler: typing.Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _threads(self) -> typing.Dict[int, str]:
+        threads = {}
+        for thread in threading.enumerate():
+            if thread.ident == self._target_id or (
+                self.thread_prefixes and thread.name.startswith(self.thread_prefixes)
+            ):
+                threads[thread.ident] = thread.name
+        return threads
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()  # noqa
+            for ident, name in self._threads().items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._target_id = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def dump(self, path: str) -> str:
+        with open(path, "w", encoding="utf8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+
+class DeterministicProfiler:
+    """cProfile wrapper with the same interface as `SamplingProfiler`, writes a pstats file"""
+
+    ENGINE = "cprofile"
+    SUFFIX = ".prof"
+
+    def __init__(self, **kwargs):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, path: str) -> str:
+        self._profile.dump_stats(path)
+        return path
+
+
+def new_profiler(
+    engine: str = SamplingProfiler.ENGINE, **kwargs
+) -> typing.Union[SamplingProfiler, DeterministicProfiler]:
+    if engine == SamplingProfiler.ENGINE:
+        return SamplingProfiler(**kwargs)
+    if engine == DeterministicProfiler.ENGINE:
+        return DeterministicProfiler(**kwargs)
+    raise TypeError(
+        f"engine({engine}) should be {SamplingProfiler.ENGINE} or {DeterministicProfiler.ENGINE}"
+    )
+
+
+def profile_filename(suffix: str, **tags) -> str:
+    """<timestamp>.<tag>...<suffix>, tags are sanitized for the filesystem"""
+    parts = [str(int(time.time() * 1000))]
+    for value in tags.values():
+        value = str(value or "none").strip().replace(" ", "_")
+        parts.append("".join(c for c in value if c.isalnum() or c in "_-"))
+    return ".".join(parts) + suffix
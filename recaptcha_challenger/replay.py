@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Record a live challenge session into a compact archive and replay it offline.
+
+The widget is driven by its own network traffic: the demo page, the anchor and
+bframe documents, the scripts, the `reload`/`userverify` answers, the tile payloads.
+Recording that traffic (plus the audio file, which is downloaded outside of the
+browser) is enough to rebuild every DOM state the challengers read, so a replay
+serves the archive through intercepted routes and needs no network at all.
+
+    python -m recaptcha_challenger.replay record --style visual --output visual.zip
+    python -m recaptcha_challenger.replay replay --archive visual.zip --rounds 10
+    python -m recaptcha_challenger.replay --log-enqueue replay --archive visual.zip --rounds 10
+"""
+
+import argparse
+import json
+import time
+import typing
+import zipfile
+from collections import defaultdict, deque
+from contextlib import suppress
+from dataclasses import dataclass, asdict, field
+from urllib.parse import urlsplit
+
+from loguru import logger
+from playwright.sync_api import BrowserContext, Error, Response, Route
+
+from .metrics import MetricsHook, Span
+
+DEMO_URL = "https://www.google.com/recaptcha/api2/demo"
+
+
+@dataclass
+class Entry:
+    """One recorded response"""
+
+    method: str
+    url: str
+    status: int
+    headers: typing.Dict[str, str]
+    # Name of the body inside the archive
+    body: str
+    # ms since the start of the recording
+    offset: float
+    # ms between the request and the end of the response
+    duration: float = 0.0
+
+
+@dataclass
+class Session:
+    style: str = ""
+    start_url: str = DEMO_URL
+    entries: typing.List[Entry] = field(default_factory=list)
+    # Phase timings reported by the challenger while recording
+    spans: typing.List[dict] = field(default_factory=list)
+    outcome: typing.Optional[str] = None
+
+
+def _path_key(method: str, url: str) -> str:
+    parts = urlsplit(url)
+    return f"{method} {parts.scheme}://{parts.netloc}{parts.path}"
+
+
+class SessionRecorder(MetricsHook):
+    """
+    ```python
+    recorder = SessionRecorder("visual.zip", style="visual")
+    recorder.attach(ctx, challenger)
+    page.goto(DEMO_URL)
+    recorder.outcome = challenger.anti_recaptcha(page)
+    recorder.save()
+    ```
+    """
+
+    def __init__(self, path_archive: str, style: str = "", start_url: str = DEMO_URL):
+        self.path_archive = path_archive
+        self.session = Session(style=style, start_url=start_url)
+        self._bodies: typing.Dict[str, bytes] = {}
+        self._start = time.perf_counter()
+
+    @property
+    def outcome(self):
+        return self.session.outcome
+
+    @outcome.setter
+    def outcome(self, value):
+        self.session.outcome = value
+
+    def _offset(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    def _add(self, method: str, url: str, status: int, headers: dict, body: bytes, duration=0.0):
+        name = f"bodies/{len(self.session.entries)}"
+        self._bodies[name] = body
+        self.session.entries.append(
+            Entry(method, url, status, headers, name, self._offset(), round(duration, 3))
+        )
+
+    def on_response(self, response: Response):
+        try:
+            body = response.body()
+        except Exception as err:  # noqa: redirects and aborted requests carry no body
+            logger.debug(f"Skip response without body - url={response.url} {err=}")
+            return
+        timing = response.request.timing
+        duration = max(timing.get("responseEnd", 0), 0)
+        self._add(
+            response.request.method,
+            response.url,
+            response.status,
+            response.headers,
+            body,
+            duration,
+        )
+
+    def on_span(self, span: Span):
+        self.session.spans.append(asdict(span))
+
+    def attach(self, ctx: BrowserContext, challenger=None):
+        """Record the browser traffic and, if given, the timings and audio downloads of `challenger`"""
+        ctx.on("response", self.on_response)
+        if challenger is None:
+            return
+        challenger.hooks.append(self)
+        if hasattr(challenger, "request_asset"):
+            request_asset = challenger.request_asset
+
+            def recording(asset_download_url: str, asset_path: str, **kwargs):
+                start = time.perf_counter()
+                request_asset(asset_download_url, asset_path, **kwargs)
+                with open(asset_path, "rb") as file:
+                    body = file.read()
+                duration = (time.perf_counter() - start) * 1000
+                self._add("GET", asset_download_url, 200, {}, body, duration)
+
+            challenger.request_asset = recording
+
+    def save(self) -> str:
+        with zipfile.ZipFile(self.path_archive, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("session.json", json.dumps(asdict(self.session), ensure_ascii=False))
+            for name, body in self._bodies.items():
+                archive.writestr(name, body)
+        logger.debug(
+            f"Session recorded - entries={len(self.session.entries)} path={self.path_archive}"
+        )
+        return self.path_archive
+
+
+class SessionReplayer:
+    """
+    Serve a recorded session to the challengers, offline and deterministically.
+
+    Responses are matched by method and exact URL first, then by method and path
+    in the order they were recorded, so tokens generated by the widget at runtime
+    do not break the replay. Requests with no recorded response are aborted.
+    """
+
+    def __init__(self, path_archive: str, realtime: bool = False):
+        """
+        :param path_archive:
+        :param realtime: delay each response by its recorded duration,
+            by default responses are served immediately
+        """
+        self.path_archive = path_archive
+        self.realtime = realtime
+        with zipfile.ZipFile(path_archive) as archive:
+            session = json.loads(archive.read("session.json"))
+            self.bodies = {name: archive.read(name) for name in archive.namelist()}
+        session["entries"] = [Entry(**e) for e in session["entries"]]
+        self.session = Session(**session)
+        self.misses: typing.List[str] = []
+        self.rewind()
+
+    def rewind(self):
+        """Serve the session from the start again"""
+        self._by_url: typing.Dict[str, typing.Deque[Entry]] = defaultdict(deque)
+        self._by_path: typing.Dict[str, typing.Deque[Entry]] = defaultdict(deque)
+        for entry in self.session.entries:
+            self._by_url[f"{entry.method} {entry.url}"].append(entry)
+            self._by_path[_path_key(entry.method, entry.url)].append(entry)
+        self.misses = []
+
+    def lookup(self, method: str, url: str) -> typing.Optional[Entry]:
+        exact = self._by_url.get(f"{method} {url}")
+        entry = exact.popleft() if exact else None
+        queue = self._by_path.get(_path_key(method, url))
+        if entry is None and queue:
+            entry = queue.popleft()
+            # Keep the exact-URL queue consistent with the path queue
+            with_url = self._by_url[f"{entry.method} {entry.url}"]
+            if entry in with_url:
+                with_url.remove(entry)
+        elif entry is not None and queue and entry in queue:
+            queue.remove(entry)
+        if entry is None:
+            self.misses.append(f"{method} {url}")
+        return entry
+
+    def _serve(self, entry: Entry) -> bytes:
+        """Body of an entry served outside of the browser, e.g. the challenge audio"""
+        if self.realtime and entry.duration:
+            time.sleep(entry.duration / 1000)
+        return self.bodies.get(entry.body, b"")
+
+    def _delay(self, route: Route, entry: Entry):
+        """
+        Hold a routed response for its recorded duration.
+
+        The handler waits through Playwright, which keeps dispatching the other requests
+        meanwhile, a sleep would stall every route of the context.
+        """
+        if not self.realtime or not entry.duration:
+            return
+        # Requests of a service worker have no frame to wait on, they are served immediately
+        with suppress(Error):
+            route.request.frame.wait_for_timeout(entry.duration)
+
+    def on_route(self, route: Route):
+        request = route.request
+        entry = self.lookup(request.method, request.url)
+        if entry is None:
+            route.abort()
+            return
+        headers = {
+            k: v
+            for k, v in entry.headers.items()
+            if k.lower() not in ["content-encoding", "content-length", "transfer-encoding"]
+        }
+        self._delay(route, entry)
+        route.fulfill(status=entry.status, headers=headers, body=self.bodies.get(entry.body, b""))
+
+    def attach(self, ctx: BrowserContext, challenger=None):
+        """Intercept every request of `ctx`, and the audio downloads of `challenger` if given"""
+        ctx.route("**/*", self.on_route)
+        if challenger is not None and hasattr(challenger, "request_asset"):
+
+            def replaying(asset_download_url: str, asset_path: str, **kwargs):
+                entry = self.lookup("GET", asset_download_url)
+                if entry is None:
+                    raise FileNotFoundError(f"No recorded asset for {asset_download_url}")
+                with open(asset_path, "wb") as file:
+                    file.write(self._serve(entry))
+
+            challenger.request_asset = replaying
+
+
+def record(style: str, path_archive: str, headless: bool = False, **kwargs) -> str:
+    from playwright.sync_api import sync_playwright
+
+    from .core import new_challenger
+    from .settings import config
+
+    config.make_dirs()
+    challenger = new_challenger(
+        style, dir_challenge_cache=config.DIR_CHALLENGE_CACHE, dir_model=config.DIR_MODEL, **kwargs
+    )
+    recorder = SessionRecorder(path_archive, style=style)
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        ctx = browser.new_context(locale="en-US")
+        recorder.attach(ctx, challenger)
+        page = ctx.new_page()
+        page.goto(recorder.session.start_url)
+        recorder.outcome = challenger.anti_recaptcha(page)
+        browser.close()
+    return recorder.save()
+
+
+def replay(
+    path_archive: str, rounds: int = 1, realtime: bool = False, headless: bool = True, **kwargs
+) -> typing.List[dict]:
+    """Replay a session `rounds` times with a warm challenger and time each solve"""
+    from playwright.sync_api import sync_playwright
+
+    from .core import new_challenger
+    from .settings import config
+
+    config.make_dirs()
+    replayer = SessionReplayer(path_archive, realtime=realtime)
+    style = replayer.session.style
+    challenger = new_challenger(
+        style, dir_challenge_cache=config.DIR_CHALLENGE_CACHE, dir_model=config.DIR_MODEL, **kwargs
+    )
+    reports = []
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        for _ in range(rounds):
+            replayer.rewind()
+            ctx = browser.new_context(locale="en-US")
+            replayer.attach(ctx, challenger)
+            page = ctx.new_page()
+            page.goto(replayer.session.start_url)
+            start = time.perf_counter()
+            outcome = challenger.anti_recaptcha(page)
+            reports.append(
+                {
+                    "style": style,
+                    "outcome": outcome,
+                    "recorded_outcome": replayer.session.outcome,
+                    "solve_s": round(time.perf_counter() - start, 4),
+                    "misses": len(replayer.misses),
+                }
+            )
+            ctx.close()
+        browser.close()
+    return reports
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--log-enqueue", action="store_true", help="background log writer")
+    parser.add_argument("--log-json", action="store_true", help="also write logs/events.jsonl")
+    parser.add_argument(
+        "--log-sample", nargs="+", default=[], metavar="LEVEL=RATE", help="e.g. DEBUG=0.1"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_record = subparsers.add_parser("record", help="record a live session")
+    parser_record.add_argument("--style", default="visual")
+    parser_record.add_argument("--output", required=True)
+    parser_record.add_argument("--headless", action="store_true")
+    parser_replay = subparsers.add_parser("replay", help="benchmark a recorded session")
+    parser_replay.add_argument("--archive", required=True)
+    parser_replay.add_argument("--rounds", type=int, default=1)
+    parser_replay.add_argument("--realtime", action="store_true")
+    args = parser.parse_args(argv)
+
+    from .settings import config
+
+    # Compare the per-solve overhead of the logging modes by replaying with each of them
+    sampling = {k.upper(): float(v) for k, v in (i.split("=", 1) for i in args.log_sample)}
+    config.init(enqueue=args.log_enqueue, json=args.log_json, sampling=sampling or None)
+    if args.command == "record":
+        print(record(args.style, args.output, headless=args.headless))
+    else:
+        for report in replay(args.archive, rounds=args.rounds, realtime=args.realtime):
+            print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
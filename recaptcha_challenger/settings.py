@@ -4,6 +4,7 @@
 # Github     : https://github.com/QIN2DIM
 # Description:
 import os
+import warnings
 from dataclasses import dataclass
 
 from .utils import init_log
@@ -11,20 +12,74 @@ from .utils import init_log
 
 @dataclass
 class Config:
+    """
+    Importing the settings has no side effect: the directories are created
+    where they are first used, e.g. by `new_challenger`, and the log sinks are set up by `init`.
+    """
+
     PROJECT_PAYLOAD: str = "datas"
     DIR_MODEL = os.path.join(PROJECT_PAYLOAD, "models")
     DIR_CHALLENGE_CACHE = os.path.join(PROJECT_PAYLOAD, "temp_cache")
     DIR_LOG = os.path.join(PROJECT_PAYLOAD, "logs")
+    # Deduplicated tiles of the attempts, see `dataset.TileStore`
+    DIR_TILE_STORE = os.path.join(PROJECT_PAYLOAD, "tiles")
 
-    def __post_init__(self):
+    def make_dirs(self):
         for ttf in [self.DIR_MODEL, self.DIR_CHALLENGE_CACHE]:
             os.makedirs(ttf, exist_ok=True)
 
-    def register_logger(self):
+    def register_logger(self, json: bool = False, **options):
+        """
+        :param json: also write `events.jsonl`, one JSON object per record
+        :param options: `enqueue` and `sampling`, see `utils.init_log`
+        :return:
+        """
         log_path_error = os.path.join(self.DIR_LOG, "error.log")
         log_path_runtime = os.path.join(self.DIR_LOG, "runtime.log")
-        return init_log(error=log_path_error, runtime=log_path_runtime)
+        log_path_json = os.path.join(self.DIR_LOG, "events.jsonl") if json else None
+        return init_log(
+            error=log_path_error, runtime=log_path_runtime, json_path=log_path_json, **options
+        )
+
+    def start_janitor(self, **options):
+        """
+        Keep DIR_CHALLENGE_CACHE under a size/age cap with a background sweeper
+
+        :param options: `max_mb`, `max_age`, `interval` and `hooks`, see `cache.CacheJanitor`
+        :return: the running janitor
+        """
+        from .cache import CacheJanitor
+
+        return CacheJanitor(self.DIR_CHALLENGE_CACHE, **options).start()
+
+    def init(self, log: bool = True, **log_options) -> "Config":
+        """
+        Create the working directories and, optionally, replace the loguru sinks
+
+        :param log: library users that configure loguru themselves should pass False
+        :param log_options: see `register_logger`
+        :return:
+        """
+        self.make_dirs()
+        if log:
+            self.register_logger(**log_options)
+        return self
 
 
 config = Config()
-logger = config.register_logger()
+
+
+def __getattr__(name: str):
+    # `from recaptcha_challenger.settings import logger` used to set up the directories
+    # and the log sinks at import time, the first access still does
+    if name == "logger":
+        warnings.warn(
+            "settings.logger is deprecated, call config.init() and use loguru.logger",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        config.make_dirs()
+        value = config.register_logger()
+        globals()["logger"] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
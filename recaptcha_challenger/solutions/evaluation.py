@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Description:
+import json
+import multiprocessing
+import os
+import typing
+from itertools import islice
+
+import cv2
+from loguru import logger
+
+# Warm model of the current worker process
+_model = None
+# Tile stores opened by the current worker process, dir_store --> TileStore
+_stores = {}
+
+
+def iter_images(src_dir: str, suffix: str = ".png") -> typing.Iterator[str]:
+    """Stream the image paths under `src_dir` without listing the whole tree up front"""
+    stack = [src_dir]
+    while stack:
+        subdirs = []
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(suffix):
+                    yield entry.path
+        # Depth-first, in name order
+        stack.extend(reversed(subdirs))
+
+
+def _batched(iterable: typing.Iterable, size: int) -> typing.Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _init_worker(factory: typing.Callable):
+    global _model
+    _model = factory()
+    # One OpenCV thread per process, the pool already occupies the cores.
+    # Set after the factory since an autotuned model applies its own thread count
+    cv2.setNumThreads(1)
+
+
+def _read_tile(path_img: str):
+    """Encoded tile of a file, or the mapped tile of a `<dir_store>/<shard>#<index>` key"""
+    if "#" in os.path.basename(path_img):
+        from ..dataset import TileStore
+
+        dir_store, key = os.path.split(path_img)
+        if dir_store not in _stores:
+            _stores[dir_store] = TileStore(dir_store, readonly=True)
+        return _stores[dir_store].read(key)
+    with open(path_img, "rb") as file:
+        return file.read()
+
+
+def _solve_batch(args) -> typing.List[typing.Tuple[str, typing.Any]]:
+    paths, kwargs = args
+    streams = [_read_tile(path_img) for path_img in paths]
+    return list(zip(paths, _model.solutions(streams, **kwargs)))
+
+
+def _load_checkpoint(output: str) -> typing.Set[str]:
+    """Paths that are already recorded in the JSONL output"""
+    done = set()
+    if not output or not os.path.isfile(output):
+        return done
+    with open(output, "r", encoding="utf8") as file:
+        for line in file:
+            try:
+                done.add(json.loads(line)["path"])
+            except (json.decoder.JSONDecodeError, KeyError):
+                # A torn write of the last line, the tile is evaluated again
+                continue
+    return done
+
+
+def solution_bulk(
+    factory: typing.Callable,
+    src_dir: str,
+    processes: typing.Optional[int] = None,
+    batch_size: int = 16,
+    ordered: bool = True,
+    output: typing.Optional[str] = None,
+    paths: typing.Optional[typing.Iterable[str]] = None,
+    **kwargs,
+) -> typing.Iterator[typing.Tuple[str, typing.Any]]:
+    """
+    Parallel, streaming version of `ModelHub.solution_dev`.
+
+    File paths are streamed into a process pool, each worker builds a warm model once
+    with `factory` and solves the tiles in batches through `model.solutions`.
+
+    ```python
+    factory = functools.partial(YOLO, dir_model, "yolov5n6")
+    for path_img, result in solution_bulk(factory, src_dir, label="car", output="car.jsonl"):
+        ...
+    ```
+
+    :param factory: picklable callable that returns a model with a `solutions` method
+    :param src_dir: directory of the tiles (.png), walked recursively, or a tile store
+    :param processes: size of the pool, defaults to the number of cores
+    :param batch_size: tiles per task
+    :param ordered: yield in the order of the paths, or as soon as a batch completes
+    :param output: JSONL file that every result is appended to, it doubles as the checkpoint:
+        tiles that are already recorded are skipped when the evaluation is resumed
+    :param paths: evaluate these paths instead of walking `src_dir`
+    :param kwargs: options of `model.solutions`, e.g. label
+    :return: (path, result)
+    """
+    if paths is None:
+        if not os.path.exists(src_dir):
+            return
+        from ..dataset import TileStore
+
+        if TileStore.is_store(src_dir):
+            store = TileStore(src_dir, readonly=True)
+            paths = (
+                os.path.join(src_dir, f"{shard}#{index}")
+                for shard in store.shards()
+                for index in range(len(store.records(shard)))
+            )
+        else:
+            paths = iter_images(src_dir)
+
+    done = _load_checkpoint(output)
+    if done:
+        logger.debug(f"Resume bulk evaluation - skipped={len(done)} output={output}")
+        paths = (p for p in paths if p not in done)
+
+    tasks = ((batch, kwargs) for batch in _batched(paths, batch_size))
+    ctx = multiprocessing.get_context("spawn")
+    file = open(output, "a", encoding="utf8") if output else None
+    try:
+        with ctx.Pool(processes, initializer=_init_worker, initargs=(factory,)) as pool:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for results in imap(_solve_batch, tasks):
+                if file:
+                    for path_img, result in results:
+                        file.write(json.dumps({"path": path_img, "result": result}) + "\n")
+                    file.flush()
+                yield from results
+    finally:
+        if file:
+            file.close()
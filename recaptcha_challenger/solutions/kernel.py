@@ -7,8 +7,10 @@ import hashlib
 import json
 import os
 import shutil
+import threading
 import time
 import typing
+from contextlib import suppress
 from os.path import dirname, join
 from typing import Optional, Dict, List, Any
 from urllib.request import getproxies
@@ -18,6 +20,8 @@ import requests
 import yaml
 from loguru import logger
 
+from .tuning import DnnConfig, TuningStore, autotune
+
 
 class Memory:
     _fn2memory = {}
@@ -186,77 +190,369 @@ class PluggableObjects:
     def sync(self):
         _request_asset(self.URL_REMOTE_OBJECTS, self.path_objects, self.fn)
 
+    def parse_objects(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        model_label --> {lang: [prompt_label, ...]}
+
+        `label_alias` of objects.yaml, the model_label is also the onnx_prefix of the
+        binary classifier that handles it:
+
+            label_alias:
+              seaplane:
+                en: ["seaplane", "seaplanes"]
+                zh: ["水上飞机"]
+        """
+        if not os.path.isfile(self.path_objects):
+            return {}
+        try:
+            with open(self.path_objects, "r", encoding="utf8") as file:
+                data = yaml.safe_load(file) or {}
+        except yaml.YAMLError as err:
+            logger.warning(f"Invalid objects file - path={self.path_objects} {err=}")
+            return {}
+        label_alias = {}
+        for model_label, i18n in (data.get("label_alias") or {}).items():
+            if not isinstance(i18n, dict):
+                continue
+            label_alias[model_label] = {
+                lang: [prompt_labels] if isinstance(prompt_labels, str) else list(prompt_labels)
+                for lang, prompt_labels in i18n.items()
+                if prompt_labels
+            }
+        return label_alias
+
+    def routing_index(self, label_alias: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """
+        Precompute the routes of the challenge labels to dedicated models.
+
+        :param label_alias: lang --> {prompt: label}, the aliases of the challenger
+        :return: label --> model_label(onnx_prefix), labels without a dedicated model are absent
+        """
+        prompt_to_model = {}
+        for model_label, i18n in self.parse_objects().items():
+            prompt_to_model[model_label.strip().lower()] = model_label
+            for prompt_labels in i18n.values():
+                for prompt_label in prompt_labels:
+                    prompt_to_model[str(prompt_label).strip().lower()] = model_label
+
+        routes = {}
+        for aliases in label_alias.values():
+            for prompt, label in aliases.items():
+                model_label = prompt_to_model.get(label.lower()) or prompt_to_model.get(
+                    prompt.lower()
+                )
+                if model_label:
+                    routes[label] = model_label
+        return routes
+
 
 class Rainbow(Assets):
-    _table = {}
+    """
+    Digests of the tiles whose verdict is known, per label.
+
+    The local table is kept as one chunk per label and a manifest of their digests,
+
+        <dir_model>/_rainbow/<key>.yaml         {"yes": {md5: ...}, "bad": {md5: ...}}
+        <dir_model>/_rainbow/manifest.json      {"version": ..., "chunks": {key: digest}}
+
+    and `sync` only rewrites the chunks whose digest changed. A release that publishes
+    `rainbow.manifest.json` next to `rainbow.yaml`,
+
+        {"version": ..., "chunks": {key: {"name": "rainbow.<key>.yaml", "digest": ...}}}
+
+    is synced chunk by chunk, otherwise the full table is downloaded and diffed locally.
+    A digest is the sha256 of the chunk file as it is served and stored.
+    An update builds a new table and swaps it in by reference, lookups never wait for it.
+
+    Library-only for now: no classifier of `VisualSolver` is built with `on_rainbow`.
+    """
+
+    # dir_chunks --> {key: chunk}, replaced as a whole by every update and never mutated in place
+    _tables: Dict[str, Dict[str, dict]] = {}
+    # Serializes the writers of the local stores, `match` does not take it
+    _lock = threading.Lock()
+    # dir_chunks --> the background sync in flight, at most one per store
+    _sync_threads: Dict[str, threading.Thread] = {}
+
+    FN_MANIFEST = "rainbow.manifest.json"
 
     def __init__(self, dir_assets: str):
         super().__init__(fn="rainbow.yaml", dir_assets=dir_assets)
         self.path_rainbow = join(dirname(dir_assets), self.fn)
+        self.dir_chunks = join(dirname(dir_assets), "_rainbow")
+        self.path_manifest = join(self.dir_chunks, "manifest.json")
 
         self._build()
 
-    def _build(self) -> Dict[str, str]:
-        if self._table:
+    @property
+    def _table(self) -> Dict[str, dict]:
+        return self._tables.get(self.dir_chunks, {})
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        """Digest of a chunk file"""
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _dump(chunk: dict) -> bytes:
+        """A chunk of a full table as a file, sorted keys give the same bytes for the same chunk"""
+        return yaml.safe_dump(chunk, allow_unicode=True, sort_keys=True).encode("utf8")
+
+    @staticmethod
+    def _chunk_of(data: bytes) -> dict:
+        """:raise ValueError: the file is not a chunk"""
+        chunk = yaml.safe_load(data)
+        if not isinstance(chunk, dict):
+            raise ValueError(f"Rainbow chunk is not a mapping - {type(chunk).__name__}")
+        return chunk
+
+    def _chunk_path(self, key: str) -> str:
+        return join(self.dir_chunks, f"{key.replace(os.sep, '_')}.yaml")
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if os.path.isfile(self.path_manifest):
+            with open(self.path_manifest, "r", encoding="utf8") as file, suppress(
+                json.decoder.JSONDecodeError
+            ):
+                return json.load(file)
+        return {"version": "", "chunks": {}}
+
+    def _build(self, force: bool = False) -> Dict[str, dict]:
+        if self.dir_chunks in self._tables and not force:
             return self._table
 
-        os.makedirs(dirname(self.path_rainbow), exist_ok=True)
-        if os.path.exists(self.path_rainbow):
-            with open(self.path_rainbow, "r", encoding="utf8") as file:
-                stream = yaml.safe_load(file)
-            self._table.update(stream)
+        manifest = self._load_manifest()
+        # A table downloaded as a single file by an earlier version, split into chunks once
+        if not manifest["chunks"] and os.path.isfile(self.path_rainbow):
+            with open(self.path_rainbow, "rb") as file, suppress(yaml.YAMLError, ValueError):
+                table = self._table_of(yaml.safe_load(file))
+                self._apply(self._files_of(table), version="", complete=True)
+            return self._table
 
-        return self._table
+        table = {}
+        for key in manifest["chunks"]:
+            path_chunk = self._chunk_path(key)
+            if os.path.isfile(path_chunk):
+                with open(path_chunk, "r", encoding="utf8") as file:
+                    table[key] = yaml.safe_load(file) or {}
+        Rainbow._tables[self.dir_chunks] = table
+        return table
+
+    def _apply(
+        self,
+        chunks: Dict[str, Optional[typing.Tuple[bytes, dict]]],
+        version: str,
+        complete: bool = False,
+        force: bool = False,
+    ) -> List[str]:
+        """
+        Write the chunks that changed and swap the updated table in
 
-    def match(self, img_stream: bytes, rainbow_key: str) -> Optional[bool]:
+        :param chunks: key --> (file, chunk), None to remove the label
+        :param version: remote version the local store is at afterwards
+        :param complete: chunks is the whole table, the labels missing from it are removed
+        :param force: rewrite the chunks even if their digest did not change
+        :return: keys of the labels that changed
         """
+        with self._lock:
+            manifest = self._load_manifest()
+            digests: Dict[str, str] = manifest["chunks"]
+            if complete:
+                chunks = {**{key: None for key in digests if key not in chunks}, **chunks}
+
+            changed = {}
+            for key, item in chunks.items():
+                digest = None if item is None else self.digest(item[0])
+                if force or digests.get(key) != digest:
+                    changed[key] = (item, digest)
+
+            os.makedirs(self.dir_chunks, exist_ok=True)
+            for key, (item, digest) in changed.items():
+                path_chunk = self._chunk_path(key)
+                if item is None:
+                    digests.pop(key, None)
+                    with suppress(FileNotFoundError):
+                        os.remove(path_chunk)
+                    continue
+                with open(f"{path_chunk}.tmp", "wb") as file:
+                    file.write(item[0])
+                os.replace(f"{path_chunk}.tmp", path_chunk)
+                digests[key] = digest
+
+            manifest["version"] = version
+            with open(f"{self.path_manifest}.tmp", "w", encoding="utf8") as file:
+                json.dump(manifest, file, indent=2)
+            os.replace(f"{self.path_manifest}.tmp", self.path_manifest)
+
+            # Copy on write, a lookup in flight keeps the table it already holds
+            table = dict(self._table)
+            for key, (item, _) in changed.items():
+                if item is None:
+                    table.pop(key, None)
+                else:
+                    table[key] = item[1]
+            Rainbow._tables[self.dir_chunks] = table
+        return list(changed)
 
+    def match(self, img_stream: bytes, rainbow_key: str) -> Optional[bool]:
+        """
         :param img_stream:
         :param rainbow_key:
-        :return:
+        :return: the known verdict of the tile, None if it is not in the table
         """
-        try:
-            if self._table[rainbow_key]["yes"].get(hashlib.md5(img_stream).hexdigest()):
-                return True
-            if self._table[rainbow_key]["bad"].get(hashlib.md5(img_stream).hexdigest()):
-                return False
-        except KeyError:
-            pass
+        # The reference is read once, a concurrent sync swaps the table without touching it
+        chunk = self._table.get(rainbow_key)
+        if not chunk:
+            return None
+        digest = hashlib.md5(img_stream).hexdigest()
+        if (chunk.get("yes") or {}).get(digest):
+            return True
+        if (chunk.get("bad") or {}).get(digest):
+            return False
         return None
 
-    def sync(self, force: typing.Optional[bool] = None, **kwargs):
+    def _remote_version(self) -> str:
+        asset = self._fn2assets.get(self.FN_MANIFEST) or self._fn2assets.get(self.fn, {})
+        return f"{asset.get(self.NAME_ASSET_NODE_ID, '')}:{asset.get(self.NAME_ASSET_SIZE, 0)}"
+
+    @staticmethod
+    def _table_of(payload: Any) -> Dict[str, dict]:
+        """
+        A full table: a non-empty mapping of chunks.
+        An error page or an empty body would otherwise remove every local label.
+
+        :raise ValueError:
+        """
+        if not isinstance(payload, dict) or not payload:
+            raise ValueError(f"Rainbow table is empty or not a mapping - {type(payload).__name__}")
+        for key, chunk in payload.items():
+            if not isinstance(chunk, dict):
+                raise ValueError(f"Rainbow chunk is not a mapping - {key=}")
+        return payload
+
+    def _files_of(self, table: Dict[str, dict]) -> Dict[str, typing.Tuple[bytes, dict]]:
+        return {key: (self._dump(chunk), chunk) for key, chunk in table.items()}
+
+    def _download(self, asset: Dict[str, Any]) -> bytes:
+        """The asset as it is served"""
+        os.makedirs(self.dir_chunks, exist_ok=True)
+        path_tmp = join(self.dir_chunks, f"{asset[self.NAME_ASSET_NAME]}.download")
+        try:
+            _request_asset(
+                asset[self.NAME_ASSET_DOWNLOAD_URL], path_tmp, asset[self.NAME_ASSET_NAME]
+            )
+            with open(path_tmp, "rb") as file:
+                return file.read()
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(path_tmp)
+
+    def sync(self, force: typing.Optional[bool] = None, background: bool = False, **kwargs):
+        """
+        :param force: download and rewrite every chunk, whatever the local version
+        :param background: sync on a daemon thread, the current table keeps answering meanwhile.
+            A sync of the same store already in flight is not started twice, see `wait_sync`
+        """
+        if background:
+            with self._lock:
+                thread = Rainbow._sync_threads.get(self.dir_chunks)
+                if thread is None or not thread.is_alive():
+                    thread = threading.Thread(
+                        target=self._sync_supervised,
+                        kwargs={"force": force},
+                        name="rainbow-sync",
+                        daemon=True,
+                    )
+                    Rainbow._sync_threads[self.dir_chunks] = thread
+                    thread.start()
+            return
+
         url = self.get_download_url()
 
         # Check for extreme cases
         if not isinstance(url, str) or not url.startswith("https:"):
             return
 
-        if force is True:
-            os.remove(self.path_rainbow)
-
-        # 1. local > static_remote
-        #   - rainbow: 玩家手動下載了最新版本文件（本地 _assets 靜態緩存過期）
-        #   - rainbow: 基於某個版本的文件做了改動導致的 size 不匹配
-        # 2. local < static_remote
-        #   - rainbow: 本地 rainbow 未改動但落後於最新版本
-        #   - rainbow: 基於某個版本的文件做了刪改導致的 size 不匹配
-        # 3. local NotFounded
-        #   - rainbow: 本地緩存尚未構建，建議拉取
-        if (
-            not os.path.exists(self.path_rainbow)
-            or os.path.getsize(self.path_rainbow) != self.get_size()
-        ):
-            # 更新 Assets 本地缓存
-            self._pull(skip_preload=True)
-            # 更新 Rainbow 本地缓存
-            _request_asset(url, self.path_rainbow, self.fn)
-            # 刷新 Rainbow 运行缓存
-            self._build()
+        manifest = self._load_manifest()
+        if not force and manifest["chunks"] and manifest["version"] == self._remote_version():
+            return
+
+        # 更新 Assets 本地缓存
+        self._pull(skip_preload=True)
+        version = self._remote_version()
+        try:
+            if remote := self._fn2assets.get(self.FN_MANIFEST):
+                changed = self._sync_chunks(remote, manifest, version, bool(force))
+            else:
+                table = self._table_of(yaml.safe_load(self._download(self._fn2assets[self.fn])))
+                changed = self._apply(
+                    self._files_of(table), version, complete=True, force=bool(force)
+                )
+        except (requests.exceptions.RequestException, yaml.YAMLError, ValueError) as err:
+            logger.error(f"Rainbow sync failed - {err}")
+            return
+
+        logger.debug(f"Rainbow synced - {version=} changed={changed}")
+
+    def _sync_supervised(self, force: typing.Optional[bool] = None):
+        # Nothing escapes the thread unlogged, the local table stays as it was
+        try:
+            self.sync(force=force)
+        except Exception as err:  # noqa: the thread has no caller to raise to
+            logger.exception(f"Rainbow sync failed - {err}")
+
+    def wait_sync(self, timeout: Optional[float] = None) -> bool:
+        """
+        :param timeout: seconds to wait for the background sync of this store
+        :return: False if it is still running
+        """
+        thread = self._sync_threads.get(self.dir_chunks)
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _sync_chunks(
+        self, remote: Dict[str, Any], manifest: Dict[str, Any], version: str, force: bool
+    ) -> List[str]:
+        """Download the chunks whose digest differs from the local one"""
+        payload = json.loads(self._download(remote))
+        remote_chunks = payload.get("chunks") if isinstance(payload, dict) else None
+        # An empty manifest is a broken release rather than a request to drop every label
+        if not isinstance(remote_chunks, dict) or not remote_chunks:
+            raise ValueError("Rainbow manifest has no chunks")
+        for key, entry in remote_chunks.items():
+            if not isinstance(entry, dict) or not {"name", "digest"} <= entry.keys():
+                raise ValueError(f"Rainbow manifest entry is malformed - {key=}")
+
+        # Labels dropped from the release are removed locally
+        chunks = {key: None for key in manifest["chunks"] if key not in remote_chunks}
+        complete = True
+        for key, entry in remote_chunks.items():
+            if not force and manifest["chunks"].get(key) == entry["digest"]:
+                continue
+            asset = self._fn2assets.get(entry["name"])
+            data = self._download(asset) if asset else b""
+            try:
+                if self.digest(data) != entry["digest"]:
+                    raise ValueError("digest mismatch")
+                chunks[key] = (data, self._chunk_of(data))
+            except (yaml.YAMLError, ValueError):
+                logger.warning(f"Rainbow chunk unavailable or corrupted - {key=}")
+                complete = False
+
+        # Stay at the local version until every chunk made it, the next sync retries the rest
+        return self._apply(chunks, version if complete else manifest["version"], force=force)
 
 
 class ModelHub:
     _fn2net = {}
 
+    # Filename suffix of the INT8-quantized variant of a model, e.g. yolov5n6_int8.onnx
+    QUANTIZED_SUFFIX = "_int8"
+    PRECISION_FP32 = "fp32"
+    PRECISION_INT8 = "int8"
+
     def __init__(self, onnx_prefix: str, name: str, dir_model: str, on_rainbow: bool = None):
         """
         :param onnx_prefix: 模型文件名，不含有 ext
@@ -273,6 +569,8 @@ class ModelHub:
 
         self.memory = Memory(fn=self.fn, dir_memory=join(dir_model, "_memory"))
         self.assets = Assets(fn=self.fn, dir_assets=join(dir_model, "_assets"))
+        self.tuning = TuningStore(dir_model)
+        self.dnn_config: Optional[DnnConfig] = None
         if on_rainbow:
             self.rainbow = Rainbow(dir_assets=join(dir_model, "_assets"))
 
@@ -323,10 +621,34 @@ class ModelHub:
             self.assets.get_node_id()
         ):
             self.net = cv2.dnn.readNetFromONNX(self.path_model)
+            # Apply the configuration measured by `tune` on this host, if any
+            self.dnn_config = self.tuning.get(self.fn)
+            if self.dnn_config:
+                self.dnn_config.apply(self.net)
             self._fn2net[self.fn] = self.net
             return True
         return False
 
+    def tune(self, blob, force: bool = False, repeats: int = 10) -> Optional[DnnConfig]:
+        """
+        Pick the fastest cv2.dnn backend/target and thread count for this model on this host.
+        The result is persisted and applied by `register_model` from then on.
+
+        :param blob: a representative input of the model
+        :param force: measure again even if this host already has a configuration
+        :param repeats: timed forward passes per candidate
+        :return:
+        """
+        net = self.match_net()
+        if net is None:
+            return None
+        if self.dnn_config and not force:
+            return self.dnn_config
+        self.dnn_config, results = autotune(net, blob, repeats=repeats)
+        self.tuning.put(self.fn, self.dnn_config, results)
+        logger.debug(f"Autotuned {self.flag} - config={self.dnn_config.to_dict()}")
+        return self.dnn_config
+
     def match_net(self):
         """
         PluggableONNXModel 对象实例化时：
@@ -350,6 +672,27 @@ class ModelHub:
         """check model objs"""
         return self._fn2net
 
+    @classmethod
+    def is_quantized(cls, onnx_prefix: str) -> bool:
+        return onnx_prefix.replace(".onnx", "").endswith(cls.QUANTIZED_SUFFIX)
+
+    @classmethod
+    def base_of(cls, onnx_prefix: str) -> str:
+        """yolov5n6_int8 --> yolov5n6"""
+        onnx_prefix = onnx_prefix.replace(".onnx", "")
+        if cls.is_quantized(onnx_prefix):
+            return onnx_prefix[: -len(cls.QUANTIZED_SUFFIX)]
+        return onnx_prefix
+
+    @classmethod
+    def quantized_of(cls, onnx_prefix: str) -> str:
+        """yolov5n6 --> yolov5n6_int8"""
+        return f"{cls.base_of(onnx_prefix)}{cls.QUANTIZED_SUFFIX}"
+
+    @property
+    def precision(self) -> str:
+        return self.PRECISION_INT8 if self.is_quantized(self.fn) else self.PRECISION_FP32
+
     def solution(self, img_stream, **kwargs) -> bool:
         """Implementation process of solution"""
         raise NotImplementedError
@@ -357,6 +700,13 @@ class ModelHub:
     def solution_dev(self, src_dir: str, **kwargs):
         if not os.path.exists(src_dir):
             return
+        from ..dataset import TileStore
+
+        # A tile store yields (<shard>#<index>, result) without touching the filesystem per tile
+        if TileStore.is_store(src_dir):
+            for key, tile, _ in TileStore(src_dir, readonly=True).iter_tiles():
+                yield key, self.solution(tile, **kwargs)
+            return
         _suffix = ".png"
         for _prefix, _, files in os.walk(src_dir):
             for filename in files:
@@ -367,7 +717,16 @@ class ModelHub:
                     yield path_img, self.solution(file.read(), **kwargs)
 
 
-def _request_asset(asset_download_url: str, asset_path: str, fn_tag: str):
+def _request_asset(
+    asset_download_url: str,
+    asset_path: str,
+    fn_tag: str,
+    timeout: typing.Tuple[float, float] = (10, 60),
+):
+    """
+    :param timeout: (connect, read) seconds, a stalled download raises requests.Timeout
+    :raise requests.HTTPError: the file at `asset_path` is left untouched
+    """
     headers = {
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
         "Chrome/105.0.0.0 Safari/537.36 Edg/105.0.1343.27"
@@ -376,9 +735,11 @@ def _request_asset(asset_download_url: str, asset_path: str, fn_tag: str):
 
     # FIXME: PTC-W6004
     #  Audit required: External control of file name or path
-    with open(asset_path, "wb") as file, requests.get(
-        asset_download_url, headers=headers, stream=True, proxies=getproxies()
+    with requests.get(
+        asset_download_url, headers=headers, stream=True, proxies=getproxies(), timeout=timeout
     ) as response:
-        for chunk in response.iter_content(chunk_size=1024):
-            if chunk:
-                file.write(chunk)
+        response.raise_for_status()
+        with open(asset_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=1024):
+                if chunk:
+                    file.write(chunk)
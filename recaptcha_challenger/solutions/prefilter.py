@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Description: Image statistics that settle degenerate tiles before inference
+import threading
+import typing
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class TileStats:
+    mean: float
+    std: float
+    # Share of the neighbouring pixel pairs whose gray levels differ by more than `edge_step`
+    edge_density: float
+    # Shannon entropy of the gray-level histogram, in bits, 8 at most
+    entropy: float
+
+
+class TilePrefilter:
+    """
+    Reject tiles that no model can answer before they reach the network.
+
+    - blank: almost no variance, nothing to detect, answered negative
+    - noise: edges everywhere and a flat histogram, answered negative
+    - fading: washed out by the transition of a refreshed tile, to be captured again
+
+    The thresholds are conservative, a tile is only rejected by a clear-cut statistic.
+    """
+
+    PASS = "pass"
+    BLANK = "blank"
+    NOISE = "noise"
+    FADING = "fading"
+
+    def __init__(
+        self,
+        blank_std: float = 4.0,
+        noise_entropy: float = 7.0,
+        noise_edge_density: float = 0.5,
+        fading_mean: float = 215.0,
+        fading_std: float = 20.0,
+        edge_step: int = 32,
+    ):
+        """
+        :param blank_std: a tile whose gray levels vary less than this is blank
+        :param noise_entropy: a tile with a histogram entropy above this ...
+        :param noise_edge_density: ... and an edge density above this is noise
+        :param fading_mean: a tile brighter than this ...
+        :param fading_std: ... with less contrast than this is still fading
+        :param edge_step: gray-level step between neighbouring pixels that counts as an edge
+        """
+        self.blank_std = blank_std
+        self.noise_entropy = noise_entropy
+        self.noise_edge_density = noise_edge_density
+        self.fading_mean = fading_mean
+        self.fading_std = fading_std
+        self.edge_step = edge_step
+
+        self._lock = threading.Lock()
+        self.counts = {self.PASS: 0, self.BLANK: 0, self.NOISE: 0, self.FADING: 0}
+
+    def stats(self, img: np.ndarray) -> TileStats:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        gray = gray.astype(np.int16)
+        steps = np.count_nonzero(np.abs(np.diff(gray, axis=0)) > self.edge_step)
+        steps += np.count_nonzero(np.abs(np.diff(gray, axis=1)) > self.edge_step)
+        pairs = (gray.shape[0] - 1) * gray.shape[1] + gray.shape[0] * (gray.shape[1] - 1)
+        hist = np.bincount(gray.ravel(), minlength=256) / gray.size
+        hist = hist[hist > 0]
+        return TileStats(
+            mean=float(gray.mean()),
+            std=float(gray.std()),
+            edge_density=float(steps / pairs) if pairs else 0.0,
+            entropy=float(abs((hist * np.log2(hist)).sum())),
+        )
+
+    def check(self, img: typing.Optional[np.ndarray], refreshed: bool = True) -> str:
+        """
+        PASS, or the reason the tile is rejected
+
+        :param img:
+        :param refreshed: the tile replaces a clicked one and may still be fading,
+            otherwise a bright, low-contrast tile is an image like any other
+        """
+        if img is None or img.size == 0:
+            verdict = self.BLANK
+        else:
+            stats = self.stats(img)
+            if stats.std < self.blank_std:
+                verdict = self.BLANK
+            elif refreshed and stats.mean > self.fading_mean and stats.std < self.fading_std:
+                verdict = self.FADING
+            elif (
+                stats.entropy > self.noise_entropy and stats.edge_density > self.noise_edge_density
+            ):
+                verdict = self.NOISE
+            else:
+                verdict = self.PASS
+        with self._lock:
+            self.counts[verdict] += 1
+        return verdict
+
+    def report(self) -> dict:
+        """Tiles checked, forward passes skipped, and the reasons"""
+        with self._lock:
+            counts = dict(self.counts)
+        tiles = sum(counts.values())
+        skipped = tiles - counts[self.PASS]
+        return {
+            "tiles": tiles,
+            "skipped": skipped,
+            "skip_rate": round(skipped / tiles, 4) if tiles else None,
+            **{k: v for k, v in counts.items() if k != self.PASS},
+        }
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Description:
+import os
+import threading
+import typing
+from dataclasses import dataclass, replace, asdict
+from os.path import join
+
+import cv2
+import numpy as np
+import yaml
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class PreprocessProfile:
+    """
+    How a tile is turned into the input blob of a model.
+
+    A profile is read from the model metadata, a `<onnx_prefix>.yaml` file next to
+    the `.onnx` file, e.g.:
+
+        input_size: [320, 320]
+        letterbox: true
+        mean: [0, 0, 0]
+        scale: 0.00392156862745098
+    """
+
+    # (width, height)
+    input_size: typing.Tuple[int, int] = (128, 128)
+    # Keep the aspect ratio and pad, instead of stretching the tile
+    letterbox: bool = False
+    mean: typing.Tuple[float, float, float] = (0, 0, 0)
+    scale: float = 1 / 255.0
+    swap_rb: bool = True
+    # Color of the letterbox padding, the YOLO convention
+    pad_value: int = 114
+
+    @classmethod
+    def from_metadata(
+        cls, dir_model: str, onnx_prefix: str, default: typing.Optional["PreprocessProfile"] = None
+    ) -> "PreprocessProfile":
+        """Profile of the model, `default` if the model ships no metadata"""
+        default = cls() if default is None else default
+        path_meta = join(dir_model, f"{onnx_prefix}.yaml")
+        if not os.path.isfile(path_meta):
+            return default
+        try:
+            with open(path_meta, "r", encoding="utf8") as file:
+                meta = yaml.safe_load(file) or {}
+        except yaml.YAMLError as err:
+            logger.warning(f"Invalid model metadata - path={path_meta} {err=}")
+            return default
+        fields = {k: v for k, v in meta.items() if k in cls.__dataclass_fields__}
+        for key in ["input_size", "mean"]:
+            if key in fields:
+                fields[key] = tuple(fields[key])
+        return replace(default, **fields)
+
+    def with_size(self, size: typing.Union[int, typing.Tuple[int, int]]) -> "PreprocessProfile":
+        size = (size, size) if isinstance(size, int) else tuple(size)
+        return replace(self, input_size=size)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def resize(self, img: np.ndarray) -> np.ndarray:
+        """Stretch or letterbox `img` into `input_size`"""
+        width, height = self.input_size
+        if not self.letterbox:
+            return cv2.resize(img, (width, height), interpolation=cv2.INTER_LINEAR)
+        h, w = img.shape[:2]
+        ratio = min(width / w, height / h)
+        new_w, new_h = max(int(round(w * ratio)), 1), max(int(round(h * ratio)), 1)
+        canvas = np.full((height, width, 3), self.pad_value, dtype=np.uint8)
+        top, left = (height - new_h) // 2, (width - new_w) // 2
+        canvas[top : top + new_h, left : left + new_w] = cv2.resize(
+            img, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+        )
+        return canvas
+
+    def blob(self, img: np.ndarray) -> np.ndarray:
+        """NCHW float blob of one tile"""
+        if not self.letterbox:
+            return cv2.dnn.blobFromImage(
+                img, self.scale, self.input_size, self.mean, swapRB=self.swap_rb, crop=False
+            )
+        return cv2.dnn.blobFromImage(
+            self.resize(img), self.scale, self.input_size, self.mean, swapRB=self.swap_rb
+        )
+
+
+def png_size(img_stream: bytes) -> typing.Optional[typing.Tuple[int, int]]:
+    """(width, height) from the IHDR chunk of a PNG stream, None for other formats"""
+    if len(img_stream) < 24 or img_stream[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    return int.from_bytes(img_stream[16:20], "big"), int.from_bytes(img_stream[20:24], "big")
+
+
+class _Buffers(threading.local):
+    """Per-thread scratch arrays, reused as long as their shape fits"""
+
+    def __init__(self):
+        self.arrays: typing.Dict[typing.Tuple[str, tuple], np.ndarray] = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        key = (name, shape)
+        if key not in self.arrays:
+            self.arrays[key] = np.empty(shape, dtype=dtype)
+        return self.arrays[key]
+
+
+class BlobEngine:
+    """
+    Decode and blob preparation of a profile without per-tile allocations.
+
+    Tiles are decoded at a reduced resolution when the stream is larger than the input size,
+    resized into preallocated per-thread buffers, and written as a normalized NCHW blob
+    into a per-thread batch buffer. The returned blob is a view of that buffer,
+    valid until the next call on the same thread.
+    """
+
+    REDUCED_FLAGS = (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    )
+
+    def __init__(self, profile: PreprocessProfile, max_batch: int = 16):
+        self.profile = profile
+        self.max_batch = max_batch
+        self._buffers = _Buffers()
+        # The mean is given in the channel order of the blob
+        self._mean = None
+        if any(profile.mean):
+            self._mean = np.array(profile.mean, dtype=np.float32).reshape(3, 1, 1)
+
+    def decode(self, img_stream: typing.Union[bytes, np.ndarray]) -> np.ndarray:
+        """BGR tile, decoded at 1/2, 1/4 or 1/8 scale if that still covers the input size"""
+        if isinstance(img_stream, np.ndarray):
+            return img_stream
+        flags = cv2.IMREAD_COLOR
+        if size := png_size(img_stream):
+            width, height = self.profile.input_size
+            for factor, reduced in self.REDUCED_FLAGS:
+                if size[0] // factor >= width and size[1] // factor >= height:
+                    flags = reduced
+                    break
+        # frombuffer is a view of the stream, only the decoded image is allocated
+        return cv2.imdecode(np.frombuffer(img_stream, np.uint8), flags)
+
+    def resize(self, img: np.ndarray) -> np.ndarray:
+        """`PreprocessProfile.resize` into a reused buffer"""
+        width, height = self.profile.input_size
+        if img.shape[:2] == (height, width) and img.ndim == 3:
+            return img
+        if not self.profile.letterbox:
+            dst = self._buffers.get("resized", (height, width, 3))
+            cv2.resize(img, (width, height), dst=dst, interpolation=cv2.INTER_LINEAR)
+            return dst
+        h, w = img.shape[:2]
+        ratio = min(width / w, height / h)
+        new_w, new_h = max(int(round(w * ratio)), 1), max(int(round(h * ratio)), 1)
+        scaled = self._buffers.get("scaled", (new_h, new_w, 3))
+        cv2.resize(img, (new_w, new_h), dst=scaled, interpolation=cv2.INTER_LINEAR)
+        canvas = self._buffers.get("canvas", (height, width, 3))
+        canvas.fill(self.profile.pad_value)
+        top, left = (height - new_h) // 2, (width - new_w) // 2
+        canvas[top : top + new_h, left : left + new_w] = scaled
+        return canvas
+
+    def batch(self, size: int) -> np.ndarray:
+        """The per-thread NCHW float32 buffer, grown once if a batch exceeds `max_batch`"""
+        width, height = self.profile.input_size
+        key = ("blob", (3, height, width))
+        blob = self._buffers.arrays.get(key)
+        if blob is None or len(blob) < size:
+            blob = np.empty((max(size, self.max_batch), 3, height, width), np.float32)
+            self._buffers.arrays[key] = blob
+        return blob[:size]
+
+    def fill(self, blob: np.ndarray, img: np.ndarray):
+        """Write one normalized CHW tile into `blob`, (img - mean) * scale as in blobFromImage"""
+        img = self.resize(img)
+        if self.profile.swap_rb:
+            img = img[..., ::-1]
+        # One strided, casting copy from HWC to CHW, no temporary arrays
+        np.copyto(blob, img.transpose(2, 0, 1), casting="unsafe")
+        if self._mean is not None:
+            blob -= self._mean
+        blob *= self.profile.scale
+
+    def blob(self, img: np.ndarray) -> np.ndarray:
+        """(1, 3, H, W) blob of one tile, see `PreprocessProfile.blob`"""
+        return self.blobs([img])
+
+    def blobs(self, imgs: typing.Sequence[np.ndarray]) -> np.ndarray:
+        """(N, 3, H, W) blob of a batch of tiles"""
+        blob = self.batch(len(imgs))
+        for i, img in enumerate(imgs):
+            self.fill(blob[i], img)
+        return blob
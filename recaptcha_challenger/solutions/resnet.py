@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Description:
+import typing
+from contextlib import nullcontext
+
+import numpy as np
+
+from .kernel import ModelHub
+from .preprocess import BlobEngine, PreprocessProfile
+
+
+class BinaryClassifier(ModelHub):
+    """
+    Small ONNX classifier dedicated to one label, e.g. the ResNet models published
+    with objects.yaml. Output index 0 is the positive class.
+    """
+
+    # Solve a whole grid in one forward pass
+    BATCHED = True
+
+    def __init__(
+        self,
+        onnx_prefix: str,
+        dir_model: str,
+        on_rainbow: typing.Optional[bool] = None,
+        autotune: typing.Optional[bool] = False,
+    ):
+        super().__init__(onnx_prefix, f"{onnx_prefix}(ResNet)_model", dir_model, on_rainbow)
+        self.onnx_prefix = onnx_prefix
+        self.on_rainbow = on_rainbow
+        self.register_model()
+        # The published classifiers take 64x64 tiles unless their metadata says otherwise
+        self.profile = PreprocessProfile.from_metadata(
+            dir_model, onnx_prefix, default=PreprocessProfile(input_size=(64, 64))
+        )
+        self.autotune = autotune
+        self.engine = BlobEngine(self.profile)
+
+    def match_net(self):
+        net = super().match_net()
+        # The model may only be pulled on first use, tune it once it is available
+        if net is not None and self.autotune:
+            self.autotune = False
+            tile = np.random.default_rng(0).integers(0, 255, (100, 100, 3), dtype=np.uint8)
+            self.tune(self.profile.blob(tile))
+        return net
+
+    def probabilities(
+        self, imgs: typing.List[np.ndarray]
+    ) -> typing.List[typing.Tuple[bool, float]]:
+        """(positive, probability of the positive class) of each image, one forward pass"""
+        if not imgs:
+            return []
+        blob = self.engine.blobs(imgs)
+        net = self.match_net()
+        net.setInput(blob)
+        out = net.forward().reshape(len(imgs), -1)
+        # Exported with or without the softmax layer
+        probs = out
+        if out.min() < 0 or not np.allclose(out.sum(axis=1), 1, atol=1e-3):
+            exp = np.exp(out - out.max(axis=1, keepdims=True))
+            probs = exp / exp.sum(axis=1, keepdims=True)
+        return [(not bool(i), float(p)) for i, p in zip(np.argmax(out, axis=1), probs[:, 0])]
+
+    def _match_rainbow(self, img_stream: typing.Union[bytes, np.ndarray]) -> typing.Optional[bool]:
+        # Only encoded tiles have a digest in the rainbow table
+        if self.on_rainbow and isinstance(img_stream, bytes):
+            return self.rainbow.match(img_stream, self.onnx_prefix)
+        return None
+
+    def solution(self, img_stream: bytes, label: str = None, **kwargs) -> bool:
+        """
+        :param img_stream: image file binary stream
+        :param label: ignored, the classifier only knows its own label
+        :param kwargs: `tracer`, see `YOLO.solution`
+        :return:
+        """
+        return self.solutions([img_stream], label, **kwargs)[0]
+
+    def solutions(
+        self, img_streams: typing.List[bytes], label: str = None, **kwargs
+    ) -> typing.List[bool]:
+        """Batched version of `solution`, tiles known by the rainbow table skip the network"""
+        return [result for result, _ in self.predictions(img_streams, label, **kwargs)]
+
+    def predictions(
+        self, img_streams: typing.List[typing.Union[bytes, np.ndarray]], label: str = None, **kwargs
+    ) -> typing.List[typing.Tuple[bool, float]]:
+        """`solutions` along with the probability of the positive class"""
+        tracer = kwargs.get("tracer") or (lambda phase: nullcontext())
+
+        results = []
+        for img_stream in img_streams:
+            hit = self._match_rainbow(img_stream)
+            results.append(None if hit is None else (hit, float(hit)))
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        with tracer("decode"):
+            imgs = [self.engine.decode(img_streams[i]) for i in pending]
+        with tracer("inference"):
+            for i, result in zip(pending, self.probabilities(imgs)):
+                results[i] = result
+        return results
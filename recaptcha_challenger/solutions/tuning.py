@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Description: cv2.dnn backend, target and thread count autotuning
+import hashlib
+import json
+import os
+import platform
+import statistics
+import time
+import typing
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class DnnConfig:
+    """How cv2.dnn runs a network on this host"""
+
+    backend: int = cv2.dnn.DNN_BACKEND_OPENCV
+    target: int = cv2.dnn.DNN_TARGET_CPU
+    # 0 keeps the OpenCV default, i.e. one thread per core
+    threads: int = 0
+
+    def apply(self, net):
+        """
+        The thread count is process-wide in OpenCV,
+        the last applied configuration wins when several models are loaded.
+        """
+        net.setPreferableBackend(self.backend)
+        net.setPreferableTarget(self.target)
+        if self.threads:
+            cv2.setNumThreads(self.threads)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def host_fingerprint() -> str:
+    """Autotuning results only hold on the hardware and OpenCV build they were measured on"""
+    cpu = platform.processor()
+    with suppress(OSError):
+        with open("/proc/cpuinfo", "r", encoding="utf8") as file:
+            for line in file:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    host = "|".join(
+        [platform.system(), platform.machine(), cpu, str(os.cpu_count()), cv2.__version__]
+    )
+    return hashlib.sha1(host.encode("utf8")).hexdigest()[:12]
+
+
+def candidate_backends() -> typing.List[typing.Tuple[str, int, int]]:
+    """CPU backends available in this OpenCV build, OpenVINO is included when it is installed"""
+    candidates = [("opencv", cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU)]
+    openvino = getattr(cv2.dnn, "DNN_BACKEND_INFERENCE_ENGINE", None)
+    if openvino is not None:
+        with suppress(cv2.error):
+            if cv2.dnn.DNN_TARGET_CPU in cv2.dnn.getAvailableTargets(openvino):
+                candidates.append(("openvino", openvino, cv2.dnn.DNN_TARGET_CPU))
+    return candidates
+
+
+def thread_sweep(max_threads: typing.Optional[int] = None) -> typing.List[int]:
+    """1, 2, 4, ... up to the number of cores, which is always tried"""
+    max_threads = max_threads or os.cpu_count() or 1
+    sweep, n = [], 1
+    while n < max_threads:
+        sweep.append(n)
+        n *= 2
+    sweep.append(max_threads)
+    return sweep
+
+
+def autotune(
+    net, blob: np.ndarray, repeats: int = 10, max_threads: typing.Optional[int] = None
+) -> typing.Tuple[DnnConfig, typing.List[dict]]:
+    """
+    Median forward latency of every backend/target pair and thread count on a warm network
+
+    :param net: cv2.dnn network, left configured with the best candidate
+    :param blob: a representative input of the model
+    :param repeats: timed forward passes per candidate
+    :param max_threads: upper bound of the thread sweep, defaults to the number of cores
+    :return: best configuration, all measurements
+    """
+    threads_before = cv2.getNumThreads()
+    results = []
+    for name, backend, target in candidate_backends():
+        for threads in thread_sweep(max_threads):
+            config = DnnConfig(backend, target, threads)
+            try:
+                config.apply(net)
+                # Warm-up, switching backends reinitializes the network
+                net.setInput(blob)
+                net.forward()
+                costs = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    net.setInput(blob)
+                    net.forward()
+                    costs.append((time.perf_counter() - start) * 1000)
+            except cv2.error as err:
+                logger.debug(f"Skip dnn candidate - {name=} {threads=} {err=}")
+                break
+            results.append(
+                {"name": name, **config.to_dict(), "p50_ms": round(statistics.median(costs), 3)}
+            )
+
+    cv2.setNumThreads(threads_before)
+    if not results:
+        best = DnnConfig()
+    else:
+        fastest = min(results, key=lambda r: r["p50_ms"])
+        best = DnnConfig(fastest["backend"], fastest["target"], fastest["threads"])
+    best.apply(net)
+    return best, results
+
+
+class TuningStore:
+    """Best configuration per model and host, persisted in `<dir_model>/_autotune.json`"""
+
+    def __init__(self, dir_model: str):
+        self.path = os.path.join(dir_model, "_autotune.json")
+        self.host = host_fingerprint()
+
+    def _load(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf8") as file:
+            with suppress(json.decoder.JSONDecodeError):
+                return json.load(file)
+        return {}
+
+    def get(self, fn: str) -> typing.Optional[DnnConfig]:
+        record = self._load().get(self.host, {}).get(fn)
+        if not record:
+            return None
+        return DnnConfig(**record["config"])
+
+    def put(self, fn: str, config: DnnConfig, results: typing.List[dict]):
+        data = self._load()
+        data.setdefault(self.host, {})[fn] = {"config": config.to_dict(), "results": results}
+        with open(self.path, "w", encoding="utf8") as file:
+            json.dump(data, file, indent=2)
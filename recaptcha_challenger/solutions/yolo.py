@@ -3,10 +3,22 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
+import json
+import os
+import threading
+import time
+import typing
+from contextlib import nullcontext, suppress
+from dataclasses import replace
+from functools import partial
+
 import cv2
 import numpy as np
+from loguru import logger
 
+from .evaluation import solution_bulk
 from .kernel import ModelHub
+from .preprocess import BlobEngine, PreprocessProfile
 
 
 class YOLO:
@@ -95,32 +107,243 @@ class YOLO:
         "toothbrush",
     ]
 
-    def __init__(self, dir_model: str, onnx_prefix: str = None):
-        onnx_prefix = (
-            "yolov5m6"
-            if onnx_prefix
-            not in [
-                # Reference - Ultralytics YOLOv5 https://github.com/ultralytics/yolov5
-                "yolov5m6",
-                "yolov5s6",
-                "yolov5n6",
-                # Reference - MT-YOLOv6 https://github.com/meituan/YOLOv6
-                "yolov6n",
-                "yolov6s",
-                "yolov6t",
-                # "yolov7"  # Vision Transformer
-            ]
-            else onnx_prefix
-        )
+    # Input sizes tried by the latency budget mode, in ascending order
+    CANDIDATE_SIZES = (128, 192, 256, 320, 384, 448, 512, 640)
+
+    models = [
+        # Reference - Ultralytics YOLOv5 https://github.com/ultralytics/yolov5
+        "yolov5m6",
+        "yolov5s6",
+        "yolov5n6",
+        # Reference - MT-YOLOv6 https://github.com/meituan/YOLOv6
+        "yolov6n",
+        "yolov6s",
+        "yolov6t",
+        # "yolov7"  # Vision Transformer
+    ]
+    DEFAULT_MODEL = "yolov5m6"
+    # onnx_prefix that picks the fastest adequate local variant, see `auto_select`
+    AUTO = "auto"
 
-        name = f"YOLOv5{onnx_prefix[-2:]}"
-        if onnx_prefix.startswith("yolov6"):
-            name = f"MT-YOLOv6{onnx_prefix[-1]}"
+    def __init__(
+        self,
+        dir_model: str,
+        onnx_prefix: str = None,
+        input_size: typing.Optional[typing.Union[int, typing.Tuple[int, int]]] = None,
+        letterbox: typing.Optional[bool] = None,
+        latency_budget_ms: typing.Optional[float] = None,
+        autotune: typing.Optional[bool] = False,
+    ):
+        """
+        :param dir_model:
+        :param onnx_prefix:
+        :param input_size: override the input size of the model's preprocessing profile
+        :param letterbox: override the letterbox switch of the model's preprocessing profile
+        :param latency_budget_ms: pick the largest input size whose forward pass fits
+            this per-tile budget on the current machine, see `fit_latency_budget`
+        :param autotune: measure the fastest cv2.dnn backend and thread count
+            if this host has no persisted configuration yet, see `tune`
+        """
+        if onnx_prefix == self.AUTO:
+            onnx_prefix = self.auto_select(dir_model)
+        # Quantized variants, e.g. yolov5n6_int8, share the name of their base model
+        base = ModelHub.base_of(onnx_prefix or "")
+        if base not in self.models:
+            if onnx_prefix:
+                logger.warning(
+                    f"Unknown YOLO model, fall back to {self.DEFAULT_MODEL} - {onnx_prefix=}"
+                )
+            onnx_prefix = base = self.DEFAULT_MODEL
 
+        name = f"YOLOv5{base[-2:]}"
+        if base.startswith("yolov6"):
+            name = f"MT-YOLOv6{base[-1]}"
+        if ModelHub.is_quantized(onnx_prefix):
+            name = f"{name}-INT8"
+
+        self.dir_model = dir_model
+        self.onnx_prefix = onnx_prefix
         self.modelhub = ModelHub(onnx_prefix, f"{name}(ONNX)_model", dir_model)
         self.modelhub.register_model()
         self.flag = self.modelhub.flag
 
+        self._engine: typing.Optional[BlobEngine] = None
+        # Set once the network rejects a batch, e.g. it was exported with a static batch size
+        self._static_batch = False
+        self.profile = PreprocessProfile.from_metadata(dir_model, onnx_prefix)
+        if input_size is not None:
+            self.profile = self.profile.with_size(input_size)
+        if letterbox is not None:
+            self.profile = replace(self.profile, letterbox=letterbox)
+        if autotune:
+            self.tune()
+        if latency_budget_ms:
+            self.profile = self.profile.with_size(self.fit_latency_budget(latency_budget_ms))
+
+    @property
+    def options(self) -> dict:
+        """Arguments that rebuild this model with the same preprocessing, e.g. in another process"""
+        return {"input_size": self.profile.input_size, "letterbox": self.profile.letterbox}
+
+    @property
+    def engine(self) -> BlobEngine:
+        """Decode and blob buffers of the current profile"""
+        if self._engine is None or self._engine.profile != self.profile:
+            self._engine = BlobEngine(self.profile)
+        return self._engine
+
+    def tune(self, force: bool = False):
+        """Autotune cv2.dnn on a synthetic tile, see `ModelHub.tune`"""
+        tile = np.random.default_rng(0).integers(0, 255, (100, 100, 3), dtype=np.uint8)
+        return self.modelhub.tune(self.profile.blob(tile), force=force)
+
+    def fit_latency_budget(self, budget_ms: float, repeats: int = 5) -> typing.Tuple[int, int]:
+        """
+        Largest input size in `CANDIDATE_SIZES` whose median forward pass fits `budget_ms`
+
+        If not even the smallest size fits, the smallest size is returned with a warning.
+        The profile's own size is kept only if no candidate can be measured,
+        e.g. the model accepts a static input shape only.
+
+        :param budget_ms: per-tile budget in milliseconds
+        :param repeats: timed forward passes per size
+        :return: (width, height)
+        """
+        net = self.modelhub.match_net()
+        if net is None:
+            return self.profile.input_size
+        tile = np.random.default_rng(0).integers(0, 255, (100, 100, 3), dtype=np.uint8)
+        best = None
+        smallest = None
+        for size in self.CANDIDATE_SIZES:
+            blob = self.profile.with_size(size).blob(tile)
+            try:
+                # Warm-up, the first pass at a new shape reallocates the network
+                net.setInput(blob)
+                net.forward()
+                costs = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    net.setInput(blob)
+                    net.forward()
+                    costs.append((time.perf_counter() - start) * 1000)
+            # Models exported with a static input shape only accept their own size
+            except cv2.error:
+                break
+            median = sorted(costs)[len(costs) // 2]
+            if smallest is None:
+                smallest = ((size, size), median)
+            if median > budget_ms:
+                break
+            best = (size, size)
+        if best is None and smallest is not None:
+            best, median = smallest
+            logger.warning(
+                f"No input size fits the latency budget, use the smallest - "
+                f"model={self.flag} {budget_ms=} input_size={best} p50_ms={round(median, 3)}"
+            )
+        elif best is None:
+            best = self.profile.input_size
+        logger.debug(f"Fit latency budget - model={self.flag} {budget_ms=} input_size={best}")
+        return best
+
+    @classmethod
+    def local_variants(cls, dir_model: str) -> typing.List[str]:
+        """Every fp32 and INT8 YOLO model that exists in `dir_model`"""
+        return [
+            prefix
+            for base in cls.models
+            for prefix in [base, ModelHub.quantized_of(base)]
+            if os.path.isfile(os.path.join(dir_model, f"{prefix}.onnx"))
+        ]
+
+    @classmethod
+    def auto_select(
+        cls,
+        dir_model: str,
+        calibration_dir: typing.Optional[str] = None,
+        tolerance: float = 0.02,
+        baseline: typing.Optional[str] = None,
+        limit: int = 200,
+        force: bool = False,
+    ) -> str:
+        """
+        The fastest local variant whose accuracy stays within `tolerance` of the fp32 baseline.
+
+        The variants are benchmarked once on the calibration set, the result is persisted
+        in `<dir_model>/_autoselect.json` and reused as long as the local variants,
+        the baseline, the tolerance, the calibration set and its limit do not change.
+
+        :param dir_model:
+        :param calibration_dir: labeled tiles, see `benchmark.load_corpus`,
+            defaults to `<dir_model>/_calibration`
+        :param tolerance: maximum accuracy drop from the baseline, e.g. 0.02 for 2 points
+        :param baseline: fp32 reference model, defaults to `DEFAULT_MODEL` if it is available
+        :param limit: tiles of the calibration set to use
+        :param force: benchmark again even if a persisted result matches
+        :return: onnx_prefix
+        """
+        from ..benchmark import benchmark_model, load_corpus
+
+        candidates = cls.local_variants(dir_model)
+        fp32 = [c for c in candidates if not ModelHub.is_quantized(c)]
+        if not fp32:
+            logger.warning(f"No local model to select from, use {cls.DEFAULT_MODEL}")
+            return cls.DEFAULT_MODEL
+        baseline = baseline or (cls.DEFAULT_MODEL if cls.DEFAULT_MODEL in fp32 else None)
+        calibration_dir = os.path.abspath(
+            calibration_dir or os.path.join(dir_model, "_calibration")
+        )
+
+        path_record = os.path.join(dir_model, "_autoselect.json")
+        if not force and os.path.isfile(path_record):
+            with open(path_record, "r", encoding="utf8") as file:
+                with suppress(json.decoder.JSONDecodeError):
+                    record = json.load(file)
+                    if (
+                        record.get("candidates") == candidates
+                        and record.get("tolerance") == tolerance
+                        and record.get("requested_baseline") == baseline
+                        and record.get("calibration_dir") == calibration_dir
+                        and record.get("limit") == limit
+                    ):
+                        return record["selected"]
+
+        samples = load_corpus(calibration_dir, limit)
+        if not samples:
+            logger.warning(f"No calibration set for auto-selection, use {fp32[0]}")
+            return fp32[0]
+
+        results = {}
+        for prefix in candidates:
+            report = benchmark_model(dir_model, prefix, samples, batch_sizes=[1])
+            stats = report["labels"].values()
+            correct = sum(i["tp"] + i["tn"] for i in stats)
+            results[prefix] = {"accuracy": correct / len(samples), "p50_ms": report["p50_ms"]}
+        # Without an explicit baseline, the most accurate fp32 model is the reference
+        reference = baseline or max(fp32, key=lambda c: results[c]["accuracy"])
+        floor = results[reference]["accuracy"] - tolerance
+        adequate = [c for c in candidates if results[c]["accuracy"] >= floor]
+        selected = min(adequate, key=lambda c: results[c]["p50_ms"])
+
+        with open(path_record, "w", encoding="utf8") as file:
+            json.dump(
+                {
+                    "candidates": candidates,
+                    "tolerance": tolerance,
+                    "requested_baseline": baseline,
+                    "calibration_dir": calibration_dir,
+                    "limit": limit,
+                    "baseline": reference,
+                    "results": results,
+                    "selected": selected,
+                },
+                file,
+                indent=2,
+            )
+        logger.debug(f"Auto-selected model - {selected=} {reference=} {tolerance=}")
+        return selected
+
     def pull_model(self):
         """Download YOLOv5(ONNX) model"""
         self.modelhub.pull_model()
@@ -129,6 +352,27 @@ class YOLO:
     def fn2net(self):
         return self.modelhub.fn2net
 
+    def forward(self, img: np.ndarray) -> np.ndarray:
+        """Raw output of the network: (batch, detections, [cx, cy, w, h, obj, *class_scores])"""
+        net = self.modelhub.match_net()
+        net.setInput(self.engine.blob(img))
+        return net.forward()
+
+    def forward_batch(self, imgs: typing.Sequence[np.ndarray]) -> np.ndarray:
+        """Raw output of one forward pass over all the tiles: (N, detections, ...)"""
+        net = self.modelhub.match_net()
+        net.setInput(self.engine.blobs(imgs))
+        return net.forward()
+
+    def score(self, img: np.ndarray, label: str) -> float:
+        """Highest confidence of `label` over all the detections of the image, 0 if unknown"""
+        if label not in self.classes:
+            return 0.0
+        outs = self.forward(img)
+        if not outs.size:
+            return 0.0
+        return float(outs[..., 5 + self.classes.index(label)].max())
+
     def detect_common_objects(self, img: np.ndarray, confidence=0.4, nms_thresh=0.4):
         """
         Object Detection
@@ -138,20 +382,26 @@ class YOLO:
         :param img:
         :param confidence:
         :param nms_thresh:
-        :return: bbox, label, conf
+        :return: labels of the detections
         """
-        height, width = img.shape[:2]
+        return [label for label, _ in self.detections(img, confidence, nms_thresh)]
+
+    def detections(
+        self, img: np.ndarray, confidence=0.4, nms_thresh=0.4
+    ) -> typing.List[typing.Tuple[str, float]]:
+        """(label, conf) of the detections kept by NMS, see `detect_common_objects`"""
+        return self._postprocess(self.forward(img), img.shape[:2], confidence, nms_thresh)
+
+    def _postprocess(
+        self, outs: np.ndarray, shape: typing.Tuple[int, ...], confidence: float, nms_thresh: float
+    ) -> typing.List[typing.Tuple[str, float]]:
+        """Detections of one image from its raw output, (1, detections, ...)"""
+        height, width = shape[:2]
 
         class_ids = []
         confidences = []
         boxes = []
 
-        blob = cv2.dnn.blobFromImage(img, 1 / 255.0, (128, 128), (0, 0, 0), swapRB=True, crop=False)
-
-        net = self.modelhub.match_net()
-        net.setInput(blob)
-        outs = net.forward()
-
         for out in outs:
             for detection in out:
                 scores = detection[5:]
@@ -170,7 +420,7 @@ class YOLO:
 
         indices = cv2.dnn.NMSBoxes(boxes, confidences, confidence, nms_thresh)
 
-        return [str(self.classes[class_ids[i]]) for i in indices]
+        return [(str(self.classes[class_ids[i]]), confidences[i]) for i in indices]
 
     def solution(self, img_stream: bytes, label: str, **kwargs) -> bool:
         """
@@ -183,18 +433,203 @@ class YOLO:
         :param img_stream: image file binary stream
         :param label:
         :param kwargs:
+            - tracer: context manager factory that times the "decode" and "inference" phases,
+              such as `ArmorKernel.span`
         :return:
         """
+        return self.prediction(img_stream, label, **kwargs)[0]
+
+    def prediction(
+        self, img_stream: typing.Union[bytes, np.ndarray], label: str, **kwargs
+    ) -> typing.Tuple[bool, float]:
+        """
+        `solution` along with its confidence
+
+        :param img_stream: image file binary stream, or a decoded BGR tile
+        :param label:
+        :param kwargs: see `solution`
+        :return: (hit, highest confidence of the label among the kept detections)
+        """
         confidence = kwargs.get("confidence", 0.2)
         nms_thresh = kwargs.get("nms_thresh", 0.4)
+        tracer = kwargs.get("tracer") or (lambda phase: nullcontext())
 
-        np_array = np.frombuffer(img_stream, np.uint8)
-        img = cv2.imdecode(np_array, flags=1)
+        with tracer("decode"):
+            img = self.engine.decode(img_stream)
 
         try:
-            labels = self.detect_common_objects(img, confidence, nms_thresh)
-            return bool(label in labels)
+            with tracer("inference"):
+                detections = self.detections(img, confidence, nms_thresh)
         # patch for `ValueError: attempt to get argmax of an empty sequence.`
         # at code `class_id=np.argmax(scores)`
         except ValueError:
-            return False
+            return False, 0.0
+        confs = [conf for name, conf in detections if name == label]
+        return bool(confs), max(confs, default=0.0)
+
+    def solutions(self, img_streams: typing.List[bytes], label: str, **kwargs) -> typing.List[bool]:
+        """Batch version of `solution`, keeps the order of `img_streams`"""
+        return [result for result, _ in self.predictions(img_streams, label, **kwargs)]
+
+    def predictions(
+        self, img_streams: typing.List[typing.Union[bytes, np.ndarray]], label: str, **kwargs
+    ) -> typing.List[typing.Tuple[bool, float]]:
+        """
+        Batch version of `prediction`, keeps the order of `img_streams`
+
+        The tiles go through the network in forward passes of up to `engine.max_batch` tiles,
+        a network that rejects a batch is run tile by tile from then on.
+        """
+        if len(img_streams) < 2 or self._static_batch:
+            return [self.prediction(img_stream, label, **kwargs) for img_stream in img_streams]
+
+        confidence = kwargs.get("confidence", 0.2)
+        nms_thresh = kwargs.get("nms_thresh", 0.4)
+        tracer = kwargs.get("tracer") or (lambda phase: nullcontext())
+
+        with tracer("decode"):
+            imgs = [self.engine.decode(img_stream) for img_stream in img_streams]
+
+        results = []
+        for i in range(0, len(imgs), self.engine.max_batch):
+            chunk = imgs[i : i + self.engine.max_batch]
+            try:
+                with tracer("inference"):
+                    outs = self.forward_batch(chunk)
+            except cv2.error as err:
+                logger.debug(f"Batched forward pass rejected, run tile by tile - {self.flag} {err}")
+                self._static_batch = True
+                return results + [self.prediction(img, label, **kwargs) for img in imgs[i:]]
+            for img, out in zip(chunk, outs):
+                try:
+                    detections = self._postprocess(out[None], img.shape, confidence, nms_thresh)
+                # Same patch as `prediction`
+                except ValueError:
+                    results.append((False, 0.0))
+                    continue
+                confs = [conf for name, conf in detections if name == label]
+                results.append((bool(confs), max(confs, default=0.0)))
+        return results
+
+    def solution_bulk(self, src_dir: str, label: str, **kwargs):
+        """
+        Evaluate every tile under `src_dir` with a pool of warm copies of this model,
+        see `evaluation.solution_bulk` for the options.
+        """
+        factory = partial(YOLO, self.dir_model, self.onnx_prefix, **self.options)
+        yield from solution_bulk(factory, src_dir, label=label, **kwargs)
+
+
+class YOLOCascade:
+    """
+    Confidence-gated cascade of two YOLO models.
+
+    The light model answers first. Only the tiles whose target-class confidence lands
+    in the ambiguous band `[low, high)` are escalated to the heavy model, clear-cut
+    tiles never pay for the large detector.
+    """
+
+    def __init__(
+        self,
+        dir_model: str,
+        light: str = "yolov5n6",
+        heavy: typing.Union[str, "YOLO"] = "yolov5m6",
+        band: typing.Tuple[float, float] = (0.2, 0.6),
+        **kwargs,
+    ):
+        """
+        :param dir_model:
+        :param light: onnx_prefix of the model that answers first, e.g. yolov5n6 or yolov6n
+        :param heavy: onnx_prefix of the model that settles the ambiguous tiles,
+            or an already loaded YOLO model
+        :param band: (low, high), a confidence below `low` is negative, from `high` on positive
+        :param kwargs: options of both YOLO models
+        """
+        self.light = YOLO(dir_model, light, **kwargs)
+        self.heavy = heavy if isinstance(heavy, YOLO) else YOLO(dir_model, heavy, **kwargs)
+        self.band = band
+        self.flag = f"{self.light.flag}>{self.heavy.flag}"
+
+        self._lock = threading.Lock()
+        self.tiles = 0
+        self.escalated = 0
+        # milliseconds spent by the whole cascade / by the heavy model on escalated tiles
+        self.cost_ms = 0.0
+        self.heavy_ms = 0.0
+
+    @property
+    def engine(self) -> BlobEngine:
+        """Tiles are decoded for the heavy model, the larger input of the two"""
+        return self.heavy.engine
+
+    def solution(self, img_stream: bytes, label: str, **kwargs) -> bool:
+        """
+        :param img_stream: image file binary stream
+        :param label:
+        :param kwargs: the options of `YOLO.solution`, "escalate" is traced for escalated tiles
+        :return:
+        """
+        return self.prediction(img_stream, label, **kwargs)[0]
+
+    def prediction(
+        self, img_stream: typing.Union[bytes, np.ndarray], label: str, **kwargs
+    ) -> typing.Tuple[bool, float]:
+        """`solution` along with the confidence of the model that settled the tile"""
+        confidence = kwargs.get("confidence", 0.2)
+        nms_thresh = kwargs.get("nms_thresh", 0.4)
+        tracer = kwargs.get("tracer") or (lambda phase: nullcontext())
+        low, high = self.band
+
+        start = time.perf_counter()
+        with tracer("decode"):
+            # At the resolution the heavy model needs if the tile is escalated
+            img = self.engine.decode(img_stream)
+        try:
+            with tracer("inference"):
+                score = self.light.score(img, label)
+            escalated = low <= score < high
+            result = score >= high
+            if escalated:
+                heavy_start = time.perf_counter()
+                with tracer("escalate"):
+                    detections = self.heavy.detections(img, confidence, nms_thresh)
+                confs = [conf for name, conf in detections if name == label]
+                result, score = bool(confs), max(confs, default=0.0)
+                heavy_ms = (time.perf_counter() - heavy_start) * 1000
+        # Same patch as `YOLO.solution`
+        except ValueError:
+            return False, 0.0
+
+        with self._lock:
+            self.tiles += 1
+            self.cost_ms += (time.perf_counter() - start) * 1000
+            if escalated:
+                self.escalated += 1
+                self.heavy_ms += heavy_ms
+        return bool(result), score
+
+    def solutions(self, img_streams: typing.List[bytes], label: str, **kwargs) -> typing.List[bool]:
+        return [self.solution(img_stream, label, **kwargs) for img_stream in img_streams]
+
+    def predictions(
+        self, img_streams: typing.List[typing.Union[bytes, np.ndarray]], label: str, **kwargs
+    ) -> typing.List[typing.Tuple[bool, float]]:
+        """Tile by tile, unbatched: each tile is escalated on its own light-model score"""
+        return [self.prediction(img_stream, label, **kwargs) for img_stream in img_streams]
+
+    def report(self) -> dict:
+        """
+        Escalation rate and per-tile latency saved, compared with sending every tile
+        to the heavy model (estimated from the escalated tiles)
+        """
+        with self._lock:
+            if not self.tiles:
+                return {"tiles": 0, "escalated": 0, "escalation_rate": None, "saved_ms": None}
+            heavy_avg = self.heavy_ms / self.escalated if self.escalated else None
+            saved = None if heavy_avg is None else heavy_avg - self.cost_ms / self.tiles
+            return {
+                "tiles": self.tiles,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / self.tiles, 4),
+                "saved_ms": None if saved is None else round(saved, 3),
+            }
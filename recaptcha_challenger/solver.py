@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+# Description:
+"""
+Browser-independent core of the visual challenge: prompt and tiles in, tiles to select out.
+
+`VisualChallenger` captures the tiles from the page and clicks what the core selects,
+the same core answers pre-captured challenges from a service or an offline evaluation.
+
+```python
+solver = VisualSolver(dir_model="datas/models")
+verdict = solver.solve("buses", tiles)
+verdict.selected  # indices of the tiles to click
+verdicts = solver.solve_batch([Challenge(prompt, tiles) for prompt, tiles in captured])
+```
+"""
+
+import os
+import threading
+import typing
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from .labels import LabelResolver
+
+# cv2 and numpy are imported with the models, `core` imports this module up front
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+    from .solutions.prefilter import TilePrefilter
+    from .solutions.resnet import BinaryClassifier
+
+# An encoded image (png/jpeg bytes) or a decoded BGR array
+Image = typing.Union[bytes, "np.ndarray"]
+
+
+@dataclass
+class Challenge:
+    prompt: str
+    # One image per tile, or the whole challenge image cut along `grid`
+    tiles: typing.Union[typing.Sequence[Image], Image]
+    # VisualSolver.TASK_OBJECT_DETECTION | VisualSolver.TASK_BINARY_CLASSIFICATION
+    task: typing.Optional[str] = None
+    # (rows, cols) of a whole challenge image, defaults to the layout of the task
+    grid: typing.Optional[typing.Tuple[int, int]] = None
+    lang: typing.Optional[str] = None
+
+
+@dataclass
+class Verdict:
+    prompt: str
+    # Model label of the prompt, empty if the prompt could not be resolved
+    label: str
+    task: typing.Optional[str] = None
+    # Indices of the tiles to select, in tile order
+    selected: typing.List[int] = field(default_factory=list)
+    # Confidence of each tile that it shows the label
+    confidences: typing.List[float] = field(default_factory=list)
+    # Indices of the refreshed tiles that were still fading and should be captured again
+    recapture: typing.List[int] = field(default_factory=list)
+    # Flag of the model that answered
+    model: typing.Optional[str] = None
+
+    @property
+    def resolved(self) -> bool:
+        return bool(self.label)
+
+
+def decode(image: Image) -> "np.ndarray":
+    import cv2
+    import numpy as np
+
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imdecode(np.frombuffer(image, np.uint8), flags=1)
+
+
+def split_grid(image: Image, rows: int, cols: int) -> typing.List["np.ndarray"]:
+    """Cut a challenge image into rows x cols tiles, row by row"""
+    image = decode(image)
+    height, width = image.shape[:2]
+    ys = [round(height * i / rows) for i in range(rows + 1)]
+    xs = [round(width * i / cols) for i in range(cols + 1)]
+    return [image[ys[r] : ys[r + 1], xs[c] : xs[c + 1]] for r in range(rows) for c in range(cols)]
+
+
+class VisualSolver:
+    """
+    Label resolution, model routing and per-tile inference of the visual challenge.
+
+    The models are not thread-safe, use one solver per worker thread or process.
+    """
+
+    TASK_OBJECT_DETECTION = "ObjectDetection"
+    TASK_BINARY_CLASSIFICATION = "BinaryClassification"
+    # Layout of a whole challenge image
+    GRIDS = {TASK_OBJECT_DETECTION: (4, 4), TASK_BINARY_CLASSIFICATION: (3, 3)}
+
+    # Model files already checked against their release by `warm` in this process
+    _pulled: typing.Set[str] = set()
+    _pull_lock = threading.Lock()
+
+    # TODO
+    # crosswalks
+    # stairs
+    # vehicles
+    # tractors
+    # taxis
+    # chimneys
+    # mountains or hills
+    # bridge
+    # cars
+    label_alias = {
+        "zh": {
+            "消防栓": "fire hydrant",
+            "交通灯": "traffic light",
+            "汽车": "car",
+            "自行车": "bicycle",
+            "摩托车": "motorcycle",
+            "公交车": "bus",
+            "船": "boat",
+        },
+        "en": {
+            "a fire hydrant": "fire hydrant",
+            "traffic lights": "traffic light",
+            "car": "car",
+            "bicycles": "bicycle",
+            "motorcycles": "motorcycle",
+            "bus": "bus",
+            "buses": "bus",
+            "cars": "car",
+            "boats": "boat",
+        },
+    }
+
+    def __init__(
+        self,
+        dir_model: str,
+        onnx_prefix: typing.Optional[str] = None,
+        cascade: typing.Optional[bool] = False,
+        cascade_light: typing.Optional[str] = "yolov5n6",
+        cascade_band: typing.Optional[typing.Tuple[float, float]] = (0.2, 0.6),
+        autotune: typing.Optional[bool] = False,
+        label_alias: typing.Optional[typing.Dict[str, typing.Dict[str, str]]] = None,
+        lang: typing.Optional[str] = "en",
+        prefilter: typing.Union[bool, "TilePrefilter", None] = False,
+        pull_on_demand: typing.Optional[bool] = True,
+    ):
+        """
+        :param dir_model:
+        :param onnx_prefix: YOLO model of the labels without a dedicated classifier
+        :param cascade: answer with the light model first and escalate ambiguous tiles
+            to the `onnx_prefix` model, see `yolo.YOLOCascade`
+        :param cascade_light: onnx_prefix of the light model of the cascade
+        :param cascade_band: confidence band of the tiles that are escalated
+        :param autotune: measure the fastest cv2.dnn configuration of each model on first use
+        :param label_alias: lang --> {prompt: model label}, defaults to `VisualSolver.label_alias`
+        :param lang: language of the prompts, tried first when resolving them
+        :param prefilter: settle blank, noisy and fading tiles from their image statistics
+            instead of a forward pass, True for the default thresholds, see `TilePrefilter`.
+            Off by default, validate the thresholds on a corpus first, e.g.
+            `python -m recaptcha_challenger.benchmark --solver --prefilter`
+        :param pull_on_demand: download a routed classifier the first time its label shows up,
+            False answers with YOLO until `warm` has pulled it
+        """
+        from .solutions import yolo
+        from .solutions.kernel import PluggableObjects
+        from .solutions.prefilter import TilePrefilter
+
+        self.dir_model = dir_model
+        self.autotune = autotune
+        self.lang = lang
+        self.pull_on_demand = pull_on_demand
+        label_alias = self.label_alias if label_alias is None else label_alias
+        self.prefilter = TilePrefilter() if prefilter is True else prefilter or None
+
+        self.yolo_model = yolo.YOLO(dir_model, onnx_prefix, autotune=autotune)
+        self.cascade_model = None
+        if cascade:
+            self.cascade_model = yolo.YOLOCascade(
+                dir_model,
+                light=cascade_light,
+                heavy=self.yolo_model,
+                band=cascade_band,
+                autotune=autotune,
+            )
+
+        # label --> onnx_prefix of a dedicated binary classifier, YOLO handles the rest
+        self.objects = PluggableObjects(os.path.join(dir_model, "objects.yaml"))
+        self.routes = self.objects.routing_index(label_alias)
+        # Labels the aliases of the challenger resolve to and that have a dedicated model
+        self.reachable: typing.Set[str] = set(self.routes)
+        objects = self.objects.parse_objects()
+        for model_label in objects:
+            self.routes.setdefault(model_label, model_label)
+        self._classifiers: typing.Dict[str, "BinaryClassifier"] = {}
+        # onnx_prefix of the classifiers that could not be pulled
+        self._unavailable: typing.Set[str] = set()
+
+        # prompt --> model label, compiled once from the aliases and the model classes
+        self.resolver = LabelResolver(label_alias, yolo.YOLO.classes, objects)
+
+    def resolve(self, prompt: str, lang: typing.Optional[str] = None) -> str:
+        """Model label of the prompt, empty if the prompt is unknown"""
+        return self.resolver.resolve(prompt, lang or self.lang) or ""
+
+    def select_model(self, label: str):
+        """
+        Optimizing solutions based on different challenge labels
+
+        Labels routed by objects.yaml are solved by their own small classifier,
+        YOLO remains the fallback for the labels without a dedicated model.
+        """
+        onnx_prefix = self.routes.get(label)
+        if onnx_prefix and onnx_prefix not in self._unavailable:
+            classifier = self._classifier(onnx_prefix)
+            if classifier.net is not None:
+                return classifier
+            # Pull the model on first use, keep falling back to YOLO if it is unavailable
+            if self.pull_on_demand:
+                if classifier.match_net() is not None:
+                    return classifier
+                self._unavailable.add(onnx_prefix)
+        if self.cascade_model is not None:
+            return self.cascade_model
+        return self.yolo_model
+
+    def _classifier(self, onnx_prefix: str) -> "BinaryClassifier":
+        """Classifier of a route, registered from the local file if there is one"""
+        if onnx_prefix not in self._classifiers:
+            from .solutions.resnet import BinaryClassifier
+
+            self._classifiers[onnx_prefix] = BinaryClassifier(
+                onnx_prefix, self.dir_model, autotune=self.autotune
+            )
+        return self._classifiers[onnx_prefix]
+
+    def warm(self, labels: typing.Optional[typing.Iterable[str]] = None) -> typing.Dict[str, bool]:
+        """
+        Pull and load the routed classifiers ahead of the solves, so that no download
+        happens while a challenge is on the screen. A model file is checked against
+        its release once per process, later solvers load it from disk.
+
+        :param labels: model labels to prepare, by default the `reachable` ones,
+            not the other labels of objects.yaml that no prompt of the aliases resolves to
+        :return: onnx_prefix --> the classifier is available
+        """
+        labels = self.reachable if labels is None else labels
+        prefixes = {self.routes[label] for label in labels if label in self.routes}
+        status = {}
+        for onnx_prefix in sorted(prefixes):
+            classifier = self._classifier(onnx_prefix)
+            with VisualSolver._pull_lock:
+                if classifier.path_model not in VisualSolver._pulled:
+                    classifier.pull_model()
+                    if os.path.isfile(classifier.path_model):
+                        VisualSolver._pulled.add(classifier.path_model)
+            available = classifier.net is not None or classifier.register_model() is True
+            if available:
+                self._unavailable.discard(onnx_prefix)
+            status[onnx_prefix] = available
+        return status
+
+    def predict(
+        self,
+        tiles: typing.Sequence[Image],
+        label: str,
+        model=None,
+        refreshed: typing.Optional[bool] = False,
+        **kwargs,
+    ) -> typing.List[typing.Tuple[typing.Optional[bool], float]]:
+        """
+        :param tiles:
+        :param label: model label, see `resolve`
+        :param model: defaults to `select_model(label)`
+        :param refreshed: the tiles replace clicked ones and may still be fading,
+            otherwise a bright, low-contrast tile is an image like any other
+        :param kwargs: options of the model, e.g. `tracer`
+        :return: (hit, confidence) of each tile, hit is None for a tile that is still fading
+        """
+        model = self.select_model(label) if model is None else model
+        if self.prefilter is None:
+            return model.predictions(list(tiles), label, **kwargs)
+
+        tracer = kwargs.get("tracer") or (lambda phase: nullcontext())
+        with tracer("prefilter"):
+            # Decoded once, at the reduced resolution the model allows
+            engine = getattr(model, "engine", None)
+            imgs = [decode(tile) if engine is None else engine.decode(tile) for tile in tiles]
+            checks = [self.prefilter.check(img, refreshed) for img in imgs]
+        # Rejected tiles are negative, fading ones are left undecided
+        results = [(None if check == self.prefilter.FADING else False, 0.0) for check in checks]
+        passed = [i for i, check in enumerate(checks) if check == self.prefilter.PASS]
+        if passed:
+            # The decoded tiles, the model does not decode them a second time
+            predictions = model.predictions([imgs[i] for i in passed], label, **kwargs)
+            for i, result in zip(passed, predictions):
+                results[i] = result
+        return results
+
+    def tiles_of(self, challenge: Challenge) -> typing.List[Image]:
+        """The tiles of a challenge, a whole challenge image is cut along its grid"""
+        # A single image is either encoded or an array with a shape
+        if isinstance(challenge.tiles, bytes) or hasattr(challenge.tiles, "shape"):
+            grid = challenge.grid or self.GRIDS.get(
+                challenge.task, self.GRIDS[self.TASK_BINARY_CLASSIFICATION]
+            )
+            return split_grid(challenge.tiles, *grid)
+        return list(challenge.tiles)
+
+    def solve(
+        self,
+        prompt: str,
+        tiles: typing.Union[typing.Sequence[Image], Image],
+        task: typing.Optional[str] = None,
+        **kwargs,
+    ) -> Verdict:
+        """
+        :param prompt: text of the challenge prompt
+        :param tiles: one image per tile, or the whole challenge image
+        :param task: both tasks are answered tile by tile,
+            the task decides the grid of a whole challenge image
+        :param kwargs: `grid` and `lang` of the challenge, the other options go to the model
+        """
+        grid, lang = kwargs.pop("grid", None), kwargs.pop("lang", None)
+        return self.solve_batch([Challenge(prompt, tiles, task, grid, lang)], **kwargs)[0]
+
+    def solve_batch(self, challenges: typing.Sequence[Challenge], **kwargs) -> typing.List[Verdict]:
+        """
+        Challenges that share a label are answered by one batched call of their model,
+        e.g. one forward pass of a binary classifier for all of their tiles.
+
+        :param challenges:
+        :param kwargs: options of the models
+        :return: one verdict per challenge, in order
+        """
+        verdicts = []
+        # (model flag, label) --> [model, [(verdict, tiles), ...]]
+        groups: typing.Dict[typing.Tuple[str, str], list] = {}
+        for challenge in challenges:
+            label = self.resolve(challenge.prompt, challenge.lang)
+            verdict = Verdict(challenge.prompt, label, challenge.task)
+            verdicts.append(verdict)
+            if not label:
+                continue
+            model = self.select_model(label)
+            verdict.model = model.flag
+            group = groups.setdefault((model.flag, label), [model, []])
+            group[1].append((verdict, self.tiles_of(challenge)))
+
+        for (_, label), (model, members) in groups.items():
+            tiles = [tile for _, member_tiles in members for tile in member_tiles]
+            results = iter(self.predict(tiles, label, model=model, **kwargs))
+            for verdict, member_tiles in members:
+                for index, (hit, confidence) in zip(range(len(member_tiles)), results):
+                    verdict.confidences.append(round(confidence, 4))
+                    if hit:
+                        verdict.selected.append(index)
+                    elif hit is None:
+                        verdict.recapture.append(index)
+        return verdicts
@@ -3,38 +3,149 @@
 # Author     : QIN2DIM
 # Github     : https://github.com/QIN2DIM
 # Description:
+import atexit
+import json
+import random
 import sys
+import threading
+import typing
+import weakref
 
 from loguru import logger
 
+_TEXT_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
 
-def init_log(**sink_path):
-    """Initialize loguru log information"""
+
+# Bound methods called at exit, see `on_exit`
+_exit_hooks: typing.List[weakref.WeakMethod] = []
+_exit_lock = threading.Lock()
+
+
+def _run_exit_hooks():
+    with _exit_lock:
+        hooks = list(_exit_hooks)
+    for ref in hooks:
+        if (method := ref()) is not None:
+            method()
+
+
+def on_exit(method: typing.Callable[[], typing.Any]):
+    """
+    Call a bound method when the interpreter exits, e.g. `on_exit(store.flush)`.
+    Unlike `atexit.register`, the object is only weakly referenced:
+    instances that are dropped before the exit are collected and skipped.
+    """
+    with _exit_lock:
+        if not _exit_hooks:
+            atexit.register(_run_exit_hooks)
+        _exit_hooks[:] = [ref for ref in _exit_hooks if ref() is not None]
+        _exit_hooks.append(weakref.WeakMethod(method))
+
+
+def _fields(record) -> str:
+    """Structured fields bound to the record, rendered as ` - k=v k=v`"""
+    extra = record["extra"]
+    # `ArmorKernel.log` already wrote its fields into the message
+    fields = ""
+    if not extra.get("_inline"):
+        fields = " ".join(f"{k}={v}" for k, v in extra.items() if not k.startswith("_"))
+    record["extra"]["_fields"] = f" - {fields}" if fields else ""
+    return "{extra[_fields]}\n{exception}"
+
+
+def _json_format(record) -> str:
+    """One compact JSON object per line, the structured fields are top-level keys"""
+    payload = {
+        "ts": round(record["time"].timestamp(), 3),
+        "level": record["level"].name,
+        "msg": record["extra"].get("_message", record["message"]),
+    }
+    payload.update((k, v) for k, v in record["extra"].items() if not k.startswith("_"))
+    if record["exception"] is not None:
+        payload["exc"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def _sampler(sampling: typing.Dict[str, float]) -> typing.Callable[[dict], bool]:
+    """
+    Filter that keeps a fraction of the records of each level, e.g. {"DEBUG": 0.1}.
+    The decision is made once per record, so every sink keeps or drops the same records.
+    """
+
+    def keep(record) -> bool:
+        extra = record["extra"]
+        if "_keep" not in extra:
+            rate = sampling.get(record["level"].name, 1.0)
+            extra["_keep"] = rate >= 1 or random.random() < rate
+        return extra["_keep"]
+
+    return keep
+
+
+def init_log(
+    enqueue: bool = False,
+    json_path: typing.Optional[str] = None,
+    sampling: typing.Optional[typing.Dict[str, float]] = None,
+    **sink_path,
+):
+    """
+    Initialize loguru log information
+
+    :param enqueue: hand the formatted records over to a background writer per sink,
+        the I/O no longer runs on the caller's thread, see `logger.add(enqueue=True)`
+    :param json_path: compact JSON-lines sink carrying the structured fields of each record
+    :param sampling: fraction of records kept per level, e.g. {"DEBUG": 0.1},
+        levels that are not listed are kept in full
+    :param sink_path: `error` and `runtime` log files
+    """
     event_logger_format = (
         "<g>{time:YYYY-MM-DD HH:mm:ss}</g> | "
         "<lvl>{level}</lvl> - "
         # "<c><u>{name}</u></c> | "
         "{message}"
     )
+    # Each record reaches every sink once, the writer of a sink only does its I/O
+    options = {"diagnose": False, "enqueue": enqueue}
+    if sampling:
+        options["filter"] = _sampler(sampling)
+
+    # Removing a sink drains its writer first
     logger.remove()
     logger.add(
-        sink=sys.stdout, colorize=True, level="DEBUG", format=event_logger_format, diagnose=False
+        sink=sys.stdout,
+        colorize=True,
+        level="DEBUG",
+        format=lambda record: event_logger_format + _fields(record),
+        **options,
     )
     if sink_path.get("error"):
         logger.add(
             sink=sink_path.get("error"),
             level="ERROR",
+            format=lambda record: _TEXT_FORMAT + _fields(record),
             rotation="1 week",
             encoding="utf8",
-            diagnose=False,
+            **options,
         )
     if sink_path.get("runtime"):
         logger.add(
             sink=sink_path.get("runtime"),
             level="DEBUG",
+            format=lambda record: _TEXT_FORMAT + _fields(record),
+            rotation="20 MB",
+            retention="20 days",
+            encoding="utf8",
+            **options,
+        )
+    if json_path:
+        logger.add(
+            sink=json_path,
+            level="DEBUG",
+            format=_json_format,
             rotation="20 MB",
             retention="20 days",
             encoding="utf8",
-            diagnose=False,
+            **options,
         )
     return logger
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Description: Sampling, failure policy and cap of the screenshot archive
+import gc
+import os
+import time
+import weakref
+
+import pytest
+
+from recaptcha_challenger.archive import ScreenshotArchive, evict
+
+
+def files_of(directory) -> list:
+    return sorted(
+        os.path.relpath(os.path.join(prefix, filename), directory)
+        for prefix, _, filenames in os.walk(directory)
+        for filename in filenames
+    )
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archives = []
+
+    def build(**options) -> ScreenshotArchive:
+        archives.append(ScreenshotArchive(str(tmp_path), **options))
+        return archives[-1]
+
+    yield build
+    for archive_ in archives:
+        archive_.close()
+
+
+def test_unsampled_rounds_capture_nothing(archive, tmp_path):
+    screenshots = archive(sample_rate=0)
+    assert screenshots.begin() is False
+    assert screenshots.stage("round/0.png", b"png") is None
+    screenshots.end(failed=True)
+    screenshots.flush()
+    assert files_of(tmp_path) == []
+
+
+def test_failures_policy_keeps_failed_rounds_only(archive, tmp_path):
+    screenshots = archive(policy=ScreenshotArchive.POLICY_FAILURES)
+    screenshots.begin()
+    screenshots.stage("passed/0.png", b"png")
+    screenshots.end(failed=False)
+    screenshots.begin()
+    path = screenshots.stage("failed/0.png", b"png")
+    screenshots.end(failed=True)
+    screenshots.flush()
+
+    assert path == os.path.join(str(tmp_path), "failed", "0.png")
+    assert files_of(tmp_path) == [os.path.join("failed", "0.png")]
+
+
+def test_cap_evicts_the_oldest_rounds_and_their_directories(archive, tmp_path):
+    screenshots = archive(max_bytes=250)
+    for i in range(5):
+        screenshots.submit(f"{i}_/challenge.png", b"x" * 100)
+        screenshots.flush()
+        # Distinct modification times, oldest first
+        os.utime(tmp_path.joinpath(f"{i}_", "challenge.png"), (time.time() - 10 + i,) * 2)
+
+    assert files_of(tmp_path) == [os.path.join(f"{i}_", "challenge.png") for i in (3, 4)]
+    assert sorted(os.listdir(tmp_path)) == ["3_", "4_"]
+    assert screenshots.written == 5
+
+
+def test_evict_by_age_keeps_the_root(tmp_path):
+    tmp_path.joinpath("old_").mkdir()
+    old = tmp_path.joinpath("old_", "a.png")
+    old.write_bytes(b"x")
+    os.utime(old, (time.time() - 3600,) * 2)
+    tmp_path.joinpath("new.png").write_bytes(b"y")
+
+    report = evict(str(tmp_path), max_age=60, prune=True)
+    assert report == {"removed": 1, "removed_bytes": 1, "files": 1, "bytes": 1}
+    assert os.listdir(tmp_path) == ["new.png"]
+
+
+def test_closed_archive_is_not_pinned_until_exit(tmp_path):
+    screenshots = ScreenshotArchive(str(tmp_path))
+    screenshots.submit("a.png", b"png")
+    screenshots.close()
+    ref = weakref.ref(screenshots)
+    del screenshots
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Description: Sampling of the labeled tile corpus
+from collections import Counter
+
+import cv2
+import numpy as np
+import pytest
+
+from recaptcha_challenger.benchmark import load_corpus, stratify
+from recaptcha_challenger.dataset import TileStore
+
+LABELS = ["bicycle", "bus", "fire_hydrant"]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    for label in LABELS:
+        for verdict in ("yes", "bad"):
+            dir_verdict = tmp_path.joinpath(label, verdict)
+            dir_verdict.mkdir(parents=True)
+            for i in range(10):
+                tile = rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)
+                cv2.imwrite(str(dir_verdict.joinpath(f"{i}.png")), tile)
+    return tmp_path
+
+
+def test_stratify_takes_from_every_stratum():
+    strata = {"a": [1, 2, 3, 4], "b": [5], "c": [6, 7]}
+    assert stratify(strata, 4) == {"a": [1, 2], "b": [5], "c": [6]}
+    assert stratify(strata, None) == strata
+    assert stratify(strata, 100) == strata
+
+
+def test_limited_corpus_covers_every_label_and_verdict(corpus):
+    samples = load_corpus(str(corpus), limit=12)
+    assert len(samples) == 12
+    strata = Counter((sample.label, sample.positive) for sample in samples)
+    assert strata == {(label.replace("_", " "), v): 2 for label in LABELS for v in (True, False)}
+    assert len(load_corpus(str(corpus))) == 60
+
+
+def test_limited_store_covers_every_label_and_verdict(corpus, tmp_path_factory):
+    store = TileStore(str(tmp_path_factory.mktemp("store")))
+    assert store.pack(str(corpus)) == 60
+    samples = load_corpus(store.dir_store, limit=6)
+    assert len({(sample.label, sample.positive) for sample in samples}) == 6
+    assert all(sample.img_stream.shape == (8, 8, 3) for sample in samples)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Description: Deadlines of the end-to-end solve budget
+import time
+
+import pytest
+
+from recaptcha_challenger.budget import Budget
+from recaptcha_challenger.exceptions import ChallengeTimeoutException
+
+
+def test_no_deadline_sets_no_timeout():
+    budget = Budget()
+    assert budget.seconds("label") is None
+    # 0 is Playwright's "no timeout"
+    assert budget.timeout_ms("label") == 0
+    assert budget.seconds("label", cap=5) == 5
+    assert budget.timeout_ms("label", cap=2000) == 2000
+
+
+def test_timeouts_never_outlive_the_deadline():
+    budget = Budget(timeout=1)
+    assert budget.seconds("capture", cap=10) <= 1
+    assert budget.seconds("capture", cap=0.25) == 0.25
+    assert 0 < budget.timeout_ms("capture", cap=5000) <= 1000
+
+
+def test_exhausted_budget_raises_with_its_phase():
+    budget = Budget(timeout=0.05)
+    time.sleep(0.1)
+    assert budget.expired
+    assert budget.remaining == 0
+    with pytest.raises(ChallengeTimeoutException) as exc_info:
+        budget.timeout_ms("click", cap=5000)
+    assert exc_info.value.phase == "click"
+    assert budget.phase == "click"
+
+
+def test_check_records_the_current_phase():
+    budget = Budget(timeout=10)
+    budget.check("verify")
+    assert budget.phase == "verify"
+    assert not budget.expired
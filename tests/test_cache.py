@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Description: Size and age limits of the challenge cache
+import os
+import time
+
+from recaptcha_challenger.cache import CacheJanitor
+from recaptcha_challenger.metrics import MetricsAggregator
+
+
+def write(path, size: int, age: float = 0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (time.time() - age,) * 2)
+
+
+def test_sweep_enforces_age_then_size(tmp_path):
+    write(tmp_path / "visual" / "stale.png", 10, age=7200)
+    write(tmp_path / "visual" / "old.png", 1024 * 1024, age=60)
+    write(tmp_path / "audio" / "new.mp3", 1024 * 1024, age=1)
+    metrics = MetricsAggregator()
+
+    report = CacheJanitor(str(tmp_path), max_mb=1.5, max_age=3600, hooks=[metrics]).sweep()
+
+    assert report["removed"] == 2
+    assert sorted(os.listdir(tmp_path / "visual")) == []
+    assert os.listdir(tmp_path / "audio") == ["new.mp3"]
+    assert metrics.gauges["cache_bytes"] == 1024 * 1024
+    assert metrics.gauges["cache_evicted_files_total"] == 2
+
+
+def test_archive_directories_are_left_to_the_archive(tmp_path):
+    write(tmp_path / "captcha_screenshot" / "1_" / "challenge.png", 10, age=7200)
+    write(tmp_path / "captcha_profile" / "solve.prof", 10, age=7200)
+    write(tmp_path / "visual" / "tile.png", 10, age=7200)
+
+    report = CacheJanitor(str(tmp_path), max_mb=0, max_age=60).sweep()
+
+    assert report["removed"] == 1
+    assert (tmp_path / "captcha_screenshot" / "1_" / "challenge.png").exists()
+    assert (tmp_path / "captcha_profile" / "solve.prof").exists()
+
+
+def test_background_sweeps_stop(tmp_path):
+    write(tmp_path / "visual" / "stale.png", 10, age=7200)
+    janitor = CacheJanitor(str(tmp_path), max_age=60, interval=0.05).start()
+    time.sleep(0.2)
+    janitor.stop()
+    sweeps = janitor.stats["sweeps_total"]
+
+    assert sweeps >= 2
+    assert not (tmp_path / "visual" / "stale.png").exists()
+    time.sleep(0.1)
+    assert janitor.stats["sweeps_total"] == sweeps
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Description: Deduplicated tile shards, verdict upgrades and reads
+import cv2
+import numpy as np
+import pytest
+
+from recaptcha_challenger.dataset import TileStore
+
+
+def tile(value: int, size: int = 8) -> np.ndarray:
+    return np.full((size, size, 3), value, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_tiles_are_read_back_from_their_shards(tmp_path, compress):
+    store = TileStore(str(tmp_path), shard_tiles=2, compress=compress)
+    encoded = cv2.imencode(".png", tile(30, size=5))[1].tobytes()
+
+    assert store.append(tile(10), label="bus", positive=True)
+    assert store.append(tile(20), label="bus", positive=False)
+    assert store.append(encoded, label="car")
+    store.flush()
+
+    reader = TileStore(str(tmp_path), readonly=True)
+    assert len(reader.shards()) == 2 and len(reader) == 3
+    tiles = {key: (img, record) for key, img, record in reader.iter_tiles()}
+    assert [record["label"] for _, record in tiles.values()] == ["bus", "bus", "car"]
+    key = next(key for key, (_, record) in tiles.items() if record["label"] == "car")
+    np.testing.assert_array_equal(reader.read(key), tile(30, size=5))
+    assert [k for k, _, _ in reader.iter_tiles(positive=True)] == [next(iter(tiles))]
+
+
+def test_duplicates_are_not_appended_again(tmp_path):
+    store = TileStore(str(tmp_path))
+    assert store.append(tile(10), label="bus", positive=True)
+    assert not store.append(tile(10), label="bus", positive=True)
+    store.flush()
+
+    reopened = TileStore(str(tmp_path))
+    assert not reopened.append(tile(10), label="bus")
+    assert (store.appended, store.duplicates) == (1, 1)
+    assert reopened.duplicates == 1 and len(reopened) == 1
+
+
+def test_a_verified_verdict_replaces_the_stored_one(tmp_path):
+    store = TileStore(str(tmp_path))
+    store.append(tile(10), label="bus", positive=True, confidence=0.6)
+    # A pending tile is upgraded in place
+    store.append(tile(10), positive=False, verified=True)
+    store.append(tile(20), label="bus", positive=True)
+    store.flush()
+    # A written one through the verdict log
+    store.append(tile(20), label="bus", positive=False, verified=True)
+    store.append(tile(20), label="bus", positive=True)
+    store.flush()
+
+    assert store.upgraded == 2
+    records = [record for _, _, record in TileStore(str(tmp_path), readonly=True).iter_tiles()]
+    assert [(r["label"], r["positive"], r["verified"]) for r in records] == [
+        ("bus", False, True),
+        ("bus", False, True),
+    ]
+    assert "confidence" not in records[0]
+
+
+def test_readonly_store_refuses_appends(tmp_path):
+    with pytest.raises(PermissionError):
+        TileStore(str(tmp_path), readonly=True).append(tile(10))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Description: Prompt normalization, with the plurals of the challenge prompts
+import pytest
+
+from recaptcha_challenger.labels import LabelResolver, normalize, singular
+from recaptcha_challenger.solutions import yolo
+from recaptcha_challenger.solver import VisualSolver
+
+
+@pytest.mark.parametrize(
+    "word, expected",
+    [
+        ("buses", "bus"),
+        ("taxis", "taxi"),
+        ("cars", "car"),
+        ("bicycles", "bicycle"),
+        ("motorcycles", "motorcycle"),
+        ("boats", "boat"),
+        ("bridges", "bridge"),
+        ("chimneys", "chimney"),
+        ("stairs", "stair"),
+        ("hills", "hill"),
+        ("mountains", "mountain"),
+        ("tractors", "tractor"),
+        ("crosswalks", "crosswalk"),
+        ("hydrants", "hydrant"),
+        ("lights", "light"),
+        ("meters", "meter"),
+        ("trees", "tree"),
+        ("horses", "horse"),
+        ("vases", "vase"),
+        ("glasses", "glass"),
+        ("boxes", "box"),
+        ("benches", "bench"),
+        ("bus", "bus"),
+        ("cactus", "cactus"),
+    ],
+)
+def test_singular(word, expected):
+    assert singular(word) == expected
+
+
+@pytest.mark.parametrize(
+    "prompt, expected",
+    [
+        ("Traffic Lights.", "traffic light"),
+        ("a fire hydrant", "fire hydrant"),
+        ("the Parking Meters", "parking meter"),
+        ("palm trees", "palm tree"),
+    ],
+)
+def test_normalize(prompt, expected):
+    assert normalize(prompt) == expected
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return LabelResolver(VisualSolver.label_alias, yolo.YOLO.classes)
+
+
+@pytest.mark.parametrize(
+    "prompt, expected",
+    [
+        ("buses", "bus"),
+        ("Bus", "bus"),
+        ("cars", "car"),
+        ("bicycles", "bicycle"),
+        ("motorcycles", "motorcycle"),
+        ("boats", "boat"),
+        ("traffic lights", "traffic light"),
+        ("fire hydrants", "fire hydrant"),
+        ("a fire hydrant", "fire hydrant"),
+        ("parking meters", "parking meter"),
+        ("horses", "horse"),
+        ("vases", "vase"),
+        ("benches", "bench"),
+        ("wine glasses", "wine glass"),
+        ("公交车", "bus"),
+    ],
+)
+def test_resolve(resolver, prompt, expected):
+    assert resolver.resolve(prompt, lang="en") == expected
+
+
+def test_resolve_tries_the_other_singular():
+    resolver = LabelResolver({"en": {"house": "house", "movie": "movie"}})
+    assert resolver.resolve("houses") == "house"
+    assert resolver.resolve("movies") == "movie"
+    assert resolver.resolve("taxis") is None
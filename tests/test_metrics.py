@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Description: Spans, events and gauges reported to the metrics hooks
+import json
+
+import pytest
+
+from recaptcha_challenger.core import ArmorKernel, ChallengeStyle
+from recaptcha_challenger.metrics import Histogram, MetricsAggregator, Span
+
+
+def test_histogram_percentiles_are_bucket_bounds():
+    hist = Histogram()
+    for value in (0.003, 0.02, 0.02, 0.3, 0.7):
+        hist.observe(value)
+    assert hist.count == 5
+    assert hist.percentile(50) == 0.025
+    assert hist.percentile(100) == 1
+    assert Histogram().percentile(50) is None
+
+
+def test_summary_is_valid_json_with_an_overflow():
+    aggregator = MetricsAggregator()
+    aggregator.on_span(Span(phase="inference", duration=120, style="visual", label="bus"))
+    aggregator.on_gauge("cache_bytes", 1024)
+
+    summary = json.loads(json.dumps(aggregator.summary(), allow_nan=False))
+    spans = summary["visual"]["bus"]["spans"]["inference"]
+    assert spans["p99"] == "+Inf"
+    assert spans["buckets"]["+Inf"] == 1
+    assert summary["gauges"] == {"cache_bytes": 1024}
+
+
+def test_histogram_merges_across_labels():
+    aggregator = MetricsAggregator()
+    aggregator.on_span(Span(phase="click", duration=0.01, style="visual", label="bus"))
+    aggregator.on_span(Span(phase="click", duration=0.2, style="visual", label="car"))
+    aggregator.on_span(Span(phase="click", duration=0.2, style="audio"))
+    assert aggregator.histogram("click").count == 3
+    assert aggregator.histogram("click", style="visual").count == 2
+    assert aggregator.histogram("click", label="car").count == 1
+
+
+@pytest.fixture
+def kernel(tmp_path):
+    aggregator = MetricsAggregator()
+    kernel = ArmorKernel(
+        dir_challenge_cache=str(tmp_path.joinpath("audio")),
+        style=ChallengeStyle.AUDIO,
+        debug=False,
+        hooks=[aggregator],
+    )
+    yield kernel, aggregator
+    kernel.close()
+
+
+def test_kernel_reports_spans_and_events(kernel):
+    kernel, aggregator = kernel
+    with kernel.span("activate"):
+        pass
+    with pytest.raises(RuntimeError), kernel.span("activate"):
+        raise RuntimeError("page closed")
+    kernel.emit("reload")
+
+    assert aggregator.histogram("activate", style="audio").count == 2
+    counters = aggregator.summary()["audio"][""]["counters"]
+    assert counters == {"activate.error": 1, "reload": 1}
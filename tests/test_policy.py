@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Description: Reload-or-attempt decisions of the recorded statistics
+import json
+
+import pytest
+
+from recaptcha_challenger.policy import (
+    ATTEMPT,
+    OBJECT_DETECTION,
+    RELOAD,
+    ReloadPolicy,
+    StatsStore,
+)
+
+CLASSIFICATION = "Classification"
+
+
+def record(store: StatsStore, label: str, attempts: int, successes: int, seconds: float):
+    for i in range(attempts):
+        store.observe(CLASSIFICATION, label)
+        store.record_attempt(CLASSIFICATION, label, i < successes, seconds)
+
+
+@pytest.fixture
+def store():
+    store = StatsStore()
+    for _ in range(10):
+        store.record_reload(1.0)
+    return store
+
+
+def test_untrusted_labels_follow_the_fixed_rule(store):
+    policy = ReloadPolicy(store, min_attempts=5, explore=0)
+    record(store, "bus", attempts=4, successes=0, seconds=30)
+
+    assert policy.decide(CLASSIFICATION, "bus") == ATTEMPT
+    assert policy.decide(OBJECT_DETECTION, "bus") == RELOAD
+    assert policy.decide(CLASSIFICATION, "unknown") == ATTEMPT
+
+
+def test_statistics_decide_trusted_labels(store):
+    policy = ReloadPolicy(store, min_attempts=5, explore=0)
+    record(store, "bus", attempts=20, successes=18, seconds=5)
+    record(store, "stairs", attempts=20, successes=1, seconds=10)
+
+    assert policy.decide(CLASSIFICATION, "bus") == ATTEMPT
+    assert policy.decide(CLASSIFICATION, "stairs") == RELOAD
+
+
+def test_observed_but_never_attempted_falls_back(store):
+    policy = ReloadPolicy(store, min_attempts=0, explore=0)
+    record(store, "bus", attempts=20, successes=18, seconds=5)
+    store.observe(OBJECT_DETECTION, "tractor")
+
+    assert policy.decide(OBJECT_DETECTION, "tractor") == RELOAD
+
+
+def test_exploration_attempts_reloaded_labels(store):
+    record(store, "stairs", attempts=20, successes=1, seconds=10)
+
+    assert ReloadPolicy(store, explore=1).decide(CLASSIFICATION, "stairs") == ATTEMPT
+
+
+def test_estimates_follow_new_observations(store):
+    policy = ReloadPolicy(store, min_attempts=5, explore=0)
+    record(store, "bus", attempts=20, successes=18, seconds=5)
+    record(store, "stairs", attempts=20, successes=6, seconds=3)
+    policy.decide(CLASSIFICATION, "stairs")
+    version = store.version
+
+    for _ in range(200):
+        store.observe(CLASSIFICATION, "bus")
+
+    assert store.version == version + 200
+    policy.decide(CLASSIFICATION, "stairs")
+    assert policy._cache[0] == store.version
+
+
+def test_every_change_is_saved_on_the_interval(tmp_path):
+    path = tmp_path / "_policy.json"
+    store = StatsStore(str(path), save_interval=0)
+
+    store.record_reload(2.0)
+    assert json.loads(path.read_text())["reload"] == {"count": 1, "seconds": 2.0}
+
+    store.observe(CLASSIFICATION, "bus")
+    assert json.loads(path.read_text())["labels"]["Classification|bus"]["seen"] == 1
+    assert StatsStore(str(path)).labels == store.labels
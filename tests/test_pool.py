@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Description: Borrowing and closing the instances of a challenger pool
+import queue
+
+import pytest
+
+from recaptcha_challenger import pool as pool_module
+from recaptcha_challenger.pool import ChallengerPool
+
+
+class FakeChallenger:
+    def __init__(self, style: str, dir_challenge_cache: str, **kwargs):
+        self.kwargs = kwargs
+        self.resets = 0
+        self.closed = False
+
+    def reset(self):
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_challengers(monkeypatch):
+    monkeypatch.setattr(pool_module, "new_challenger", FakeChallenger)
+
+
+def test_instances_are_reused_and_reset():
+    pool = ChallengerPool("visual", "cache", size=2, dir_model="models")
+
+    with pool.acquire() as first:
+        pass
+    with pool.acquire() as second:
+        pass
+
+    assert first is second
+    assert first.resets == 2
+    assert first.kwargs == {"dir_model": "models"}
+
+
+def test_a_full_pool_waits_for_an_idle_instance():
+    pool = ChallengerPool("visual", "cache", size=1).warm()
+
+    with pool.acquire():
+        with pytest.raises(queue.Empty):
+            with pool.acquire(timeout=0.01):
+                pass
+    assert pool._created == 1
+
+
+def test_close_releases_idle_and_borrowed_instances():
+    pool = ChallengerPool("visual", "cache", size=2).warm()
+    idle = list(pool._idle.queue)
+
+    with pool.acquire() as borrowed:
+        pool.close()
+        assert not borrowed.closed
+
+    assert borrowed.closed
+    assert all(challenger.closed for challenger in idle)
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            pass
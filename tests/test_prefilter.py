@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Description: Degenerate tiles settled from their image statistics
+import numpy as np
+import pytest
+
+from recaptcha_challenger.solutions.prefilter import TilePrefilter
+
+
+def gradient() -> np.ndarray:
+    """An ordinary tile: smooth, mid-range gray levels"""
+    ramp = np.tile(np.linspace(40, 200, 100, dtype=np.uint8), (100, 1))
+    return np.dstack([ramp, ramp.T, ramp])
+
+
+def washed_out() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.clip(rng.normal(235, 8, (100, 100, 3)), 0, 255).astype(np.uint8)
+
+
+def noise() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (100, 100, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize(
+    "img, verdict",
+    [
+        (gradient(), TilePrefilter.PASS),
+        (np.full((100, 100, 3), 128, dtype=np.uint8), TilePrefilter.BLANK),
+        (None, TilePrefilter.BLANK),
+        (noise(), TilePrefilter.NOISE),
+        (washed_out(), TilePrefilter.FADING),
+    ],
+)
+def test_check(img, verdict):
+    assert TilePrefilter().check(img) == verdict
+
+
+def test_only_refreshed_tiles_can_be_fading():
+    prefilter = TilePrefilter()
+
+    assert prefilter.check(washed_out(), refreshed=False) == prefilter.PASS
+    assert prefilter.report() == {
+        "tiles": 1,
+        "skipped": 0,
+        "skip_rate": 0.0,
+        "blank": 0,
+        "noise": 0,
+        "fading": 0,
+    }
+
+
+def test_report_counts_the_skipped_forward_passes():
+    prefilter = TilePrefilter()
+    for img in (gradient(), gradient(), noise(), washed_out()):
+        prefilter.check(img)
+
+    report = prefilter.report()
+    assert report["tiles"] == 4 and report["skipped"] == 2 and report["skip_rate"] == 0.5
+    assert report["noise"] == 1 and report["fading"] == 1
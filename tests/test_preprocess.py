@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Description: Buffered blob preparation against cv2.dnn.blobFromImage
+import cv2
+import numpy as np
+import pytest
+
+from recaptcha_challenger.solutions.preprocess import BlobEngine, PreprocessProfile
+
+PROFILES = [
+    PreprocessProfile(input_size=(64, 64)),
+    PreprocessProfile(input_size=(96, 64), letterbox=True),
+    PreprocessProfile(input_size=(64, 64), mean=(104, 117, 123), scale=1.0, swap_rb=False),
+    PreprocessProfile(input_size=(64, 48), mean=(0.5, 0.4, 0.3), scale=0.017),
+]
+
+
+def tiles():
+    rng = np.random.default_rng(0)
+    return [
+        rng.integers(0, 256, (131, 97, 3), dtype=np.uint8),
+        rng.integers(0, 256, (100, 100, 3), dtype=np.uint8),
+    ]
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_blobs_match_blob_from_image(profile):
+    imgs = tiles()
+    expected = np.concatenate(
+        [
+            cv2.dnn.blobFromImage(
+                profile.resize(img),
+                profile.scale,
+                profile.input_size,
+                profile.mean,
+                profile.swap_rb,
+            )
+            for img in imgs
+        ]
+    )
+
+    blob = BlobEngine(profile, max_batch=1).blobs(imgs)
+
+    assert blob.shape == expected.shape and blob.dtype == np.float32
+    np.testing.assert_allclose(blob, expected, rtol=1e-6, atol=1e-4)
+    np.testing.assert_allclose(BlobEngine(profile).blob(imgs[0]), profile.blob(imgs[0]), atol=1e-4)
+
+
+def test_buffers_are_reused_per_thread():
+    engine = BlobEngine(PROFILES[0], max_batch=4)
+    first = engine.blobs(tiles())
+
+    assert engine.blobs(tiles()[:1]).base is first.base
+
+
+def test_decode_at_a_reduced_resolution_that_covers_the_input():
+    engine = BlobEngine(PreprocessProfile(input_size=(64, 64)))
+    stream = cv2.imencode(".png", np.zeros((300, 300, 3), dtype=np.uint8))[1].tobytes()
+
+    assert engine.decode(stream).shape == (75, 75, 3)
+    # Not a PNG, the header size is unknown
+    stream = cv2.imencode(".jpg", np.zeros((300, 300, 3), dtype=np.uint8))[1].tobytes()
+    assert engine.decode(stream).shape == (300, 300, 3)
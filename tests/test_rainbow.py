@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Description: Chunked, incremental sync of the rainbow table
+import hashlib
+import json
+
+import pytest
+import yaml
+
+from recaptcha_challenger.solutions import kernel
+from recaptcha_challenger.solutions.kernel import Rainbow
+
+TILE = b"tile"
+MD5 = hashlib.md5(TILE).hexdigest()
+
+
+class Release:
+    """The assets of a release, served by a fake `_request_asset`"""
+
+    def __init__(self):
+        self.assets = {}
+        self.files = {}
+        self.downloads = []
+
+    def publish(self, name: str, data: bytes, node_id: str = "v1"):
+        url = f"https://github.com/releases/{name}"
+        self.files[url] = data
+        self.assets[name] = {
+            "name": name,
+            "size": len(data),
+            "node_id": node_id,
+            "browser_download_url": url,
+        }
+
+    def publish_chunks(self, chunks: dict, node_id: str):
+        """Chunk files served with their own formatting, and their manifest"""
+        entries = {}
+        for key, chunk in chunks.items():
+            data = f"# {key}\n{yaml.safe_dump(chunk, sort_keys=False)}".encode("utf8")
+            self.publish(f"rainbow.{key}.yaml", data, node_id)
+            entries[key] = {"name": f"rainbow.{key}.yaml", "digest": Rainbow.digest(data)}
+        manifest = json.dumps({"version": node_id, "chunks": entries}).encode("utf8")
+        self.publish(Rainbow.FN_MANIFEST, manifest, node_id)
+        self.publish("rainbow.yaml", b"{}", node_id)
+
+    def request_asset(self, url: str, path: str, fn_tag: str, **kwargs):
+        self.downloads.append(fn_tag)
+        with open(path, "wb") as file:
+            file.write(self.files[url])
+
+
+@pytest.fixture
+def release(monkeypatch):
+    release = Release()
+    monkeypatch.setattr(kernel.Assets, "_fn2assets", release.assets)
+    monkeypatch.setattr(Rainbow, "_pull", lambda self, skip_preload=False: self._fn2assets)
+    monkeypatch.setattr(Rainbow, "_tables", {})
+    monkeypatch.setattr(Rainbow, "_sync_threads", {})
+    monkeypatch.setattr(kernel, "_request_asset", release.request_asset)
+    return release
+
+
+def new_rainbow(tmp_path, name: str = "models") -> Rainbow:
+    return Rainbow(dir_assets=str(tmp_path / name / "_assets"))
+
+
+def test_only_changed_chunks_are_downloaded(tmp_path, release):
+    release.publish_chunks({"bus": {"yes": {MD5: 1}}, "car": {"bad": {MD5: 1}}}, "v1")
+    rainbow = new_rainbow(tmp_path)
+
+    assert rainbow.sync() is None
+    assert release.downloads == [
+        Rainbow.FN_MANIFEST,
+        "rainbow.bus.yaml",
+        "rainbow.car.yaml",
+    ]
+    assert rainbow.match(TILE, "bus") is True
+    assert rainbow.match(TILE, "car") is False
+    # Stored as served, the manifest digests are those of the release
+    served = release.files[release.assets["rainbow.bus.yaml"]["browser_download_url"]]
+    assert (tmp_path / "models" / "_rainbow" / "bus.yaml").read_bytes() == served
+
+    release.downloads.clear()
+    rainbow.sync()
+    assert release.downloads == []
+
+    release.publish_chunks({"bus": {"yes": {MD5: 1}}, "car": {"yes": {MD5: 1}}}, "v2")
+    rainbow.sync()
+    assert release.downloads == [Rainbow.FN_MANIFEST, "rainbow.car.yaml"]
+    assert rainbow.match(TILE, "car") is True
+
+
+def test_a_corrupted_chunk_is_retried_by_the_next_sync(tmp_path, release):
+    release.publish_chunks({"bus": {"yes": {MD5: 1}}, "car": {"bad": {MD5: 1}}}, "v1")
+    car = release.assets["rainbow.car.yaml"]["browser_download_url"]
+    release.files[car] = b"truncated"
+    rainbow = new_rainbow(tmp_path)
+
+    rainbow.sync()
+    assert rainbow.match(TILE, "bus") is True
+    assert rainbow.match(TILE, "car") is None
+
+    release.publish_chunks({"bus": {"yes": {MD5: 1}}, "car": {"bad": {MD5: 1}}}, "v1")
+    release.downloads.clear()
+    rainbow.sync()
+    assert release.downloads == [Rainbow.FN_MANIFEST, "rainbow.car.yaml"]
+    assert rainbow.match(TILE, "car") is False
+
+
+def test_a_full_table_is_diffed_locally(tmp_path, release):
+    table = {"bus": {"yes": {MD5: 1}}, "car": {"bad": {MD5: 1}}}
+    release.publish("rainbow.yaml", yaml.safe_dump(table).encode("utf8"), "v1")
+    rainbow = new_rainbow(tmp_path)
+    rainbow.sync()
+    assert rainbow.match(TILE, "car") is False
+
+    del table["car"]
+    release.publish("rainbow.yaml", yaml.safe_dump(table).encode("utf8"), "v2")
+    rainbow.sync()
+    assert rainbow.match(TILE, "car") is None
+    assert not (tmp_path / "models" / "_rainbow" / "car.yaml").exists()
+    # A new instance of the same store loads it from disk
+    Rainbow._tables.clear()
+    assert new_rainbow(tmp_path).match(TILE, "bus") is True
+
+
+def test_each_store_has_its_own_table(tmp_path, release):
+    release.publish_chunks({"bus": {"yes": {MD5: 1}}}, "v1")
+    synced, other = new_rainbow(tmp_path, "a"), new_rainbow(tmp_path, "b")
+
+    synced.sync(background=True)
+    assert synced.wait_sync(timeout=5)
+    assert synced.match(TILE, "bus") is True
+    assert other.match(TILE, "bus") is None
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Description: Settings without import side effects, directories created on first use
+import os
+import subprocess
+import sys
+
+from recaptcha_challenger.core import new_challenger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_creates_nothing(tmp_path):
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    subprocess.run(
+        [sys.executable, "-c", "import recaptcha_challenger.settings"],
+        cwd=tmp_path,
+        env=env,
+        check=True,
+    )
+    assert not os.listdir(tmp_path)
+
+
+def test_new_challenger_creates_the_cache_dir(tmp_path):
+    dir_challenge_cache = tmp_path.joinpath("datas", "temp_cache")
+    challenger = new_challenger(
+        "visual",
+        str(dir_challenge_cache),
+        dir_model=str(tmp_path.joinpath("datas", "models")),
+        debug=False,
+        warm_models=False,
+    )
+    try:
+        assert dir_challenge_cache.joinpath("visual").is_dir()
+    finally:
+        challenger.close()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Description: Browser-independent core of the visual challenge
+import numpy as np
+import pytest
+import yaml
+
+from recaptcha_challenger.solutions.resnet import BinaryClassifier
+from recaptcha_challenger.solver import Challenge, VisualSolver
+
+OBJECTS = {"label_alias": {"bus": {"en": ["buses"]}, "seaplane": {"en": ["seaplanes"]}}}
+
+
+@pytest.fixture
+def dir_model(tmp_path):
+    tmp_path.joinpath("objects.yaml").write_text(yaml.safe_dump(OBJECTS), encoding="utf8")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def pulls(monkeypatch):
+    """onnx_prefix of every classifier that went to the network"""
+    pulled = []
+    monkeypatch.setattr(VisualSolver, "_pulled", set())
+    monkeypatch.setattr(BinaryClassifier, "pull_model", lambda self: pulled.append(self.fn))
+    return pulled
+
+
+def test_warm_pulls_the_reachable_routes_only(dir_model, pulls):
+    solver = VisualSolver(dir_model)
+    # seaplane is routed for hCaptcha prompts, no alias of the challenger resolves to it
+    assert solver.routes == {"bus": "bus", "seaplane": "seaplane"}
+    assert solver.reachable == {"bus"}
+
+    assert solver.warm() == {"bus": False}
+    assert pulls == ["bus.onnx"]
+
+
+def test_unavailable_classifier_falls_back_to_yolo(dir_model, pulls):
+    solver = VisualSolver(dir_model, pull_on_demand=False)
+    solver.warm()
+    assert solver.select_model("bus") is solver.yolo_model
+    # Never pulled during a solve
+    assert pulls == ["bus.onnx"]
+
+
+def test_model_is_checked_once_per_process(dir_model, monkeypatch):
+    pulled = []
+
+    def pull_model(self):
+        pulled.append(self.fn)
+        with open(self.path_model, "wb") as file:
+            file.write(b"not an onnx model")
+
+    monkeypatch.setattr(VisualSolver, "_pulled", set())
+    monkeypatch.setattr(BinaryClassifier, "pull_model", pull_model)
+    VisualSolver(dir_model).warm()
+    VisualSolver(dir_model).warm()
+    assert pulled == ["bus.onnx"]
+
+
+class BrightTiles:
+    """Selects the bright tiles, records each batch it is called with"""
+
+    flag = "bright"
+
+    def __init__(self):
+        self.batches = []
+
+    def predictions(self, tiles, label, **kwargs):
+        self.batches.append(len(tiles))
+        return [(tile.mean() > 127, round(tile.mean() / 255, 4)) for tile in tiles]
+
+
+@pytest.fixture
+def solver(dir_model, monkeypatch):
+    solver = VisualSolver(dir_model)
+    model = BrightTiles()
+    monkeypatch.setattr(solver, "select_model", lambda label: model)
+    return solver
+
+
+def tile(value: int):
+    return np.full((100, 100, 3), value, dtype=np.uint8)
+
+
+def test_solve_selects_the_hits_of_the_model(solver):
+    verdict = solver.solve("buses", [tile(0), tile(255), tile(200)])
+
+    assert verdict.label == "bus"
+    assert verdict.model == "bright"
+    assert verdict.selected == [1, 2]
+    assert verdict.confidences == [0.0, 1.0, round(200 / 255, 4)]
+
+
+def test_solve_cuts_a_whole_image_along_the_grid_of_the_task(solver):
+    image = np.zeros((300, 400, 3), dtype=np.uint8)
+    # Second row, last column of a 3x4 grid
+    image[100:200, 300:400] = 255
+
+    verdict = solver.solve("buses", image, grid=(3, 4))
+    assert len(verdict.confidences) == 12
+    assert verdict.selected == [7]
+
+    image = np.zeros((400, 400, 3), dtype=np.uint8)
+    image[:100, :100] = 255
+    verdict = solver.solve("buses", image, task=VisualSolver.TASK_OBJECT_DETECTION)
+    assert len(verdict.confidences) == 16
+    assert verdict.selected == [0]
+
+
+def test_unknown_prompts_are_not_answered(solver):
+    verdict = solver.solve("unicorns", [tile(255)])
+
+    assert not verdict.resolved
+    assert verdict.selected == [] and verdict.model is None
+
+
+def test_challenges_of_a_label_share_one_batch(solver):
+    model = solver.select_model("bus")
+    verdicts = solver.solve_batch(
+        [
+            Challenge("buses", [tile(255), tile(0)]),
+            Challenge("bus", [tile(0), tile(255), tile(255)]),
+        ]
+    )
+
+    assert model.batches == [5]
+    assert [verdict.selected for verdict in verdicts] == [[0], [1, 2]]
+
+
+def test_prefilter_settles_tiles_before_the_model(dir_model, monkeypatch):
+    solver = VisualSolver(dir_model, prefilter=True)
+    model = BrightTiles()
+    monkeypatch.setattr(solver, "select_model", lambda label: model)
+    ramp = np.tile(np.linspace(150, 255, 100, dtype=np.uint8), (100, 1))
+    washed_out = np.clip(np.random.default_rng(0).normal(235, 8, (100, 100, 3)), 0, 255)
+    tiles = [tile(128), np.dstack([ramp] * 3), washed_out.astype(np.uint8)]
+
+    results = solver.predict(tiles, "bus", refreshed=True)
+    assert [hit for hit, _ in results] == [False, True, None]
+    hit, _ = solver.predict(tiles, "bus")[2]
+    assert hit
+    assert model.batches == [1, 2]
+    assert solver.prefilter.report()["fading"] == 1
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Description: Log sinks of `init_log`
+import json
+import sys
+
+import pytest
+from loguru import logger
+
+from recaptcha_challenger.utils import init_log
+
+
+@pytest.fixture
+def sinks(tmp_path):
+    yield tmp_path
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+@pytest.mark.parametrize("enqueue", [False, True])
+def test_every_sink_gets_each_record_once(sinks, enqueue):
+    path_json = sinks.joinpath("events.jsonl")
+    init_log(enqueue=enqueue, json_path=str(path_json), runtime=str(sinks.joinpath("runtime.log")))
+    received = []
+    logger.add(lambda message: received.append(message.record["message"]), level="DEBUG")
+
+    logger.bind(label="bus").debug("Solve finished")
+    logger.complete()
+    logger.remove()
+
+    assert received == ["Solve finished"]
+    events = [json.loads(line) for line in path_json.read_text(encoding="utf8").splitlines()]
+    assert [(e["msg"], e["label"]) for e in events] == [("Solve finished", "bus")]
+    runtime = sinks.joinpath("runtime.log").read_text(encoding="utf8")
+    assert runtime.count("Solve finished - label=bus") == 1
+
+
+def test_sampling_keeps_the_same_records_in_every_sink(sinks):
+    path_json = sinks.joinpath("events.jsonl")
+    init_log(
+        json_path=str(path_json),
+        runtime=str(sinks.joinpath("runtime.log")),
+        sampling={"DEBUG": 0.0},
+    )
+    logger.debug("dropped")
+    logger.info("kept")
+    logger.remove()
+
+    events = [json.loads(line)["msg"] for line in path_json.read_text(encoding="utf8").splitlines()]
+    assert events == ["kept"]
+    assert "dropped" not in sinks.joinpath("runtime.log").read_text(encoding="utf8")
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Description: Raced DOM waits of the visual state machine, against a local stand-in of the widget
+import time
+from pathlib import Path
+
+import pytest
+
+sync_api = pytest.importorskip("playwright.sync_api")
+
+from recaptcha_challenger.budget import Budget  # noqa: E402
+from recaptcha_challenger.core import VisualChallenger  # noqa: E402
+from recaptcha_challenger.exceptions import ChallengeTimeoutException  # noqa: E402
+
+STAND_IN = Path(__file__).parent.joinpath("stand_in", "index.html").as_uri()
+
+# The sleeps the raced waits replaced: two serial 1s waits before a success was reported
+LEGACY_SUCCESS_SECONDS = 2.0
+
+
+@pytest.fixture(scope="module")
+def browser():
+    with sync_api.sync_playwright() as playwright:
+        try:
+            browser = playwright.chromium.launch()
+        except sync_api.Error as err:
+            pytest.skip(f"Chromium is not available - {err}")
+        yield browser
+        browser.close()
+
+
+@pytest.fixture
+def page(browser):
+    page = browser.new_page()
+    page.goto(STAND_IN)
+    page.frame_locator("//iframe[contains(@src,'bframe')]").locator(
+        "//td[@aria-label]"
+    ).first.wait_for()
+    yield page
+    page.close()
+
+
+@pytest.fixture
+def challenger(tmp_path):
+    # The real constructor, on an empty model directory: warm-up, policy store and all
+    dir_challenge_cache = tmp_path.joinpath("_challenge", "visual")
+    dir_challenge_cache.mkdir(parents=True)
+    challenger = VisualChallenger(
+        dir_challenge_cache=str(dir_challenge_cache),
+        dir_model=str(tmp_path.joinpath("models")),
+        debug=False,
+        verify_timeout=3000,
+        reload_timeout=3000,
+    )
+    yield challenger
+    challenger.close()
+
+
+def frame(page, name: str):
+    return next(f for f in page.frames if f.url.endswith(f"/{name}.html"))
+
+
+def after(page, name: str, delay: int, script: str):
+    """Run `script` in a frame of the stand-in `delay` ms from now"""
+    frame(page, name).evaluate(f"setTimeout(() => {{ {script} }}, {delay})")
+
+
+def test_success_is_reported_as_soon_as_the_checkbox_is_checked(page, challenger):
+    challenger.grid = challenger.get_grid(page)
+    after(page, "anchor", 200, "check()")
+
+    start = time.perf_counter()
+    outcome = challenger.check_accessible_status(page)
+    elapsed = time.perf_counter() - start
+
+    assert outcome == challenger.CHALLENGE_SUCCESS
+    assert elapsed < LEGACY_SUCCESS_SECONDS / 2
+
+
+@pytest.mark.parametrize(
+    "selector, text",
+    [
+        (VisualChallenger.PROMPT_SELECT_MORE, "Please select all matching images."),
+        (VisualChallenger.PROMPT_DYNAMIC_MORE, "Please also check the new images."),
+        (VisualChallenger.PROMPT_INCORRECT, "Please try again."),
+    ],
+)
+def test_error_prompt_wins_the_race(page, challenger, selector, text):
+    challenger.grid = challenger.get_grid(page)
+    after(page, "bframe", 300, f"show('{selector}')")
+
+    start = time.perf_counter()
+    outcome = challenger.check_accessible_status(page)
+    elapsed = time.perf_counter() - start
+
+    assert outcome.strip() == text
+    assert elapsed < challenger.verify_timeout / 1000 / 2
+
+
+def test_new_round_continues(page, challenger):
+    challenger.grid = challenger.get_grid(page)
+    after(page, "bframe", 200, "newRound('payload-2.jpg', 4)")
+
+    assert challenger.check_accessible_status(page) == challenger.CHALLENGE_CONTINUE
+
+
+def test_refreshed_tile_is_not_a_new_round(page, challenger):
+    challenger.verify_timeout = 800
+    challenger.grid = challenger.get_grid(page)
+    after(page, "bframe", 100, "refreshTile(0, 'tile-0.jpg')")
+
+    # Nothing else happens, the deadline falls back to success
+    assert challenger.check_accessible_status(page) == challenger.CHALLENGE_SUCCESS
+
+
+def test_exhausted_budget_is_not_a_success(page, challenger):
+    challenger.reset(Budget(0.5))
+    challenger.grid = challenger.get_grid(page)
+
+    with pytest.raises(ChallengeTimeoutException):
+        challenger.check_accessible_status(page)
+
+
+def test_wait_for_any_returns_none_at_the_deadline(page, challenger):
+    start = time.perf_counter()
+    assert challenger.wait_for_any(page, {"never": lambda: False}, timeout=300) is None
+    assert 0.3 <= time.perf_counter() - start < 1.0